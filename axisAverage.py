@@ -11,16 +11,18 @@ def axisAverage(q, z=None, h=None, area=None, mask=None, axis=-1):
   z and h are exlcusive arguments but one or the other must be provided.
 
   The default axis to average is the last axis.
+
+  The sums are accumulated in double precision so that q, z or h may be single precision (float32).
   """
 
   # Reconcile absence of either z or h since we will need both
-  if not z==None:
-    if not h==None: raise Exception('Both z and h have been provided. Only one of h or z is required.')
+  if z is not None:
+    if h is not None: raise Exception('Both z and h have been provided. Only one of h or z is required.')
     if len(z.shape)<3: raise Exception('The interface heights, z, must be at leeast 3-dimensional')
     h = - np.diff(z, n=1, axis=-3)
     if q.shape != h.shape: raise Exception('z must have one extra level than q but otherwise have the same shape')
   else:
-    if h==None: raise Exception('Neither z nor h have been provided. One of h or z is required.')
+    if h is None: raise Exception('Neither z nor h have been provided. One of h or z is required.')
     if len(h.shape)<3: raise Exception('The level thicknesses, h, must be at leeast 3-dimensional')
     if q.shape != h.shape: raise Exception('q and h must have the same shape')
     z = - np.cumsum(h, axis=-3)
@@ -31,9 +33,9 @@ def axisAverage(q, z=None, h=None, area=None, mask=None, axis=-1):
 
   qShape = list(q.shape)
 
-  if area==None: weight2d = np.ones((qShape[-2:]))
-  else: weight2d = area
-  if not mask==None: weight2d = weight2d * mask
+  if area is None: weight2d = np.ones((qShape[-2:]))
+  else: weight2d = np.asarray(area, dtype=np.float64)
+  if mask is not None: weight2d = weight2d * mask
   nk = qShape[-3]
   hShape = list(h.shape)
   zShape = list(z.shape)
@@ -49,10 +51,11 @@ def axisAverage(q, z=None, h=None, area=None, mask=None, axis=-1):
   zOut = np.zeros( zShape )
   #zOut[0,:] = np.sum(weight2d*z[0,:,:], axis=axis) / np.sum(weight2d, axis=axis)
   for k in range(nk):
-    sumW = np.sum(weight2d*h[k,:,:], axis=axis)
-    sumQ = np.sum(weight2d*h[k,:,:]*q[k,:,:], axis=axis)
-    sumH = np.sum(weight2d*h[k,:,:]*h[k,:,:], axis=axis)
-    sumZ = np.sum(weight2d*h[k,:,:]*zc[k,:,:], axis=axis)
+    wh = weight2d*h[k,:,:] # Double precision since weight2d is
+    sumW = np.sum(wh, axis=axis)
+    sumQ = np.sum(wh*q[k,:,:], axis=axis)
+    sumH = np.sum(wh*h[k,:,:], axis=axis)
+    sumZ = np.sum(wh*zc[k,:,:], axis=axis)
     hOut[k,:] = sumH/sumW
     qOut[k,:] = sumQ/sumW
     zcOut[k,:] = sumZ/sumW
@@ -77,3 +80,7 @@ if __name__ == '__main__':
   print('qOut=',qOut)
   print('hOut=',hOut)
   print('zOut=',zOut)
+
+  # Single precision input gives the double precision result to within rounding
+  qOut32, zOut32, hOut32 = axisAverage(q.astype(np.float32), z.astype(np.float32), axis=-2)
+  print('float32 max difference: q', np.abs(qOut32-qOut).max(), 'z', np.abs(zOut32-zOut).max(), '(expect < 1e-6)')
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+"""
+Times the main stages of pyGVtools on a synthetic MOM6-like dataset (see synthetic.py) and records the
+results as JSON so that runs on different commits can be compared.
+"""
+
+import os
+import sys
+import json
+import time
+import timeit
+import platform
+import argparse
+import tempfile
+import subprocess
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+
+repository = os.path.dirname( os.path.dirname( os.path.abspath(__file__) ) )
+sys.path.insert(0, repository)
+import gplot
+import m6toolbox
+import meshtools
+import synthetic
+
+
+def parseCommandLine():
+  """
+  Parse the command line positional and optional arguments.
+  This is the highest level procedure invoked from the very end of the script.
+  """
+
+  parser = argparse.ArgumentParser(description=
+      '''
+      bench.py generates (or reuses) a synthetic MOM6-like dataset and times reading, rendering,
+      animation and the numerical kernels of pyGVtools, writing the timings to a JSON file.
+      With --compare, bench.py instead prints the ratios of the timings in two JSON files.
+      ''',
+      epilog='Written by the pyGVtools developers.')
+  parser.add_argument('--size', type=str, default='small', choices=sorted(synthetic.sizes.keys()),
+      help='Standard configuration of the synthetic dataset, which the other options override.')
+  parser.add_argument('--ni', type=int, help='Number of cells in the i-direction.')
+  parser.add_argument('--nj', type=int, help='Number of cells in the j-direction.')
+  parser.add_argument('--nk', type=int, help='Number of layers.')
+  parser.add_argument('--nt', type=int, help='Number of records in each time-series file.')
+  parser.add_argument('--nfiles', type=int, help='Number of time-series files.')
+  parser.add_argument('--repeat', type=int, default=3,
+      help='Number of times each benchmark is timed. The minimum and median are recorded.')
+  parser.add_argument('--only', type=str, nargs='+',
+      help='Run only the benchmarks whose names start with one of these prefixes.')
+  parser.add_argument('--workdir', type=str, default=os.path.join(tempfile.gettempdir(), 'pyGVtools-bench'),
+      help='Directory for the synthetic data, which is reused between runs with the same parameters.')
+  parser.add_argument('-o', '--output', type=str,
+      help='JSON file for the results. The default is bench-COMMIT-SIZE.json in the current directory.')
+  parser.add_argument('--compare', type=str, nargs=2, metavar=('BEFORE', 'AFTER'),
+      help='Compare two JSON result files instead of running the benchmarks.')
+  args = parser.parse_args()
+
+  if args.compare:
+    compareResults(*args.compare)
+    return
+
+  ni, nj, nk, nt, nFiles = synthetic.sizes[args.size]
+  parameters = {'ni': args.ni or ni, 'nj': args.nj or nj, 'nk': args.nk or nk, 'nt': args.nt or nt,
+                'nFiles': args.nfiles or nFiles}
+  directory = os.path.join(args.workdir, '%(ni)ix%(nj)ix%(nk)i-%(nt)ix%(nFiles)i'%parameters)
+  print('Writing or reusing the synthetic dataset in',directory)
+  files = synthetic.makeDataset(directory, **parameters)
+  os.environ.setdefault('PYGVTOOLS_CACHE', os.path.join(directory, 'cache'))
+
+  results = runBenchmarks(files, parameters, args.repeat, args.only, directory)
+  commit = gitCommit()
+  record = {'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'parameters': parameters,
+            'python': platform.python_version(), 'numpy': np.__version__, 'matplotlib': matplotlib.__version__,
+            'machine': platform.machine(), 'processor': platform.processor(), 'results': results}
+  output = args.output or 'bench-%s-%s.json'%(commit or 'unknown', args.size)
+  with open(output, 'w') as f: json.dump(record, f, indent=1, sort_keys=True)
+  print('Wrote',output)
+
+
+def benchmarks(files, parameters, directory):
+  """
+  Returns a list of (name, function, count) where function() is the work to time and count is the number
+  of items (e.g. frames) it processes, for reporting a rate, or None
+  """
+  nk, nt, nFiles = parameters['nk'], parameters['nt'], parameters['nFiles']
+  frames = nt * nFiles
+  fileName = files['nc4'][0]
+  png = os.path.join(directory, 'frame.png')
+  b = []
+
+  # Reading the meta-data and a 2D slice of each storage variant, and a record of the multi-file aggregation
+  for variant in sorted(synthetic.variants.keys()):
+    def read(variant=variant):
+      rg, var = gplot.readVariableFromFile(files[variant][0], 'temp', ['1', '1', ':', ':'])
+      var.getData(); rg.close()
+    b.append( ('readVariableFromFile/'+variant, read, None) )
+  multiFile = os.path.join(os.path.dirname(files['nc3'][0]), 'ocean_*.nc') # MFDataset needs netCDF3 or classic
+  def readMultiFile():
+    rg, var = gplot.readVariableFromFile(multiFile, 'temp', [str(frames), '1', ':', ':'])
+    var.getData(); rg.close()
+  b.append( ('readVariableFromFile/multifile', readMultiFile, None) )
+
+  # Reading the arguments of a function concurrently (only done for memory mapped variables) or serially
+  for variant in ('nc3', 'zlib'):
+    if not variant in files: continue
+    for threaded in (True, False):
+      def readFunction(variant=variant, threaded=threaded):
+        default = gplot.threadedReads
+        gplot.enableThreadedReads(threaded)
+        try:
+          rg, var = gplot.readVariableFromFile(files[variant][0], 'sigma2(salt,temp)', ['1', ':', ':', ':'])
+          var.getData(); rg.close()
+        finally: gplot.enableThreadedReads(default)
+      b.append( ('function/%s/%s'%(variant, 'threads' if threaded else 'serial'), readFunction, None) )
+
+  # Rendering to the Agg backend, including reading and saving the image
+  def plot(*options):
+    def run():
+      sys.argv = ['gplot.py'] + list(options) + ['-o', png]
+      gplot.parseCommandLine()
+      gplot.plt.close('all')
+    return run
+  b.append( ('render/indices', plot(fileName+',temp,1,1', '--indices'), None) )
+  b.append( ('render/supergrid', plot(fileName+',temp,1,1', '--supergrid', files['supergrid']), None) )
+  b.append( ('render/raster', plot(fileName+',temp,1,1', '--supergrid', files['supergrid'], '--raster'), None) )
+  b.append( ('render/section', plot(fileName+',temp,1,:,:,=-30', '--elevation', fileName+',e'), None) )
+  frameNames = os.path.join(directory, 'frame.%4.4i.png')
+  def animate():
+    sys.argv = ['gplot.py', multiFile+',SSH,:', '--animate', '-o', frameNames]
+    gplot.parseCommandLine()
+    gplot.plt.close('all')
+  b.append( ('animate', animate, frames) )
+
+  # Numerical kernels on data from the files
+  rg = gplot.Dataset(fileName)
+  temp = rg.variables['temp'][0]; salt = rg.variables['salt'][0]; e = rg.variables['e'][0]
+  rg.close()
+  rg = gplot.Dataset(files['supergrid'])
+  xMesh = rg.variables['x'][::2,::2]; yMesh = rg.variables['y'][::2,::2]
+  rg.close()
+  j = temp.shape[-2]//2
+  b.append( ('axisAverage', lambda: m6toolbox.axisAverage(temp, z=e), None) )
+  b.append( ('section2quadmesh/pcm', lambda: m6toolbox.section2quadmesh(xMesh[j], e[:,j], temp[:,j], representation='pcm'), None) )
+  b.append( ('section2quadmesh/plm', lambda: m6toolbox.section2quadmesh(xMesh[j], e[:,j], temp[:,j], representation='plm'), None) )
+  b.append( ('rho_Wright97', lambda: m6toolbox.rho_Wright97(salt, temp, 2.e7), None) )
+  random = np.random.RandomState(1)
+  nPoints = 100
+  xPoints = random.uniform(-280., 40., nPoints); yPoints = random.uniform(-60., 60., nPoints)
+  def findCells():
+    for x, y in zip(xPoints, yPoints): meshtools.findIndicesOfCell(xMesh, yMesh, x, y)
+  b.append( ('findIndicesOfCell', findCells, nPoints) )
+  return b
+
+
+def runBenchmarks(files, parameters, repeat, only, directory):
+  """
+  Times each benchmark repeat times and returns a dictionary, keyed by name, of the timings
+  """
+  results = {}
+  for name, function, count in benchmarks(files, parameters, directory):
+    if only and not any( name.startswith(prefix) for prefix in only ): continue
+    times = []
+    for n in range(repeat):
+      start = timeit.default_timer()
+      function()
+      times.append( timeit.default_timer() - start )
+    r = {'min': min(times), 'median': float(np.median(times)), 'repeat': repeat}
+    if count: r['count'] = count; r['rate'] = count / r['min']
+    results[name] = r
+    print('%-36s min= %8.4fs median= %8.4fs'%(name, r['min'], r['median'])
+          + ( ' (%.1f per second)'%r['rate'] if count else '' ))
+  return results
+
+
+def compareResults(before, after):
+  """
+  Prints the median timings in the JSON result files before and after, and their ratio
+  """
+  with open(before) as f: b = json.load(f)
+  with open(after) as f: a = json.load(f)
+  if b['parameters']!=a['parameters']: print('Warning: the datasets differ',b['parameters'],a['parameters'])
+  print('%-36s %12s %12s %8s'%('benchmark', b.get('commit') or before, a.get('commit') or after, 'ratio'))
+  for name in sorted( set(b['results']) | set(a['results']) ):
+    tb = b['results'].get(name, {}).get('median'); ta = a['results'].get(name, {}).get('median')
+    if tb is None or ta is None:
+      print('%-36s %12s %12s'%(name, '-' if tb is None else '%.4f'%tb, '-' if ta is None else '%.4f'%ta))
+    else: print('%-36s %12.4f %12.4f %8.2f'%(name, tb, ta, ta/tb))
+
+
+def gitCommit():
+  """
+  Returns the abbreviated hash of the commit checked out in the repository, or None
+  """
+  try:
+    commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=repository,
+                                     stderr=subprocess.STDOUT).decode().strip()
+    dirty = subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=repository).strip()
+    return commit + ('+' if dirty else '')
+  except Exception: return None
+
+
+# Invoke parseCommandLine(), the top-level prodedure
+if __name__ == '__main__': parseCommandLine()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+
+"""
+Generates synthetic MOM6-like files for benchmarking: a tripolar supergrid, an ocean_static file and
+a multi-file time series of layer temperature, salinity, interface heights and thicknesses, in several
+storage variants (netCDF3, netCDF4, tiled chunks and compressed).
+"""
+
+import os
+import json
+import argparse
+import numpy as np
+import netCDF4 as nc4
+
+
+# Sizes (ni, nj, nk, nt, nFiles) of the standard configurations
+sizes = {'small': (90, 60, 10, 4, 2), 'medium': (360, 240, 25, 6, 2), 'large': (1440, 1080, 75, 4, 2)}
+
+# Storage variants of the time series: (netCDF format, compression, tile the records in chunks)
+variants = {'nc3': ('NETCDF3_64BIT_OFFSET', False, False),
+            'nc4': ('NETCDF4', False, False),
+            'tiled': ('NETCDF4', False, True),
+            'zlib': ('NETCDF4', True, False)}
+
+
+def parseCommandLine():
+  """
+  Parse the command line positional and optional arguments.
+  This is the highest level procedure invoked from the very end of the script.
+  """
+
+  parser = argparse.ArgumentParser(description=
+      '''
+      synthetic.py writes a synthetic MOM6-like dataset (ocean_hgrid.nc, ocean_static.nc and
+      VARIANT/ocean_NNNN.nc time series) into a directory, for use by bench.py.
+      ''',
+      epilog='Written by the pyGVtools developers.')
+  parser.add_argument('directory', type=str,
+      help='Directory in which to create the files.')
+  parser.add_argument('--size', type=str, default='small', choices=sorted(sizes.keys()),
+      help='Standard configuration, which the other options override.')
+  parser.add_argument('--ni', type=int, help='Number of cells in the i-direction.')
+  parser.add_argument('--nj', type=int, help='Number of cells in the j-direction.')
+  parser.add_argument('--nk', type=int, help='Number of layers.')
+  parser.add_argument('--nt', type=int, help='Number of records in each time-series file.')
+  parser.add_argument('--nfiles', type=int, help='Number of time-series files.')
+  parser.add_argument('--variants', type=str, nargs='+', default=sorted(variants.keys()), choices=sorted(variants.keys()),
+      help='Storage variants of the time series to write.')
+  parser.add_argument('--seed', type=int, default=1,
+      help='Seed of the random perturbations, for reproducible data.')
+  args = parser.parse_args()
+
+  ni, nj, nk, nt, nFiles = sizes[args.size]
+  makeDataset(args.directory, ni=args.ni or ni, nj=args.nj or nj, nk=args.nk or nk, nt=args.nt or nt,
+              nFiles=args.nfiles or nFiles, variantNames=args.variants, seed=args.seed)
+
+
+def makeDataset(directory, ni=90, nj=60, nk=10, nt=4, nFiles=2, variantNames=None, seed=1):
+  """
+  Writes the supergrid, static and time-series files into directory, skipping the work if a dataset with
+  the same parameters is already there. Returns a dictionary of the file names.
+  """
+  if variantNames is None: variantNames = sorted(variants.keys())
+  parameters = {'ni': ni, 'nj': nj, 'nk': nk, 'nt': nt, 'nFiles': nFiles, 'variants': sorted(variantNames), 'seed': seed}
+  stamp = os.path.join(directory, 'parameters.json')
+  files = {'supergrid': os.path.join(directory, 'ocean_hgrid.nc'),
+           'static': os.path.join(directory, 'ocean_static.nc')}
+  for v in variantNames:
+    files[v] = [ os.path.join(directory, v, 'ocean_%4.4i.nc'%n) for n in range(nFiles) ]
+  if os.path.isfile(stamp):
+    with open(stamp) as f:
+      if json.load(f)==parameters: return files
+  for v in variantNames:
+    if not os.path.isdir(os.path.join(directory, v)): os.makedirs(os.path.join(directory, v))
+
+  lon, lat = tripolarSupergrid(ni, nj)
+  area = writeSupergrid(files['supergrid'], lon, lat)
+  depth = topography(lon[1::2,1::2], lat[1::2,1::2])
+  writeStatic(files['static'], lon, lat, area, depth)
+  for v in variantNames:
+    random = np.random.RandomState(seed) # Identical data in each variant
+    for n, fileName in enumerate(files[v]):
+      writeTimeSeries(fileName, lon, lat, depth, nk, nt, n*nt, variants[v], random)
+  with open(stamp, 'w') as f: json.dump(parameters, f)
+  return files
+
+
+def tripolarSupergrid(ni, nj, latJoin=65., latSouth=-78., mu0=3.):
+  """
+  Returns the longitude and latitude of the (2*nj+1, 2*ni+1) vertices of the supergrid of a tripolar
+  grid: regular in longitude and latitude south of latJoin, and a bipolar cap to the north made from
+  confocal ellipses, in polar stereographic coordinates, whose foci are the two northern poles and
+  which fold along the line between them.
+  """
+  nCap = max(2, int(round( 2*nj * (90.-latJoin) / (90.-latSouth) )))
+  x = np.linspace(-300., 60., 2*ni+1)
+  ySouth = np.linspace(latSouth, latJoin, 2*nj+1-nCap)
+  lon = np.empty((2*nj+1, 2*ni+1)); lat = np.empty((2*nj+1, 2*ni+1))
+  lon[:len(ySouth)] = x; lat[:len(ySouth)] = ySouth[:,np.newaxis]
+  rJoin = np.tan( np.radians(90.-latJoin)/2. ) # Stereographic radius of the joining latitude
+  a = rJoin / np.cosh(mu0) # Half the distance between the poles
+  mu = mu0 * ( 1. - np.arange(1, nCap+1) / float(nCap) )[:,np.newaxis]
+  nu = np.radians(x - x[0])
+  X = a * np.cosh(mu) * np.cos(nu); Y = a * np.sinh(mu) * np.sin(nu)
+  lat[len(ySouth):] = 90. - 2.*np.degrees( np.arctan( np.hypot(X, Y) ) )
+  dLon = np.degrees( np.arctan2(Y, X) ) - np.degrees(nu) # Departure from the regular longitude
+  lon[len(ySouth):] = x + ( dLon + 180. ) % 360. - 180.
+  return lon, lat
+
+
+def cartesian(lon, lat):
+  """
+  Returns the unit vectors, dimensioned (...,3), of the points lon,lat
+  """
+  lon = np.radians(lon); lat = np.radians(lat)
+  return np.stack( (np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)), axis=-1 )
+
+
+def writeSupergrid(fileName, lon, lat, radius=6.371e6):
+  """
+  Writes the supergrid file with x, y, dx, dy and area (approximated from the diagonals of each cell),
+  and returns the area
+  """
+  p = cartesian(lon, lat)
+  rg = nc4.Dataset(fileName, 'w', format='NETCDF4')
+  nyp, nxp = lon.shape
+  for d, n in [('nyp', nyp), ('nxp', nxp), ('ny', nyp-1), ('nx', nxp-1)]: rg.createDimension(d, n)
+  v = rg.createVariable('x', 'f8', ('nyp','nxp')); v[:] = lon; v.units = 'degrees_east'
+  v = rg.createVariable('y', 'f8', ('nyp','nxp')); v[:] = lat; v.units = 'degrees_north'
+  v = rg.createVariable('dx', 'f8', ('nyp','nx')); v.units = 'meters'
+  v[:] = radius * np.linalg.norm(p[:,1:] - p[:,:-1], axis=-1)
+  v = rg.createVariable('dy', 'f8', ('ny','nxp')); v.units = 'meters'
+  v[:] = radius * np.linalg.norm(p[1:] - p[:-1], axis=-1)
+  v = rg.createVariable('area', 'f8', ('ny','nx')); v.units = 'm2'
+  area = 0.5 * radius**2 * np.linalg.norm( np.cross(p[1:,1:] - p[:-1,:-1], p[1:,:-1] - p[:-1,1:]), axis=-1 )
+  v[:] = area
+  rg.close()
+  return area
+
+
+def topography(lon, lat, maxDepth=5000.):
+  """
+  Returns the depth at lon,lat: an abyssal plain with mid-ocean ridges and Gaussian continents,
+  masked on land
+  """
+  p = cartesian(lon, lat)
+  depth = maxDepth * ( 1. - 0.3*np.cos( np.radians(3.*lon) )**8 ) * np.minimum(1., (lat+80.)/10.)
+  for cLon, cLat, size in [(-100., 45., 30.), (20., 10., 35.), (100., 50., 40.), (135., -25., 18.), (-60., -15., 22.), (0., -90., 12.)]:
+    distance = np.degrees( np.arccos( np.clip( np.sum(p*cartesian(cLon, cLat), axis=-1), -1., 1. ) ) )
+    depth = depth - 1.5 * maxDepth * np.exp( - (distance/size)**2 )
+  return np.ma.masked_where(depth<50., depth)
+
+
+def writeStatic(fileName, lon, lat, area, depth):
+  """
+  Writes a (non-symmetric) ocean_static file with cell centers, corners, areas and depth
+  """
+  rg = nc4.Dataset(fileName, 'w', format='NETCDF4')
+  nj, ni = depth.shape
+  for d, n in [('xh', ni), ('yh', nj), ('xq', ni), ('yq', nj)]: rg.createDimension(d, n)
+  for d, values, units in [('xh', lon[1,1::2], 'degrees_east'), ('yh', lat[1::2,1], 'degrees_north'),
+                           ('xq', lon[2,2::2], 'degrees_east'), ('yq', lat[2::2,2], 'degrees_north')]:
+    v = rg.createVariable(d, 'f8', (d,)); v[:] = values; v.units = units
+  for name, values, dims in [('geolon', lon[1::2,1::2], ('yh','xh')), ('geolat', lat[1::2,1::2], ('yh','xh')),
+                             ('geolon_c', lon[2::2,2::2], ('yq','xq')), ('geolat_c', lat[2::2,2::2], ('yq','xq'))]:
+    v = rg.createVariable(name, 'f4', dims); v[:] = values
+  v = rg.createVariable('areacello', 'f4', ('yh','xh')); v.units = 'm2'
+  v[:] = area[::2,::2] + area[1::2,::2] + area[::2,1::2] + area[1::2,1::2]
+  v = rg.createVariable('deptho', 'f4', ('yh','xh'), fill_value=1.e20); v[:] = depth; v.units = 'm'
+  v = rg.createVariable('wet', 'f4', ('yh','xh')); v[:] = 1. - np.ma.getmaskarray(depth)
+  rg.close()
+
+
+def writeTimeSeries(fileName, lon, lat, depth, nk, nt, n0, variant, random):
+  """
+  Writes nt records, starting at record n0, of layer temperature, salinity, interface heights and
+  thicknesses and sea surface height in the storage variant (format, compress, tiled)
+  """
+  fmt, compress, tiled = variant
+  nj, ni = depth.shape
+  rg = nc4.Dataset(fileName, 'w', format=fmt)
+  for d, n in [('time', None), ('zl', nk), ('zi', nk+1), ('yh', nj), ('xh', ni)]: rg.createDimension(d, n)
+  v = rg.createVariable('time', 'f8', ('time',)); v.units = 'days since 0001-01-01 00:00:00'; v.calendar = 'noleap'
+  v.cartesian_axis = 'T'
+  zTarget = 1020. + 8. * ( np.arange(nk+1) / float(nk) )**0.5 # Target densities of interfaces
+  v = rg.createVariable('zl', 'f8', ('zl',)); v[:] = 0.5*(zTarget[1:]+zTarget[:-1]); v.units = 'kg m-3'
+  v.cartesian_axis = 'Z'; v.positive = 'down'
+  v = rg.createVariable('zi', 'f8', ('zi',)); v[:] = zTarget; v.units = 'kg m-3'
+  v.cartesian_axis = 'Z'; v.positive = 'down'
+  v = rg.createVariable('xh', 'f8', ('xh',)); v[:] = lon[1,1::2]; v.units = 'degrees_east'; v.cartesian_axis = 'X'
+  v = rg.createVariable('yh', 'f8', ('yh',)); v[:] = lat[1::2,1]; v.units = 'degrees_north'; v.cartesian_axis = 'Y'
+  def create(name, dims, units, longName):
+    options = {'fill_value': 1.e20}
+    if fmt.startswith('NETCDF4'): # One record of a level per chunk, or a tile of it
+      options.update(zlib=compress, shuffle=compress)
+      if tiled: options['chunksizes'] = (1,)*(len(dims)-2) + (max(1, nj//4), max(1, ni//4))
+      else: options['chunksizes'] = (1,)*(len(dims)-2) + (nj, ni)
+    v = rg.createVariable(name, 'f4', dims, **options); v.units = units; v.long_name = longName
+    return v
+  temp = create('temp', ('time','zl','yh','xh'), 'degC', 'Potential Temperature')
+  salt = create('salt', ('time','zl','yh','xh'), 'psu', 'Salinity')
+  e = create('e', ('time','zi','yh','xh'), 'm', 'Interface Height Relative to Mean Sea Level')
+  h = create('h', ('time','zl','yh','xh'), 'm', 'Layer Thickness')
+  ssh = create('SSH', ('time','yh','xh'), 'm', 'Sea Surface Height')
+  lonH = lon[1::2,1::2]; latH = lat[1::2,1::2]
+  land = np.ma.getmaskarray(depth)
+  D = np.ma.filled(depth, 0.)
+  zFraction = ( np.arange(nk+1) / float(nk) )[:,np.newaxis,np.newaxis]**2 # Thinner layers near the surface
+  sst = 28. * np.cos( np.radians(latH) )**2 - 1.
+  for n in range(nt):
+    t = n0 + n
+    rg.variables['time'][n] = 5. * t + 2.5
+    eta = 0.5 * np.sin( np.radians(2.*lonH + 10.*t) ) * np.cos( np.radians(latH) ) + 0.02*random.randn(nj, ni)
+    ssh[n] = np.ma.masked_where(land, eta)
+    # Interfaces heave with a wave that propagates westward, collapsing to the bottom where deep layers outcrop
+    heave = 50. * np.sin( np.radians(3.*lonH - 20.*t) ) * np.sin( np.pi*zFraction )
+    E = np.maximum( -zFraction * 5000. + heave, -D )
+    E[0] = eta
+    E = np.maximum.accumulate(E[::-1], axis=0)[::-1] # Monotonic
+    e[n] = np.ma.masked_where(np.broadcast_to(land, E.shape), E)
+    mask = np.broadcast_to(land, (nk, nj, ni))
+    h[n] = np.ma.masked_where(mask, E[:-1] - E[1:])
+    zMid = 0.5 * ( E[:-1] + E[1:] )
+    T = 1. + (sst[np.newaxis] - 1.) * np.exp( zMid/800. ) + 0.1*random.randn(nk, nj, ni)
+    S = 34.7 + 0.8 * np.exp( zMid/500. ) * np.sin( np.radians(2.*latH) ) + 0.01*random.randn(nk, nj, ni)
+    temp[n] = np.ma.masked_where(mask, T)
+    salt[n] = np.ma.masked_where(mask, S)
+  rg.close()
+
+
+# Invoke parseCommandLine(), the top-level prodedure
+if __name__ == '__main__': parseCommandLine()
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+
+# Try to import required packages/modules
+import os
+import sys
+import fnmatch
+import multiprocessing
+try: import argparse
+except: raise Exception('This version of python is not new enough. python 2.7 or newer is required.')
+try: import numpy as np
+except: raise Exception('Unable to import numpy module. Check your PYTHONPATH.\n'
+          +'Perhaps try:\n   module load python_numpy')
+
+# Import stand alone (static) functions
+import nccf
+
+debug = False # Global debugging
+blockBytes = 2**26 # Upper limit on the bytes of one variable read at a time
+
+
+def parseCommandLine():
+  """
+  Parse the command line positional and optional arguments.
+  This is the highest level procedure invoked from the very end of the script.
+  """
+
+  # Arguments
+  parser = argparse.ArgumentParser(description=
+      '''
+      gcheck.py compares the netCDF files in two run directories (or two files), pairing files by
+      their path relative to each directory, and reports which variables and records differ and by
+      how much. By default values must be bitwise identical and the comparison of each variable stops
+      at the first block of records that differs. With --tolerance, values differing by no more than
+      the tolerance are equal. With --stats, every record is read to give the maximum absolute and
+      RMS differences and the list of records that differ. The exit status is 1 if anything differs.
+      ''',
+      epilog='Written by the pyGVtools developers.')
+  parser.add_argument('path1', type=str,
+      help='The first (reference) directory or file.')
+  parser.add_argument('path2', type=str,
+      help='The second directory or file.')
+  parser.add_argument('-t','--tolerance', type=float, default=0.,
+      help='''Largest absolute difference between values that are considered equal. The default (0) requires
+      bitwise identical values, including fill values and NaNs.''')
+  parser.add_argument('-s','--stats', action='store_true',
+      help='''Read all records of variables that differ to report the maximum absolute and RMS differences
+      and the records that differ, instead of stopping at the first difference.''')
+  parser.add_argument('-v','--variables', type=str, nargs='+',
+      help='Compare only these variables. The default is all variables in the first file.')
+  parser.add_argument('-p','--pattern', type=str, default='*.nc',
+      help='Pattern of the file names to compare in directories. Default is "*.nc".')
+  parser.add_argument('-j','--jobs', type=int, default=1,
+      help='Number of processes comparing files in parallel. Default is 1.')
+  parser.add_argument('-a','--all', action='store_true',
+      help='List identical files and variables too, not only those that differ.')
+  parser.add_argument('-d','--debug', action='store_true',
+      help='Turn on debugging information.')
+  optCmdLineArgs = parser.parse_args()
+
+  if optCmdLineArgs.debug: enableDebugging()
+
+  pairs = pairFiles(optCmdLineArgs.path1, optCmdLineArgs.path2, optCmdLineArgs.pattern)
+  if not pairs: raise Exception('Found no files matching "%s" in "%s".'%(optCmdLineArgs.pattern, optCmdLineArgs.path1))
+  nDiffer = checkFiles(pairs, tolerance=optCmdLineArgs.tolerance, stats=optCmdLineArgs.stats,
+                       variableNames=optCmdLineArgs.variables, jobs=optCmdLineArgs.jobs, listAll=optCmdLineArgs.all)
+  sys.exit( 1 if nDiffer else 0 )
+
+
+def pairFiles(path1, path2, pattern='*.nc'):
+  """
+  Returns a list of (name, fileName1, fileName2) pairing the files under directory path1 whose names match
+  pattern with the files of the same relative path under directory path2 (as gcompare.py pairs a file with
+  a directory), or the single pair (path1, path2) if path1 is a file. Files only in path2 are paired with None
+  in place of fileName1.
+  """
+  if not os.path.isdir(path1):
+    if os.path.isdir(path2): path2 = os.path.join(path2, os.path.basename(path1))
+    return [ (os.path.basename(path1), path1, path2) ]
+  def relativeNames(top):
+    names = set()
+    for directory, subDirectories, files in os.walk(top):
+      subDirectories.sort()
+      for f in fnmatch.filter(files, pattern): names.add( os.path.relpath(os.path.join(directory, f), top) )
+    return names
+  names1 = relativeNames(path1)
+  names2 = relativeNames(path2) if os.path.isdir(path2) else set()
+  pairs = [ (n, os.path.join(path1, n), os.path.join(path2, n)) for n in sorted(names1) ]
+  pairs += [ (n, None, os.path.join(path2, n)) for n in sorted(names2 - names1) ]
+  return pairs
+
+
+def checkFiles(pairs, tolerance=0., stats=False, variableNames=None, jobs=1, listAll=False):
+  """
+  Compares each pair of files in pairs (see pairFiles()), in parallel with jobs processes, printing
+  the report of each as it completes and then a summary. Returns the number of pairs that differ.
+  """
+  units = [ (name, f1, f2, tolerance, stats, variableNames) for name, f1, f2 in pairs ]
+  if jobs>1:
+    pool = multiprocessing.Pool(jobs)
+    try: results = pool.imap(checkFileUnit, units)
+    except: pool.terminate(); raise
+  else:
+    pool = None
+    results = map(checkFileUnit, units)
+  counts = {}
+  try:
+    for (name, f1, f2), (status, report) in zip(pairs, results):
+      counts[status] = counts.get(status, 0) + 1
+      if status!='identical' or listAll:
+        for line in reportFile(name, status, report, listAll): print(line)
+        sys.stdout.flush()
+  finally:
+    if pool is not None: pool.close(); pool.join()
+  print('%i files: '%len(pairs) + ', '.join( '%i %s'%(counts[s], s) for s in sorted(counts) ))
+  return len(pairs) - counts.get('identical', 0)
+
+
+def checkFileUnit(unit):
+  """
+  Calls checkFile() with the arguments in the tuple unit, returning an error as a status so that a bad
+  file does not stop the other comparisons (used as the function mapped over a process pool)
+  """
+  name, fileName1, fileName2, tolerance, stats, variableNames = unit
+  try: return checkFile(fileName1, fileName2, tolerance, stats, variableNames)
+  except Exception as e: return 'unreadable', [ (None, 'error', str(e)) ]
+
+
+def checkFile(fileName1, fileName2, tolerance=0., stats=False, variableNames=None):
+  """
+  Compares the variables in fileName1 with those of the same name in fileName2.
+
+  Returns status, report: status is one of "identical", "differ", "missing" (one of the files does not
+  exist) or "unreadable", and report is a list of (variableName, status, details) for each variable
+  compared, where details is a dictionary from compareVariables() or a message.
+  """
+  for f in (fileName1, fileName2):
+    if f is None or not os.path.isfile(f): return 'missing', [ (None, 'missing', f if f else 'only in the second directory') ]
+  rg1 = nccf.openNetCDFfileForReading(fileName1)
+  rg2 = nccf.openNetCDFfileForReading(fileName2)
+  try:
+    report = []
+    names = variableNames if variableNames else list(rg1.variables)
+    for v in names:
+      if not v in rg1.variables or not v in rg2.variables:
+        report.append( (v, 'missing', 'not in %s'%(fileName1 if not v in rg1.variables else fileName2)) )
+        continue
+      vh1 = rg1.variables[v]; vh2 = rg2.variables[v]
+      if vh1.shape!=vh2.shape:
+        report.append( (v, 'differ', 'shape %s != %s'%(vh1.shape, vh2.shape)) )
+        continue
+      if debug: print('checkFile: comparing',v,vh1.shape,'in',fileName1,'and',fileName2)
+      details = compareVariables(vh1, fileName1, vh2, fileName2, tolerance, stats)
+      report.append( (v, 'differ' if details['records'] else 'identical', details) )
+    if not variableNames:
+      for v in rg2.variables:
+        if not v in rg1.variables: report.append( (v, 'missing', 'not in %s'%fileName1) )
+  finally:
+    rg1.close(); rg2.close()
+  if all( r[1]=='identical' for r in report ): return 'identical', report
+  return 'differ', report
+
+
+def compareVariables(vh1, fileName1, vh2, fileName2, tolerance=0., stats=False):
+  """
+  Compares two variables of the same shape a block of records (along the first dimension) at a time.
+
+  With tolerance=0 the values as stored in the files (before unpacking or masking) are compared bit for
+  bit, otherwise the unpacked values must agree to within tolerance and be masked at the same places.
+  Unless stats is True the comparison stops at the first block that differs.
+
+  Returns a dictionary with "records", the list of records (indices of the first dimension, or [0] for
+  a variable without dimensions) that differ, "points", the number of values that differ, and with
+  stats=True also "maxAbs" and "rms", the largest and RMS differences of the values that are not masked
+  in either variable, and "maskPoints", the number of points masked in only one variable.
+  """
+  shape = vh1.shape
+  numeric = vh1.dtype!=str and np.dtype(vh1.dtype).kind in 'iuf' and vh2.dtype!=str and np.dtype(vh2.dtype).kind in 'iuf'
+  bitwise = tolerance==0. or not numeric
+  reader1 = rawReader(vh1, fileName1) if bitwise else vh1
+  reader2 = rawReader(vh2, fileName2) if bitwise else vh2
+  nRecords = shape[0] if len(shape) else 1
+  itemSize = 8 # Bytes of the float64 values compared
+  blockLen = max(1, int( blockBytes / ( itemSize * np.prod( [max(n, 1) for n in shape[1:]] ) ) ))
+  records = []; points = 0
+  maxAbs = 0.; sumSquares = 0.; count = 0; maskPoints = 0
+  for m in range(0, nRecords, blockLen):
+    key = slice(m, min(m+blockLen, nRecords)) if len(shape) else Ellipsis
+    a = reader1[key]; b = reader2[key]
+    if bitwise: differ = bitsDiffer(a, b)
+    else:
+      a = np.ma.masked_invalid( np.ma.asarray(a, dtype=np.float64) )
+      b = np.ma.masked_invalid( np.ma.asarray(b, dtype=np.float64) )
+      maskA = np.ma.getmaskarray(a); maskB = np.ma.getmaskarray(b)
+      difference = np.abs( a.filled(0.) - b.filled(0.) )
+      difference[maskA | maskB] = 0.
+      differ = ( difference>tolerance ) | ( maskA!=maskB )
+    if len(shape)>1: differentRecords = np.nonzero( differ.reshape(differ.shape[0], -1).any(axis=1) )[0] + m
+    else: differentRecords = np.unique( np.nonzero( np.ravel(differ) )[0] + m )
+    if not len(differentRecords): continue
+    records.extend( int(r) for r in differentRecords )
+    points += int( np.count_nonzero(differ) )
+    if not stats: break
+    if not numeric: continue
+    if bitwise: # Read the unpacked values of this block for the statistics
+      a = np.ma.masked_invalid( np.ma.asarray(vh1[key], dtype=np.float64) )
+      b = np.ma.masked_invalid( np.ma.asarray(vh2[key], dtype=np.float64) )
+      maskA = np.ma.getmaskarray(a); maskB = np.ma.getmaskarray(b)
+      difference = np.abs( a.filled(0.) - b.filled(0.) )
+      difference[maskA | maskB] = 0.
+    maxAbs = max( maxAbs, float( difference.max() ) )
+    sumSquares += float( np.sum( difference**2 ) ); count += int( np.count_nonzero( ~( maskA | maskB ) ) )
+    maskPoints += int( np.count_nonzero( maskA!=maskB ) )
+  details = {'records': records, 'points': points, 'nRecords': nRecords}
+  if stats and records:
+    details['maxAbs'] = maxAbs; details['rms'] = np.sqrt( sumSquares / count ) if count else 0.
+    details['maskPoints'] = maskPoints
+  return details
+
+
+def rawReader(variable, fileName):
+  """
+  Returns an object indexed like variable that returns the values as stored in the file, without masking
+  or unpacking: the memory map of the variable if it is stored contiguously and uncompressed, and otherwise
+  the variable itself with automatic masking and scaling turned off.
+  """
+  mapped = nccf.memmapVariable(variable, fileName)
+  if mapped is not None: return mapped.array
+  return RawVariable(variable)
+
+
+class RawVariable:
+  """
+  Class indexing a netCDF4.Variable without masking or unpacking the values read
+  """
+  def __init__(self, variable):
+    self.variable = variable
+  def __getitem__(self, key):
+    self.variable.set_auto_maskandscale(False)
+    try: return self.variable[key]
+    finally: self.variable.set_auto_maskandscale(True)
+
+
+def bitsDiffer(a, b):
+  """
+  Returns a boolean array that is True where the values of arrays a and b (of the same shape) do not
+  have the same bits, so that equal NaNs are equal and 0. and -0. differ
+  """
+  a = np.asarray(a); b = np.asarray(b)
+  if a.dtype.newbyteorder('=')!=b.dtype.newbyteorder('='): return np.ones(a.shape, dtype=bool)
+  if a.dtype.kind in 'iuf':
+    bits = np.dtype('u%i'%a.dtype.itemsize)
+    a = a.astype(a.dtype.newbyteorder('='), copy=False).view(bits)
+    b = b.astype(b.dtype.newbyteorder('='), copy=False).view(bits)
+  return a!=b
+
+
+def reportFile(name, status, report, listAll=False):
+  """
+  Returns the lines of text reporting the comparison of one file
+  """
+  if status=='identical': return [ '%s: identical (%i variables)'%(name, len(report)) ]
+  if status in ('missing', 'unreadable'): return [ '%s: %s %s'%(name, status, report[0][2]) ]
+  nDiffer = len( [ r for r in report if r[1]!='identical' ] )
+  lines = [ '%s: %i of %i variables differ'%(name, nDiffer, len(report)) ]
+  for variableName, variableStatus, details in report:
+    if variableStatus=='identical':
+      if listAll: lines.append( '  %-20s identical'%variableName )
+      continue
+    if not isinstance(details, dict):
+      lines.append( '  %-20s %s %s'%(variableName, variableStatus, details) )
+      continue
+    if 'maxAbs' in details:
+      text = '%i points in records %s of %i, max|diff|=%.6g rms=%.6g'%(details['points'],
+             rangeText(details['records']), details['nRecords'], details['maxAbs'], details['rms'])
+      if details['maskPoints']: text += ', %i points masked in only one'%details['maskPoints']
+    else: text = 'from record %i of %i'%(details['records'][0], details['nRecords'])
+    lines.append( '  %-20s differs %s'%(variableName, text) )
+  return lines
+
+
+def rangeText(indices):
+  """
+  Returns a compact description of a sorted list of integers, e.g. "0-3,7,9-10" for [0,1,2,3,7,9,10]
+  """
+  ranges = []
+  for i in indices:
+    if ranges and i==ranges[-1][1]+1: ranges[-1][1] = i
+    else: ranges.append( [i, i] )
+  return ','.join( '%i'%r[0] if r[0]==r[1] else '%i-%i'%(r[0], r[1]) for r in ranges )
+
+
+def enableDebugging(newValue=True):
+  """
+  Sets the global parameter "debug" to control debugging information.
+  """
+  global debug
+  debug = newValue
+
+
+# Invoke parseCommandLine(), the top-level prodedure
+if __name__ == '__main__': parseCommandLine()
@@ -20,6 +20,9 @@ try: import matplotlib.pyplot as plt
 except: raise MyError('Unable to import matplotlib.pyplot module. Check your PYTHONPATH.\n'
           +'Perhaps try:\n   module load python_matplotlib')
 import warnings
+import profiling
+import iotrace
+import meshtools
 
 debug = False # Global debugging
 warnings.simplefilter('error', UserWarning)
@@ -54,11 +57,15 @@ def parseCommandLine():
       Any of VALUE, START or STOP can take the form '=POS' or '=POS1:POS2' in which case POS, POS1 and POS2 
       are coordinate values or ranges.
       ''')
-  parser.add_argument('file_var_slice2', type=str,
+  parser.add_argument('file_var_slice2', type=str, nargs='+',
       metavar='FILE2[,VARIABLE2[,SLICE1[,SLICE2[...]]]]',
       help='''
       As for argument 1. If the SLICE specifications are missing, those from argument 1 will be assumed.
       If VARIABLE2 is missing the the same variable name from argument 1 will be assumed.
+      If several are given, each is compared with argument 1, which is read only once, using color ranges
+      common to all of them (see --clim and --dlim). If the output file name contains a format such as %%2.2i,
+      one image with --panels panels is written per experiment, numbered from 1. Otherwise a single figure
+      shows argument 1 and its difference from each of the others.
       ''')
   parser.add_argument('-cm','--colormap', type=str, default='',
       help=''' Specify the colormap. The default colormap is determined by the data.
@@ -93,10 +100,29 @@ def parseCommandLine():
       help='The super-grid to use for horizontal coordinates.')
   parser.add_argument('-os','--oceanstatic', type=str, default=None,
       help='The ocean_static file to use for horizontal coordinates.')
+  parser.add_argument('-sg2','--supergrid2', type=str, default=None,
+      help='''The super-grid of the second file(s), if it differs from that of the first. The field on the finer
+      grid is then averaged onto the coarser grid to calculate the difference (see --oceanstatic2).''')
+  parser.add_argument('-os2','--oceanstatic2', type=str, default=None,
+      help='''The ocean_static file of the second file(s), if its grid differs from that of the first. The field
+      on the finer grid is then conservatively remapped onto the coarser grid, weighting each cell of the
+      finer grid by its area of overlap with each cell of the coarser grid, to calculate the difference. The
+      overlaps are cached on disk (see PYGVTOOLS_CACHE).''')
   parser.add_argument('-IJ','--indices', action='store_true',
       help='Use memory indices for coordinates.')
   parser.add_argument('-e','--elevation', type=str, default=None,
       help='The file[,variable] from which to read elevation for vertical section plots.')
+  parser.add_argument('--lod', type=str, choices=['mean','nearest','none'], default='mean',
+      help='''Level of detail. Data with more cells than there are pixels in the plot are coarsened to about
+      the pixel density before drawing, by averaging ('mean') or sampling ('nearest') blocks of cells.
+      'none' draws every cell. Default is 'mean'.''')
+  parser.add_argument('--raster', action='store_true',
+      help='''Resample data on a curvilinear grid (from --supergrid or --oceanstatic) to a regular raster at the
+      resolution of the plot, by nearest-cell lookup, and draw it as an image. The lookup table for each grid
+      and window is cached on disk (see PYGVTOOLS_CACHE) so that redrawing or animating is fast.''')
+  parser.add_argument('--nothreads', action='store_true',
+      help='''Read the arguments of functions such as sigma2(salt,temp) one after the other instead of in
+      concurrent threads. Setting the environment variable PYGVTOOLS_NOTHREADS has the same effect.''')
   parser.add_argument('--animate', action='store_true',
       help='Animate over the unlimited dimension.')
   parser.add_argument('--static2', action='store_true',
@@ -108,13 +134,35 @@ def parseCommandLine():
   parser.add_argument('-ar','--aspect', type=float, nargs=2, metavar=('WIDTH','HEIGHT'),
       help='An aspect ratio for image such as 16 9 (widescreen) or 4 3. Default is 3 4.')
   parser.add_argument('--stats', action='store_true',
-      help='Print the statistics of viewed data.')
+      help='''Print the statistics of viewed data (extremes, mean, RMS, count and percentiles). Statistics are
+      weighted by cell area if --supergrid or --oceanstatic is given.''')
+  parser.add_argument('--statsfile', type=str, default=None,
+      help='''Write the statistics of viewed data, one record per panel and frame, to this file as CSV (if the
+      name ends in .csv) or as lines of JSON.''')
+  parser.add_argument('--profile', action='store_true',
+      help='''Print a breakdown of the time spent in each phase (opening files, resolving dimensions, reading
+      coordinates and data, functions, statistics, drawing the mesh and savefig) at exit.''')
+  parser.add_argument('--profilefile', type=str, default=None,
+      help='''Also write the profile to this file: the phase timings as JSON if the name ends in .json, or
+      otherwise the cProfile statistics of the whole run (implies --profile).''')
+  parser.add_argument('--iotrace', type=str, default=None,
+      help='''Record every read from the netCDF files (file, variable, caller, hyperslab, shape, bytes and time)
+      to this file, as lines of JSON, for summarizing with iotrace.py. Setting the environment variable
+      PYGVTOOLS_IOTRACE to a file name instead appends the reads of each run to that file.''')
   parser.add_argument('--list', action='store_true',
       help='Print selected data to terminal.')
   parser.add_argument('-d','--debug', action='store_true',
       help='Turn on debugging information.')
   optCmdLineArgs = parser.parse_args()
+  if optCmdLineArgs.profile or optCmdLineArgs.profilefile: profiling.enable(optCmdLineArgs.profilefile)
+  if optCmdLineArgs.iotrace: iotrace.enable(optCmdLineArgs.iotrace)
+  if optCmdLineArgs.nothreads: enableThreadedReads(False)
 
+  nRuns = len(optCmdLineArgs.file_var_slice2)
+  if nRuns>1 and not '%' in optCmdLineArgs.output: # One figure with a panel for each run
+    nRows, nCols = panelGrid(nRuns+1)
+    if optCmdLineArgs.aspect==None: optCmdLineArgs.aspect=[4.*nCols, 3.*nRows]
+    if optCmdLineArgs.resolution==None: optCmdLineArgs.resolution=1024
   if optCmdLineArgs.aspect==None:
     if optCmdLineArgs.panels==1: optCmdLineArgs.aspect=[16., 9.]
     elif optCmdLineArgs.panels==2: optCmdLineArgs.aspect=[4., 3.]
@@ -126,7 +174,8 @@ def parseCommandLine():
 
   if optCmdLineArgs.debug: debug = True ; enableDebugging()
 
-  createUI(optCmdLineArgs.file_var_slice1, optCmdLineArgs.file_var_slice2, optCmdLineArgs)
+  if nRuns>1: compareRuns(optCmdLineArgs.file_var_slice1, optCmdLineArgs.file_var_slice2, optCmdLineArgs)
+  else: createUI(optCmdLineArgs.file_var_slice1, optCmdLineArgs.file_var_slice2[0], optCmdLineArgs)
 
 
 def createUI(fileVarSlice1, fileVarSlice2, args):
@@ -140,23 +189,10 @@ def createUI(fileVarSlice1, fileVarSlice2, args):
   if debug: print('createUI: fileName1=',fileName1,'variableName1=',variableName1,'sliceSpecs1=',sliceSpecs1)
 
   # Extract file, variable and slice specs from fileVarSlice2
-  if debug: print('createUI: fileVarSlice2=',fileVarSlice2)
-  (fileName2, variableName2, sliceSpecs2) = splitFileVarPos(fileVarSlice2)
-  if os.path.isdir(fileName2):
-    fileName2=os.path.join(fileName2,os.path.basename(fileName1))
-  if sliceSpecs2==None: sliceSpecs2 = sliceSpecs1
-  if variableName2==None: variableName2 = variableName1
-  if debug: print('createUI: fileName2=',fileName2,'variableName2=',variableName2,'sliceSpecs2=',sliceSpecs2)
+  (fileName2, variableName2, sliceSpecs2) = experimentSpec(fileVarSlice2, fileName1, variableName1, sliceSpecs1)
 
   # Read the meta-data for elevation, if asked for (needed for section plots)
-  if args.elevation:
-    (elevFileName, elevVariableName, elevSliceSpecs) = splitFileVarPos(args.elevation)
-    if elevSliceSpecs==None: elevSliceSpecs = sliceSpecs1
-    if elevVariableName==None: elevVariableName='elevation'
-    if debug: print('elevFileName=',elevFileName,'eName=',elevVariableName,'eSlice=',elevSliceSpecs)
-    eRg, eVar = readVariableFromFile(elevFileName, elevVariableName, elevSliceSpecs,
-        ignoreCoords=args.indices, alternativeNames=['elev', 'e', 'h'])
-  else: eVar = None
+  eVar = readElevation(args, sliceSpecs1)
 
   # Read the meta-data for the variable to be plotted
   rg1, var1 = readVariableFromFile(fileName1, variableName1, sliceSpecs1, ignoreCoords=args.indices)
@@ -201,19 +237,144 @@ def createUI(fileVarSlice1, fileVarSlice2, args):
     render3panels(fileName1, var1, fileName2, var2, eVar, args, frame=0)
     if not args.output: plt.show()
 
-def render3panels(fileName1, var1, fileName2, var2, eVar, args, frame):
+def experimentSpec(fileVarSlice2, fileName1, variableName1, sliceSpecs1):
+  """
+  Returns the file, variable and slice specs of fileVarSlice2, with those missing taken from the first argument
+  """
+  if debug: print('experimentSpec: fileVarSlice2=',fileVarSlice2)
+  (fileName2, variableName2, sliceSpecs2) = splitFileVarPos(fileVarSlice2)
+  if os.path.isdir(fileName2):
+    fileName2=os.path.join(fileName2,os.path.basename(fileName1))
+  if sliceSpecs2==None: sliceSpecs2 = sliceSpecs1
+  if variableName2==None: variableName2 = variableName1
+  if debug: print('experimentSpec: fileName2=',fileName2,'variableName2=',variableName2,'sliceSpecs2=',sliceSpecs2)
+  return fileName2, variableName2, sliceSpecs2
+
+
+def readElevation(args, sliceSpecs1):
+  """
+  Returns the NetcdfSlice for --elevation (needed for section plots), or None
+  """
+  if not args.elevation: return None
+  (elevFileName, elevVariableName, elevSliceSpecs) = splitFileVarPos(args.elevation)
+  if elevSliceSpecs==None: elevSliceSpecs = sliceSpecs1
+  if elevVariableName==None: elevVariableName='elevation'
+  if debug: print('elevFileName=',elevFileName,'eName=',elevVariableName,'eSlice=',elevSliceSpecs)
+  eRg, eVar = readVariableFromFile(elevFileName, elevVariableName, elevSliceSpecs,
+      ignoreCoords=args.indices, alternativeNames=['elev', 'e', 'h'])
+  return eVar
+
+
+def panelGrid(nPanels):
+  """
+  Returns the number of rows and columns of the most nearly square grid of at least nPanels
+  """
+  nCols = int( np.ceil( np.sqrt(nPanels) ) )
+  return int( np.ceil( 1.*nPanels/nCols ) ), nCols
+
+
+def dataRange(data):
+  """
+  Returns the minimum and maximum of the valid values of data, or None if there are none
+  """
+  data = np.ma.masked_invalid(data)
+  if data.count()==0: return None
+  return float(data.min()), float(data.max())
+
+
+def compareRuns(fileVarSlice1, fileVarSlices2, args):
+  """
+  Compares each of several experiments, fileVarSlices2, with the control, fileVarSlice1. The control,
+  elevation, grid and cell areas are read once. Unless given by --clim and --dlim, color ranges common to
+  all the panels are found in a first pass over the experiments, which keeps their data for drawing.
+  Otherwise the experiments are read one at a time as they are drawn.
+  """
+  (fileName1, variableName1, sliceSpecs1) = splitFileVarPos(fileVarSlice1)
+  experiments = [ experimentSpec(s, fileName1, variableName1, sliceSpecs1) for s in fileVarSlices2 ]
+  if args.animate: raise MyError('--animate is only possible when comparing two files.')
+
+  eVar = readElevation(args, sliceSpecs1)
+  if not eVar==None: eVar.getData() # Read once and shared by all panels
+  rg1, var1 = readVariableFromFile(fileName1, variableName1, sliceSpecs1, ignoreCoords=args.indices)
+  if var1.rank>2:
+    raise MyError( 'Variable name "%s" has resolved rank %i. Only 1D and 2D data can be compared.'%(variableName1, var1.rank))
+  var1.getData()
+  control = var1.data # Kept untransformed, since render() transforms the data of each panel in place
+
+  def readExperiment(fileName2, variableName2, sliceSpecs2):
+    rg2, var2 = readVariableFromFile(fileName2, variableName2, sliceSpecs2, ignoreCoords=args.indices)
+    if var2.rank!=var1.rank: raise MyError('%s and %s have different ranks'%(variableName1,variableName2))
+    var2.getData(); rg2.close()
+    return var2
+
+  # First pass for the color ranges
+  experimentVars = {} # Experiments read in the first pass, by position
+  if args.clim is None or args.dlim is None:
+    ranges = {'A': [ dataRange( transformData(np.ma.copy(control), args) ) ], 'A-B': []}
+    for n, (fileName2, variableName2, sliceSpecs2) in enumerate(experiments):
+      experimentVars[n] = readExperiment(fileName2, variableName2, sliceSpecs2)
+      var1.data = control
+      varDiff, _ = difference(var1, experimentVars[n], args)
+      ranges['A'].append( dataRange( transformData(np.ma.copy(experimentVars[n].data), args) ) )
+      ranges['A-B'].append( dataRange( transformData(varDiff.data, args) ) )
+    for name, option in (('A', 'clim'), ('A-B', 'dlim')):
+      valid = [ r for r in ranges[name] if r is not None ]
+      if getattr(args, option) is None and valid:
+        setattr(args, option, centerLimits( min( r[0] for r in valid ), max( r[1] for r in valid ) ))
+    if debug: print('compareRuns: clim=',args.clim,'dlim=',args.dlim)
+
+  if '%' in args.output: # One image per experiment
+    for n, (fileName2, variableName2, sliceSpecs2) in enumerate(experiments):
+      var2 = experimentVars.pop(n, None) or readExperiment(fileName2, variableName2, sliceSpecs2)
+      var1.data = np.ma.copy(control)
+      imageArgs = copy.copy(args)
+      imageArgs.output = args.output%(n+1)
+      setFigureSize(args.aspect[0]/args.aspect[1], args.resolution)
+      render3panels(fileName1, var1, fileName2, var2, eVar, imageArgs, frame=n+1, readData=False)
+      plt.close()
+    return
+
+  # One figure with the control and its difference from each experiment
+  nPanels = len(experiments) + 1
+  nRows, nCols = panelGrid(nPanels)
+  setFigureSize(args.aspect[0]/args.aspect[1], args.resolution)
+  plt.gcf().subplots_adjust(left=.06, right=.97, wspace=.25, bottom=.06, top=.9, hspace=.3)
+  panelArgs = copy.copy(args)
+  panelArgs.output = '' # The figure is saved once, below
+  var1.data = np.ma.copy(control)
+  plt.subplot(nRows, nCols, 1)
+  render(var1, panelArgs, elevation=eVar, skipXlabel=(nPanels>nCols), panel='A')
+  plt.title('A:  %s'%fileName1)
+  for n, (fileName2, variableName2, sliceSpecs2) in enumerate(experiments):
+    var2 = experimentVars.pop(n, None) or readExperiment(fileName2, variableName2, sliceSpecs2)
+    var1.data = control
+    varDiff, diffArgs = difference(var1, var2, panelArgs)
+    plt.subplot(nRows, nCols, n+2)
+    render(varDiff, diffArgs, elevation=eVar, skipXlabel=(n+2<=nPanels-nCols), ignoreClim=True, panel='A-B%i'%(n+1))
+    plt.title('A - B%i:  %s'%(n+1, fileName2))
+  plt.suptitle(var1.label, fontsize=18)
+  if args.output:
+    with profiling.timer('savefig'): plt.savefig(args.output,pad_inches=0.)
+  else: plt.show()
+
+
+def render3panels(fileName1, var1, fileName2, var2, eVar, args, frame, readData=True):
   nPanels = args.panels
   if nPanels==3: plt.gcf().subplots_adjust(left=.10, right=.97, wspace=0, bottom=.05, top=.9, hspace=.2)
   else: plt.gcf().subplots_adjust(left=.10, right=.97, wspace=0, bottom=.09, top=.9, hspace=.2)
-  var1.getData() # Actually read data from file
-  var2.getData() # Actually read data from file
+  if readData:
+    var1.getData() # Actually read data from file
+    var2.getData() # Actually read data from file
+    if not eVar==None: eVar.getData() # Read once and shared by all panels
+  if nPanels in [1,3]: # Before the panels are transformed in place
+    varDiff, diffArgs = difference(var1, var2, args)
   if nPanels>1:
     plt.subplot(nPanels,1,1)
-    clim = render(var1, args, elevation=eVar, frame=frame)
+    clim = render(var1, args, elevation=eVar, frame=frame, panel='A')
     plt.title('A:  %s'%fileName1)
     plt.subplot(nPanels,1,2)
     args.clim = clim
-    render(var2, args, elevation=eVar, frame=frame, skipXlabel=(nPanels!=2))
+    render(var2, secondGridArgs(args), elevation=eVar, frame=frame, skipXlabel=(nPanels!=2), panel='B')
     plt.title('B:  %s'%fileName2)
   if nPanels==3:
     plt.subplot(nPanels,1,3)
@@ -222,35 +383,108 @@ def render3panels(fileName1, var1, fileName2, var2, eVar, args, frame):
     plt.title('%s - %s'%(fileName1,fileName2))
   plt.suptitle(var1.label, fontsize=18)
   if nPanels in [1,3]:
+    render(varDiff, diffArgs, elevation=eVar, skipXlabel=False, ignoreClim=True, frame=frame, panel='A-B')
+
+
+def secondGridArgs(args):
+  """
+  Returns args, or a copy of args with the grid given by --supergrid2 or --oceanstatic2, for the second file
+  """
+  if args.supergrid2 is None and args.oceanstatic2 is None: return args
+  args2 = copy.copy(args)
+  args2.supergrid = args.supergrid2; args2.oceanstatic = args.oceanstatic2
+  return args2
+
+
+def difference(var1, var2, args):
+  """
+  Returns a copy of var1 or var2 holding var1.data - var2.data, and the args with which to draw it. If
+  the data are on different horizontal grids, the field on the finer grid is first averaged onto the
+  coarser grid (see remapToCoarserGrid()), on which the difference is returned. Values of either field
+  excluded by --ignore, --ignorelt or --ignoregt are masked in the difference.
+  """
+  data1, data2 = ignoreMasked(var1.data, args), ignoreMasked(var2.data, args)
+  if np.shape(data1)==np.shape(data2):
     varDiff = copy.copy(var1)
-    varDiff.data = var1.data - var2.data
-    render(varDiff, args, elevation=eVar, skipXlabel=False, ignoreClim=True, frame=frame)
-
-
-def render(var, args, elevation=None, frame=0, skipXlabel=True, skipTitle=True, ignoreClim=False):
-  # Optionally mask out a specific value
-  if args.ignore:
-    var.data = np.ma.masked_array(var.data, mask=[var.data==args.ignore])
-  if args.ignorelt:
-    var.data = np.ma.masked_array(var.data, mask=[var.data<=args.ignorelt])
-  if args.ignoregt:
-    var.data = np.ma.masked_array(var.data, mask=[var.data>=args.ignoregt])
-  if args.scale:
-    var.data = args.scale * var.data
-
-  if args.list: print('createUI: Data =\n',var.data)
-  if args.stats:
-    dMin = np.min(var.data); dMax = np.max(var.data)
-    if dMin==0 and dMax>0:
-      dMin = np.min(var.data[var.data!=0])
-      print('Mininum=',dMin,'(ignoring zeros) Maximum=',dMax)
-    elif dMax==0 and dMin<0:
-      dMax = np.max(var.data[var.data!=0])
-      print('Mininum=',dMin,'Maximum=',dMax,'(ignoring zeros)')
-    else: print('Mininum=',dMin,'Maximum=',dMax)
-
-  if args.offset: var.data = var.data + args.offset
-  if args.log10: var.data = np.log10(var.data)
+    varDiff.data = data1 - data2
+    return varDiff, args
+  if var1.rank!=2 or var2.rank!=2 or not isHorizontal(var1) or not isHorizontal(var2):
+    raise MyError('The data have different shapes, %s and %s, and are not both horizontal fields.'
+                  %(np.shape(var1.data), np.shape(var2.data)))
+  if (args.supergrid or args.oceanstatic) and not (args.supergrid2 or args.oceanstatic2):
+    raise MyError('The data have different shapes. Use --supergrid2 or --oceanstatic2 to give the grid of the second file.')
+  args2 = secondGridArgs(args)
+  if np.size(var1.data)>np.size(var2.data):
+    varDiff = copy.copy(var2)
+    varDiff.data = remapToCoarserGrid(var1, args, var2, args2, data1) - data2
+    return varDiff, args2
+  varDiff = copy.copy(var1)
+  varDiff.data = data1 - remapToCoarserGrid(var2, args2, var1, args, data2)
+  return varDiff, args
+
+
+def isHorizontal(var):
+  """
+  Returns True if the active dimensions of var are the last two, and neither is vertical
+  """
+  return hasattr(var, 'allDims') and var.dims==var.allDims[-2:] and not any( d.isZaxis for d in var.dims )
+
+
+_remapWeights = {} # Results of remapWeights(), for grids read from files
+
+
+@profiling.timed('remap')
+def remapToCoarserGrid(fineVar, fineArgs, coarseVar, coarseArgs, data):
+  """
+  Returns data, on the horizontal grid of fineVar, conservatively remapped onto the grid of coarseVar. Each
+  fine cell contributes to each coarse cell it overlaps, weighted by the area of the overlap, so the area
+  integral is conserved. Each coarse cell holds the mean over its valid part. Coarse cells with no valid
+  fine cells are masked.
+  """
+  fineIndex, coarseIndex, area = remapWeights(fineVar, fineArgs, coarseVar, coarseArgs)
+  valid = ~np.ma.getmaskarray(data).ravel()[fineIndex]
+  nCoarse = coarseVar.dims[0].len * coarseVar.dims[1].len
+  sumArea = np.bincount(coarseIndex[valid], weights=area[valid], minlength=nCoarse)
+  sumQ = np.bincount(coarseIndex[valid], weights=area[valid]*np.ma.getdata(data).ravel()[fineIndex[valid]], minlength=nCoarse)
+  mean = sumQ / np.where(sumArea>0, sumArea, 1.)
+  if debug: print('remapToCoarserGrid: %i overlaps onto %i coarse cells'%(valid.sum(), (sumArea>0).sum()))
+  return np.ma.masked_array(mean, mask=(sumArea==0)).reshape(coarseVar.dims[0].len, coarseVar.dims[1].len)
+
+
+def remapWeights(fineVar, fineArgs, coarseVar, coarseArgs):
+  """
+  Returns the flattened indices of the overlapping pairs of cells of the horizontal grids of fineVar and
+  coarseVar, and the areas of their overlaps. The overlaps are cached on disk (see diskCache()) as fractions
+  of the fine cells (see meshtools.cellOverlaps()), which are scaled by the cell areas from --supergrid or
+  --oceanstatic, or otherwise by the areas in the units of the coordinates.
+  """
+  def gridKey(var, args):
+    gridFile = args.supergrid or args.oceanstatic
+    if gridFile is None: return None
+    return gridCacheKey(gridFile, 'remap', var.allDims[-2:])
+  key = (gridKey(fineVar, fineArgs), gridKey(coarseVar, coarseArgs))
+  if key in _remapWeights: return _remapWeights[key]
+  xFine, yFine = readHorizontalMesh(fineVar, fineArgs)
+  xCoarse, yCoarse = readHorizontalMesh(coarseVar, coarseArgs)
+  period = None
+  if xCoarse.max()-xCoarse.min()>=359. and (fineArgs.supergrid or fineArgs.oceanstatic): period = 360. # Periodic longitude
+  fineIndex, coarseIndex, fraction = diskCache('overlap', (xFine, yFine, xCoarse, yCoarse, np.array(period or 0.)),
+                    lambda: meshtools.cellOverlaps(xFine, yFine, xCoarse, yCoarse, period=period))
+  area = readCellArea(fineVar, fineArgs)
+  if area is None: # Areas of the quadrilaterals in coordinate space
+    area = 0.5 * np.abs( (xFine[1:,1:] - xFine[:-1,:-1]) * (yFine[:-1,1:] - yFine[1:,:-1])
+                       - (xFine[:-1,1:] - xFine[1:,:-1]) * (yFine[1:,1:] - yFine[:-1,:-1]) )
+  area = np.asarray(np.ma.filled(area, 0.), dtype=np.float64).ravel()
+  weights = ( fineIndex, coarseIndex, fraction * area[fineIndex] )
+  if not None in key: _remapWeights[key] = weights
+  return weights
+
+
+@profiling.timed('render')
+def render(var, args, elevation=None, frame=0, skipXlabel=True, skipTitle=True, ignoreClim=False, panel=None):
+  record = {'frame': frame, 'panel': panel, 'variable': var.vname}
+  for d in var.singleDims: record[d.name] = float(d.values[0])
+  var.data = transformData(var.data, args, report=True, weights=readCellArea(var, args), record=record)
 
   # Now plot
   clim = None
@@ -297,13 +531,17 @@ def render(var, args, elevation=None, frame=0, skipXlabel=True, skipTitle=True,
       zData = var.data
       yDim = var.dims[0]
     if yDim.isZaxis and not elevation==None: # Z on y axis ?
-      elevation.getData()
       #yCoord = elevation.data
-      xCoord, yCoord, zData = m6toolbox.section2quadmesh(xCoord, elevation.data, zData, representation='pcm')
+      with profiling.timer('section2quadmesh'):
+        xCoord, yCoord, zData = m6toolbox.section2quadmesh(xCoord, elevation.data, zData, representation='pcm')
       yLims = (np.amin(yCoord[-1,:]), np.amax(yCoord[0,:]))
       #yCoord = extrapElevation( yCoord )
       yLabel = 'Elevation (m)'
-    plt.pcolormesh(xCoord,yCoord,zData)
+      with profiling.timer('mesh'): plt.pcolormesh(xCoord,yCoord,zData)
+    else:
+      gridKey = None # Identifies the 2D coordinates read from a grid file, for drawRaster()
+      if args.supergrid or args.oceanstatic: gridKey = gridCacheKey(args.supergrid or args.oceanstatic, 'mesh', var.dims)
+      drawMesh(plt.gca(), xCoord, yCoord, zData, lod=args.lod, raster=args.raster, gridKey=gridKey)
     if yDim.isZaxis and elevation==None: # Z on y axis ?
       if yCoord[0]>yCoord[-1]: plt.gca().invert_yaxis(); yLims = reversed(yLims)
       if yDim.positiveDown: plt.gca().invert_yaxis(); yLims = reversed(yLims)
@@ -334,9 +572,11 @@ def render(var, args, elevation=None, frame=0, skipXlabel=True, skipTitle=True,
         nf = var.singleDims[0].initialLen
         print('Writing file "%s" (%i/%i)'%(args.output%(frame),frame,nf), \
               'Elapsed %.1fs, %.2f FPS, total %.1fs, remaining %.1fs'%(dt, frame/dt, 1.*nf/frame*dt, (1.*nf/frame-1.)*dt))
-        try: plt.savefig(args.output%(frame),pad_inches=0.)
-        except: raise MyError('output filename must contain %D.Di when animating')
-    else: plt.savefig(args.output,pad_inches=0.)
+        with profiling.timer('savefig'):
+          try: plt.savefig(args.output%(frame),pad_inches=0.)
+          except: raise MyError('output filename must contain %D.Di when animating')
+    else:
+      with profiling.timer('savefig'): plt.savefig(args.output,pad_inches=0.)
   elif not args.animate: # Interactive and static
     def keyPress(event):
       if event.key=='q': exit(0)
@@ -14,6 +14,14 @@ class MyError(Exception):
 import re
 import os
 import time
+import threading
+import hashlib
+import tempfile
+import glob
+import csv
+import multiprocessing
+import weakref
+import collections
 try: import argparse
 except: raise MyError('This version of python is not new enough. python 2.7 or newer is required.')
 try: from netCDF4 import MFDataset, Dataset
@@ -29,11 +37,19 @@ import warnings
 
 # Import stand alone (static) functions
 import m6toolbox
+import meshtools
+import nccf
+import profiling
+import iotrace
+import statstools
 
 debug = False # Global debugging
 warnings.simplefilter('error', UserWarning)
 np.seterr(divide='ignore', invalid='ignore', over='ignore')
 global_eVar = None # Global for averaging from within FnSlice
+threadedReads = not os.environ.get('PYGVTOOLS_NOTHREADS') # Read memory mapped arguments of functions concurrently
+netcdfLock = nccf.libraryLock # Held while calling the netCDF library, which is not thread-safe
+timeSeriesFraction = 0.1 # Largest fraction of the non-record dimensions read from a time-chunked copy
 
 
 def parseCommandLine():
@@ -97,6 +113,42 @@ def parseCommandLine():
       help='The file[,variable] from which to read elevation for vertical section plots.')
   parser.add_argument('--coordlines', action='store_true',
       help='Plot vertical coordinate lines.')
+  parser.add_argument('--lod', type=str, choices=['mean','nearest','none'], default='mean',
+      help='''Level of detail. Data with more cells than there are pixels in the plot are coarsened to about
+      the pixel density before drawing, by averaging ('mean') or sampling ('nearest') blocks of cells.
+      'none' draws every cell. Default is 'mean'.''')
+  parser.add_argument('--raster', action='store_true',
+      help='''Resample data on a curvilinear grid (from --supergrid or --oceanstatic) to a regular raster at the
+      resolution of the plot, by nearest-cell lookup, and draw it as an image. The lookup table for each grid
+      and window is cached on disk (see PYGVTOOLS_CACHE) so that redrawing or animating is fast.''')
+  parser.add_argument('--overview', type=str, default=None,
+      help='''The overview file, created by gpyramid.py, from which to read coarsened data when the plot
+      has fewer pixels than the data have cells. By default FILE.pyramid.nc is used if it exists and is
+      newer than FILE. 'none' always reads data at full resolution, as do --list, --stats and --statsfile.''')
+  parser.add_argument('--tchunk', type=str, default=None,
+      help='''The time-chunked copy of the file, created by grechunk.py, from which to read slices that are long
+      in time and narrow in space (e.g. the time series of a point or a Hovmoller diagram). By default
+      FILE.tchunk.nc is used if it exists and is newer than FILE. 'none' always reads from FILE.''')
+  parser.add_argument('--section', type=float, nargs='+', default=None, metavar='X Y',
+      help='''Plot a vertical section (or line plot for 2D data) along the polyline with vertices X1 Y1 X2 Y2 ...,
+      in the coordinates of the horizontal grid (longitude and latitude with --supergrid or --oceanstatic).
+      The distance along the section is in km for longitude and latitude, and otherwise in the units of the
+      coordinates. The horizontal dimensions of the variable must not be reduced to single values.''')
+  parser.add_argument('--timeseries', action='store_true',
+      help='''Instead of plotting the data, calculate the (area weighted if --supergrid or --oceanstatic is
+      given) mean, RMS, minimum and maximum of each record of the unlimited dimension. The time series are
+      written to the --output file if it ends in .nc or .csv, otherwise the mean is plotted.''')
+  parser.add_argument('-j','--jobs', type=int, default=1,
+      help='Number of processes reading records in parallel for --timeseries. Default is 1.')
+  parser.add_argument('--save-nc', type=str, default=None, metavar='FILE',
+      help='''Instead of plotting the slice (of a variable, function or section), write it with its coordinates to
+      this netCDF file, as read (before --scale, --offset or --log10). A slice with more than one record of the
+      unlimited dimension is read and written one record at a time.''')
+  parser.add_argument('--nothreads', action='store_true',
+      help='''Read the arguments of functions such as sigma2(salt,temp) one after the other instead of in
+      concurrent threads. Threads are only used when all the arguments are memory mapped (uncompressed,
+      contiguous variables), since other reads are serialized in the netCDF library. Setting the
+      environment variable PYGVTOOLS_NOTHREADS has the same effect as this option.''')
   parser.add_argument('--animate', action='store_true',
       help='Animate over the unlimited dimension.')
   parser.add_argument('-o','--output', type=str, default='',
@@ -106,7 +158,21 @@ def parseCommandLine():
   parser.add_argument('-ar','--aspect', type=float, nargs=2, default=[16., 9.], metavar=('WIDTH','HEIGHT'),
       help='An aspect ratio for image such as 16 9 (widescreen) or 4 3. Default is 16 9.')
   parser.add_argument('--stats', action='store_true',
-      help='Print the statistics of viewed data.')
+      help='''Print the statistics of viewed data (extremes, mean, RMS, count and percentiles). Statistics are
+      weighted by cell area if --supergrid or --oceanstatic is given.''')
+  parser.add_argument('--statsfile', type=str, default=None,
+      help='''Write the statistics of viewed data, one record per frame, to this file as CSV (if the name ends in
+      .csv) or as lines of JSON.''')
+  parser.add_argument('--profile', action='store_true',
+      help='''Print a breakdown of the time spent in each phase (opening files, resolving dimensions, reading
+      coordinates and data, functions, statistics, drawing the mesh, tight_layout and savefig) at exit.''')
+  parser.add_argument('--profilefile', type=str, default=None,
+      help='''Also write the profile to this file: the phase timings as JSON if the name ends in .json, or
+      otherwise the cProfile statistics of the whole run (implies --profile).''')
+  parser.add_argument('--iotrace', type=str, default=None,
+      help='''Record every read from the netCDF files (file, variable, caller, hyperslab, shape, bytes and time)
+      to this file, as lines of JSON, for summarizing with iotrace.py. Setting the environment variable
+      PYGVTOOLS_IOTRACE to a file name instead appends the reads of each run to that file.''')
   parser.add_argument('--list', action='store_true',
       help='Print selected data to terminal.')
   parser.add_argument('-d','--debug', action='store_true',
@@ -115,6 +181,9 @@ def parseCommandLine():
   optCmdLineArgs = parser.parse_args()
 
   if optCmdLineArgs.debug: enableDebugging()
+  if optCmdLineArgs.profile or optCmdLineArgs.profilefile: profiling.enable(optCmdLineArgs.profilefile)
+  if optCmdLineArgs.iotrace: iotrace.enable(optCmdLineArgs.iotrace)
+  if optCmdLineArgs.nothreads: enableThreadedReads(False)
   if optCmdLineArgs.unittests: unittests(optCmdLineArgs); return
 
   createUI(optCmdLineArgs.file_var_slice, optCmdLineArgs)
@@ -144,7 +213,24 @@ def createUI(fileVarSlice, args):
   else: eVar = None
 
   # Read the meta-data for the variable to be plotted
-  rg, var = readVariableFromFile(fileName, variableName, sliceSpecs, ignoreCoords=args.indices)
+  rg, var = readVariableFromFile(fileName, variableName, sliceSpecs, ignoreCoords=args.indices,
+      overview=args.overview, tchunk=args.tchunk)
+
+  # Sample the variable, and elevation, along a polyline whose distance replaces the horizontal dimensions
+  if args.section:
+    if len(args.section)<4 or len(args.section)%2:
+      raise MyError('--section needs the coordinates of at least two points, X1 Y1 X2 Y2 ...')
+    xMesh, yMesh = readHorizontalMesh(var, args)
+    hDims = netcdfSlices(var)[0].allDims[-2:]
+    if args.supergrid or args.oceanstatic or all( str(d.units or '').lower().startswith('degree') for d in hDims ):
+      units = None # Longitude and latitude, so great circle distance in km
+    else: units = hDims[1].units or '' # Cartesian coordinates, or indices with --indices
+    var = PolylineSlice(var, xMesh, yMesh, args.section[0::2], args.section[1::2], units=units)
+    if not eVar is None: eVar = PolylineSlice(eVar, xMesh, yMesh, args.section[0::2], args.section[1::2], units=units)
+    args.supergrid = None; args.oceanstatic = None # The horizontal coordinate is now distance along the section
+
+  if args.timeseries: timeSeries(fileName, var, args); return
+  if args.save_nc: saveSlice(var, args.save_nc, elevation=eVar); return
 
   # Set figure shape
   setFigureSize(args.aspect[0]/args.aspect[1], args.resolution)
@@ -181,31 +267,16 @@ def createUI(fileVarSlice, args):
     if not args.output: plt.show()
   
 
+@profiling.timed('render')
 def render(var, args, elevation=None, frame=0):
+  if hasattr(var, 'targetShape') and args.lod!='none' and not (args.list or args.stats or args.statsfile):
+    bbox = plt.gca().get_window_extent() # Allows reading from a coarsened overview, only for drawing
+    var.targetShape = (int(bbox.height), int(bbox.width))
   var.getData() # Actually read data from file
-  # Optionally mask out a specific value
-  if args.ignore:
-    var.data = np.ma.masked_array(var.data, mask=[var.data==args.ignore])
-  if args.ignorelt:
-    var.data = np.ma.masked_array(var.data, mask=[var.data<=args.ignorelt])
-  if args.ignoregt:
-    var.data = np.ma.masked_array(var.data, mask=[var.data>=args.ignoregt])
-  if args.scale:
-    var.data = args.scale * var.data
-
-  if args.list: print('createUI: Data =\n',var.data)
-  if args.stats:
-    dMin = np.min(var.data); dMax = np.max(var.data)
-    if dMin==0 and dMax>0:
-      dMin = np.min(var.data[var.data!=0])
-      print('Mininum=',dMin,'(ignoring zeros) Maximum=',dMax)
-    elif dMax==0 and dMin<0:
-      dMax = np.max(var.data[var.data!=0])
-      print('Mininum=',dMin,'Maximum=',dMax,'(ignoring zeros)')
-    else: print('Mininum=',dMin,'Maximum=',dMax)
-
-  if args.offset: var.data = var.data + args.offset
-  if args.log10: var.data = np.ma.log10(var.data)
+  factor = getattr(var, 'factor', 1) # Coarsening factor of data read from an overview
+  record = {'frame': frame, 'variable': var.vname}
+  for d in var.singleDims: record[d.name] = float(d.values[0])
+  var.data = transformData(var.data, args, report=True, weights=readCellArea(var, args), record=record)
 
   # Now plot
   if var.rank==0:
@@ -239,7 +310,9 @@ def render(var, args, elevation=None, frame=0):
       yLabel = var.dims[0].label; yLims = var.dims[0].limits
       if args.supergrid is None:
         if args.oceanstatic is None:
-          xCoord = extrapCoord( var.dims[1].values); yCoord = extrapCoord( var.dims[0].values)
+          if hasattr(var.dims[1], 'edges'): xCoord = var.dims[1].edges # Distance along a polyline section
+          else: xCoord = extrapCoord( var.dims[1].values)
+          yCoord = extrapCoord( var.dims[0].values)
         else:
           xCoord, xLims = readOSvar(args.oceanstatic, 'geolon_c', var.dims)
           yCoord, yLims = readOSvar(args.oceanstatic, 'geolat_c', var.dims)
@@ -250,14 +323,23 @@ def render(var, args, elevation=None, frame=0):
         xLabel = 'Longitude (\u00B0E)' ; yLabel = 'Latitude (\u00B0N)'
       zData = var.data
       yDim = var.dims[0]
+    xFull, yFull = xCoord, yCoord
+    gridKey = None # Identifies the 2D coordinates read from a grid file, for drawRaster()
+    if args.supergrid or args.oceanstatic: gridKey = gridCacheKey(args.supergrid or args.oceanstatic, 'mesh', var.dims)
+    if factor>1: xCoord, yCoord = coarsenMesh(xCoord, yCoord, factor, factor)
     if yDim.isZaxis and not elevation is None: # Z on y axis ?
       if elevation.refreshable: elevation.getData()
       #yCoord = elevation.data
-      xCoord, yCoord, zData = m6toolbox.section2quadmesh(xCoord, elevation.data, zData, representation='pcm')
+      with profiling.timer('section2quadmesh'):
+        xCoord, yCoord, zData = m6toolbox.section2quadmesh(xCoord, elevation.data, zData, representation='pcm',
+            out=getattr(var, 'sectionBuffers', None))
+      var.sectionBuffers = (xCoord, yCoord, zData) # Re-used for the next frame of an animation
       yLims = (np.amin(yCoord[-1,:]), np.amax(yCoord[0,:]))
       #yCoord = extrapElevation( yCoord )
       yLabel = 'Elevation (m)'
-    plt.pcolormesh(xCoord,yCoord,zData)
+      with profiling.timer('mesh'): mesh = plt.pcolormesh(xCoord,yCoord,zData); zMesh = zData
+    else: mesh, zMesh = drawMesh(plt.gca(), xCoord, yCoord, zData, lod=args.lod, raster=args.raster,
+                                 gridKey=None if gridKey is None else gridKey + (factor,))
     if args.coordlines:
       plt.plot(xCoord,yCoord.T,'k')
     if yDim.isZaxis and elevation is None: # Z on y axis ?
@@ -271,7 +353,7 @@ def render(var, args, elevation=None, frame=0):
     plt.xlim(xLims); plt.ylim(yLims)
     plt.xlabel(xLabel) ; plt.ylabel(yLabel)
     makeGuessAboutCmap(clim=args.clim, colormap=args.colormap)
-    plt.tight_layout()
+    with profiling.timer('tight_layout'): plt.tight_layout()
     plt.colorbar(fraction=.08)
   axis=plt.gca()
   if var.singleDims:
@@ -287,9 +369,11 @@ def render(var, args, elevation=None, frame=0):
       nf = var.singleDims[0].initialLen
       print('Writing file "%s" (%i/%i)'%(args.output%(frame),frame,nf), \
             'Elapsed %.1fs, %.2f FPS, total %.1fs, remaining %.1fs'%(dt, frame/dt, 1.*nf/frame*dt, (1.*nf/frame-1.)*dt))
-      try: plt.savefig(args.output%(frame),pad_inches=0.)
-      except: raise MyError('output filename must contain %D.Di when animating')
-    else: plt.savefig(args.output,pad_inches=0.)
+      with profiling.timer('savefig'):
+        try: plt.savefig(args.output%(frame),pad_inches=0.)
+        except: raise MyError('output filename must contain %D.Di when animating')
+    else:
+      with profiling.timer('savefig'): plt.savefig(args.output,pad_inches=0.)
   elif not args.animate: # Interactive and static
     def keyPress(event):
       if event.key=='q': exit(0)
@@ -314,10 +398,15 @@ def render(var, args, elevation=None, frame=0):
           j,i = np.unravel_index(idx,zData.shape)
         if not i is None:
           val = zData[j,i]
-          if val is np.ma.masked: return 'x,y=%.3f,%.3f  %s(%i,%i)=NaN'%(x,y,var.vname,i+1,j+1)
-          else: return 'x,y=%.3f,%.3f  %s(%i,%i)=%g'%(x,y,var.vname,i+1,j+1,val)
+          if val is np.ma.masked: return 'x,y=%.3f,%.3f  %s(%i,%i)=NaN'%(x,y,var.vname,i*factor+1,j*factor+1)
+          else: return 'x,y=%.3f,%.3f  %s(%i,%i)=%g'%(x,y,var.vname,i*factor+1,j*factor+1,val)
         else: return 'x,y=%.3f,%.3f'%(x,y)
       xmin,xmax=axis.get_xlim(); ymin,ymax=axis.get_ylim();
+      # Re-read the visible window at full resolution if the plot was coarsened
+      zoomReader = None
+      if (zMesh.shape!=zData.shape or factor>1) and hasattr(var, 'readWindow') \
+         and not var.dims[1].isZaxis and var.dims[0].slice2 is None and var.dims[1].slice2 is None:
+        zoomReader = ZoomReader(var, args, mesh, xFull, yFull, gridKey=gridKey)
       def zoom(event): # Scroll wheel up/down
         if event.button == 'up': scaleFactor = 1/1.5 # deal with zoom in
         elif event.button == 'down': scaleFactor = 1.5 # deal with zoom out
@@ -329,6 +418,7 @@ def render(var, args, elevation=None, frame=0):
           (xmin,xmax), (ymin,ymax), scaleFactor)
         if axmin is None: return
         axis.set_xlim(axmin, axmax); axis.set_ylim(aymin, aymax)
+        if zoomReader: zoomReader.request((axmin,axmax), (aymin,aymax))
         plt.draw() # force re-draw
       plt.gcf().canvas.mpl_connect('scroll_event', zoom)
       def zoom2(event): zoom(event)
@@ -337,19 +427,429 @@ def render(var, args, elevation=None, frame=0):
     plt.gcf().canvas.mpl_connect('key_press_event', keyPress)
 
 
-def readVariableFromFile(fileName, variableName, sliceSpecs, ignoreCoords=False, alternativeNames=None):
+def timeSeries(fileName, var, args):
+  """
+  Reduces each record of var, over the range of its unlimited dimension, to the statistics of
+  statstools.recordStats(), reading blocks of records so that memory use does not depend on the number
+  of records, and writes or plots the results.
+  """
+  if not isinstance(var, NetcdfSlice): raise MyError('--timeseries needs a variable, not a function or section.')
+  tDim = var.unlimitedDim
+  if tDim is None or not var.allDims[0] is tDim: raise MyError('--timeseries needs a variable with an unlimited dimension.')
+  if tDim.slice2 is not None: raise MyError('--timeseries needs a contiguous range of records.')
+  tDim.getData()
+  times = np.asarray(tDim.values)
+  n0, n1, _ = tDim.slice1.indices(tDim.lenInFile)
+
+  # Divide the records into blocks of at most about 64 MB within each file
+  slices = [ (d.slice1, d.slice2) for d in var.allDims[1:] ]
+  blockLen = max(1, int( 2**26 / ( 8 * np.prod( [max(d.len, 1) for d in var.allDims[1:]] ) ) ))
+  if glob.has_magic(fileName): files = sorted(glob.glob(fileName))
+  else: files = [fileName]
+  units = []; offset = 0
+  for f in files:
+    with Dataset(f, 'r') as rg: nRecords = len( rg.dimensions[tDim.dimensionName] )
+    for m in range(max(n0, offset), min(n1, offset+nRecords), blockLen):
+      units.append( (f, var.vname, m-offset, min(m+blockLen, n1, offset+nRecords)-offset, slices) )
+    offset = offset + nRecords
+  if debug: print('timeSeries: %i records in %i blocks of up to %i records from %i files'%(n1-n0, len(units), blockLen, len(files)))
+
+  # Reduce the blocks, in parallel if asked for
+  weights = readCellArea(var, args)
+  if args.jobs>1:
+    pool = multiprocessing.Pool(args.jobs, initializer=setTimeSeriesWeights, initargs=(weights,))
+    try: results = pool.map(timeSeriesBlock, units)
+    finally: pool.close()
+  else:
+    setTimeSeriesWeights(weights)
+    results = [ timeSeriesBlock(u) for u in units ]
+  series = {}
+  for key in ('count', 'mean', 'rms', 'min', 'max'):
+    series[key] = np.ma.concatenate( [ r[key] for r in results ] )
+
+  if args.output.endswith('.nc') or args.output.endswith('.csv'): writeTimeSeries(args.output, var, times, series, weights is not None)
+  else:
+    setFigureSize(args.aspect[0]/args.aspect[1], args.resolution)
+    plt.plot(times, series['mean'])
+    plt.xlabel(tDim.label); plt.ylabel('Mean of '+var.label)
+    plt.title(var.label)
+    if args.output: plt.savefig(args.output, pad_inches=0.)
+    else: plt.show()
+
+
+_timeSeriesWeights = None # Cell areas used by timeSeriesBlock()
+_timeSeriesFiles = {} # Files opened by timeSeriesBlock() in this process
+
+
+def setTimeSeriesWeights(weights):
+  """
+  Sets the cell areas used by timeSeriesBlock(), once for each process
+  """
+  global _timeSeriesWeights
+  _timeSeriesWeights = weights
+
+
+def timeSeriesBlock(unit):
+  """
+  Returns statstools.recordStats() for the block of records unit=(fileName, variableName, n0, n1, slices),
+  where slices are the (slice1, slice2) of the other dimensions as in NetcdfDim
+  """
+  fileName, variableName, n0, n1, slices = unit
+  if not fileName in _timeSeriesFiles: _timeSeriesFiles[fileName] = Dataset(fileName, 'r')
+  vh = _timeSeriesFiles[fileName].variables[variableName]
+  slices1 = [slice(n0, n1)] + [ s1 for s1, s2 in slices ]
+  data = vh[tuple(slices1)]
+  if any( s2 is not None for s1, s2 in slices ):
+    slices2 = [slice(n0, n1)] + [ s2 if s2 is not None else s1 for s1, s2 in slices ]
+    data = np.ma.concatenate( (data, vh[tuple(slices2)]), axis=-1 )
+  if debug: print('timeSeriesBlock: read',fileName,variableName,'records',n0,'to',n1)
+  return statstools.recordStats(data, weights=_timeSeriesWeights)
+
+
+def writeTimeSeries(fileName, var, times, series, weighted):
+  """
+  Writes time series, a dictionary of arrays, to fileName as CSV or netCDF
+  """
+  if fileName.endswith('.csv'):
+    with open(fileName, 'w') as f:
+      writer = csv.writer(f)
+      writer.writerow( [var.unlimitedDim.dimensionName] + [ '%s_%s'%(var.vname, key) for key in series ] )
+      for n in range(len(times)):
+        writer.writerow( [times[n]] + [ series[key].filled(np.nan)[n] for key in series ] )
+  else:
+    rg = nccf.openNetCDFfileForWriting(fileName)
+    tName = var.unlimitedDim.dimensionName
+    nccf.write(rg, tName, dimensions={tName:None}, attributes=coordinateAttributes(var.unlimitedDim))
+    rg.variables[tName][:] = times
+    if weighted: how = 'Area weighted '
+    else: how = ''
+    for key in series:
+      attributes = {'long_name': '%s%s of %s'%(how, key, var.name)}
+      if var.units and key!='count': attributes['units'] = var.units
+      if key=='count': dataType = 'i4'
+      else: dataType = 'f8'
+      nccf.write(rg, '%s_%s'%(var.vname, key), series[key], dimensions=[times], attributes=attributes,
+                 dataType=dataType, fillValue=1.e20 if dataType=='f8' else None)
+    rg.close()
+
+
+def saveSlice(var, fileName, elevation=None):
+  """
+  Writes the data of var (a NetcdfSlice, FnSlice or PolylineSlice), and the coordinates of its dimensions, to
+  the netCDF file fileName. If the unlimited dimension is the first of several records, the records are read
+  and written one at a time (as for --animate) so that memory use does not depend on the number of records.
+  The file is removed if writing fails.
+  """
+  name = re.sub('[^A-Za-z0-9_]+', '_', var.vname).strip('_') # e.g. xave(temp) is written as xave_temp
+  attributes = {}
+  if var.name: attributes['long_name'] = str(var.name)
+  if var.units: attributes['units'] = str(var.units)
+  tDim = var.unlimitedDim
+  if tDim is None or not var.dims or not var.dims[0] is tDim:
+    var.getData()
+    data = np.ma.asarray(var.data)
+    if data.dtype.kind!='f': data = data.astype(np.float64)
+    dims, dimensions, coordinates = sliceDimensions(var.dims, data.shape)
+    try: nccf.writeMany(fileName, coordinates + [ (name, data, dims, attributes) ], dimensions, clobber=True,
+                        fillValue=1.e20, zlib=True)
+    except:
+      if os.path.isfile(fileName): os.remove(fileName) # Do not leave a partial file
+      raise
+    if debug: print('saveSlice: wrote',name,data.shape,'to',fileName)
+    return
+  if tDim.slice2 is not None: raise MyError('--save-nc needs a contiguous range of records.')
+
+  # Read and write one record at a time, by making the unlimited dimension a single value
+  tDim.getData()
+  times = np.array(tDim.values)
+  n0 = tDim.slice1.start
+  slices = [ s for s in netcdfSlices(var) ]
+  if elevation is not None: slices = slices + netcdfSlices(elevation)
+  recordDims = [ d for s in slices for d in s.allDims if d.dimensionName==tDim.dimensionName ]
+  for d in recordDims: d.len = 1
+  writer = None
+  if os.path.isfile(fileName): os.remove(fileName)
+  rg = nccf.openNetCDFfileForWriting(fileName)
+  try:
+    tName = tDim.dimensionName
+    nccf.write(rg, tName, dimensions={tName:None}, attributes=coordinateAttributes(tDim))
+    for n in range(len(times)):
+      for d in recordDims:
+        d.slice1 = slice(n0+n, n0+n+1)
+        d.getData(forceRead=True)
+      if elevation is not None: # Re-read for each record, since xave() and the like replace elevation.data
+        elevation.data = None; elevation.refreshable = True
+      var.getData()
+      data = np.ma.asarray(var.data)
+      if writer is None:
+        dims, dimensions, coordinates = sliceDimensions(var.dims[1:], data.shape)
+        nccf.writeMany(rg, coordinates, dimensions)
+        writer = nccf.RecordWriter(rg, [ (tName, [tName]), (name, [tName]+dims, attributes) ],
+                                   dimensions, bufferRecords=1, fillValue=1.e20, zlib=True,
+                                   dataType=data.dtype if data.dtype.kind=='f' else 'f8')
+      writer.append( {tName: times[n], name: data} )
+      if debug: print('saveSlice: wrote record',n0+n,'of',name,'to',fileName)
+    writer.close()
+    rg.close()
+  except:
+    if rg.isopen(): rg.close()
+    os.remove(fileName) # Do not leave a partial file
+    raise
+
+
+def netcdfSlices(var):
+  """
+  Returns the list of NetcdfSlices read by var, a NetcdfSlice, FnSlice or PolylineSlice
+  """
+  if hasattr(var, 'vars'): return [ s for v in var.vars for s in netcdfSlices(v) ]
+  if hasattr(var, 'var'): return netcdfSlices(var.var)
+  return [var]
+
+
+def sliceDimensions(dims, shape):
+  """
+  Returns, for data of the given shape, the names of its dimensions, taken from dims (NetcdfDims or TrackDims)
+  in order, an ordered dictionary of their names and lengths, and a list of coordinate variables for
+  nccf.writeMany(). A dimension whose length does not match the data (e.g. the interfaces of xpsi()) is
+  named after the dimension and its length, and has no coordinate.
+  """
+  names = []; dimensions = collections.OrderedDict(); coordinates = []
+  for n, length in enumerate(shape):
+    d = dims[n] if n<len(dims) else None
+    dName = getattr(d, 'dimensionName', getattr(d, 'name', 'dim'))
+    if d is not None and d.len==length:
+      d.getData()
+      coordinates.append( (dName, np.asarray(d.values, dtype=np.float64), [dName], coordinateAttributes(d)) )
+    else: dName = '%s_%i'%(dName, length)
+    names.append(dName); dimensions[dName] = length
+  return names, dimensions, coordinates
+
+
+_skippedAttributes = ('_FillValue', 'missing_value', 'scale_factor', 'add_offset', 'bounds', 'climatology', 'edges')
+
+
+def coordinateAttributes(dim):
+  """
+  Returns the attributes of the coordinate variable of dim (a NetcdfDim or TrackDim), such as calendar,
+  positive and axis, except those that refer to other variables or to packing, and the long_name and
+  units of dim, as attributes for a coordinate variable
+  """
+  attributes = {}
+  vh = getattr(dim, 'dimensionVariableHandle', None)
+  if vh is not None:
+    for a in vh.ncattrs():
+      if not a in _skippedAttributes: attributes[a] = vh.getncattr(a)
+  if dim.name and dim.name!=getattr(dim, 'dimensionName', None): attributes['long_name'] = str(dim.name)
+  if dim.units: attributes['units'] = str(dim.units)
+  return attributes
+
+
+class ZoomReader:
+  """
+  Class for re-reading, in a background thread, the window of a NetcdfSlice that is visible after
+  zooming and drawing it at full resolution on top of a coarsened plot.
+  """
+  def __init__(self, var, args, mesh, xCoord, yCoord, gridKey=None):
+    self.var = var
+    self.gridKey = gridKey # Identifies xCoord and yCoord (see drawRaster())
+    self.args = args
+    self.mesh = mesh
+    self.xCoord = xCoord
+    self.yCoord = yCoord
+    self.axis = mesh.axes
+    self.detailMesh = None
+    self.window = None # The window being read or drawn
+    self.pending = None # The most recently requested window
+    self.result = None
+    self.error = None # Exception raised by the last read
+    self.thread = None
+    self.timer = self.axis.figure.canvas.new_timer(interval=100)
+    self.timer.add_callback(self.poll)
+  def request(self, xLims, yLims):
+    """
+    Request the window with the given axis limits, starting a read if none is in progress
+    """
+    self.pending = windowIndices(self.xCoord, self.yCoord, xLims, yLims)
+    if self.thread is None: self.start()
+  def start(self):
+    """
+    Start reading the pending window in a background thread
+    """
+    window = self.pending
+    if window==self.window: return
+    self.window = window
+    if window is None or window==(0, self.yCoord.shape[0]-1, 0, self.xCoord.shape[-1]-1):
+      # Zoomed out to the whole plot, or nothing visible, so remove the detail
+      if self.detailMesh is not None: self.detailMesh.remove(); self.detailMesh = None
+      self.axis.figure.canvas.draw_idle()
+      return
+    def read():
+      j0, j1, i0, i1 = window
+      try:
+        data = self.var.readWindow(slice(j0, j1), slice(i0, i1))
+        self.result = (window, transformData(data, self.args))
+      except Exception as e: self.error = e # Reported by poll(), in the main thread
+    if debug: print('ZoomReader.start: reading window j=%i:%i i=%i:%i'%window)
+    self.thread = threading.Thread(target=read)
+    self.thread.daemon = True
+    self.thread.start()
+    self.timer.start()
+  def poll(self):
+    """
+    Timer callback that draws the result of a completed read and starts any pending read
+    """
+    if self.thread is None or self.thread.is_alive(): return
+    self.thread = None
+    self.timer.stop()
+    if self.error is not None:
+      print('ZoomReader: could not read window j=%i:%i i=%i:%i:'%self.window, self.error)
+      failed = self.window
+      self.error = None; self.window = None # So that zooming to this window again retries the read
+      if self.pending!=failed: self.start()
+      return
+    (j0, j1, i0, i1), zData = self.result
+    self.result = None
+    if self.xCoord.ndim==1:
+      xCoord = self.xCoord[i0:i1+1]; yCoord = self.yCoord[j0:j1+1]
+    else:
+      xCoord = self.xCoord[j0:j1+1,i0:i1+1]; yCoord = self.yCoord[j0:j1+1,i0:i1+1]
+    if self.detailMesh is not None: self.detailMesh.remove()
+    self.detailMesh, _ = drawMesh(self.axis, xCoord, yCoord, zData, lod=self.args.lod, raster=self.args.raster,
+                                  gridKey=None if self.gridKey is None else self.gridKey + ((j0, j1, i0, i1),),
+                                  cmap=self.mesh.get_cmap(), norm=self.mesh.norm)
+    self.axis.figure.canvas.draw_idle()
+    if self.pending!=self.window: self.start()
+
+
+def windowIndices(xCoord, yCoord, xLims, yLims):
+  """
+  Returns the index ranges (j0,j1,i0,i1) of the cells with centers inside the x and y limits, padded
+  by one cell, given the vertex coordinates of the cells. Returns None if no cells are inside.
+  """
+  x0, x1 = min(xLims), max(xLims); y0, y1 = min(yLims), max(yLims)
+  if xCoord.ndim==1:
+    xc = 0.5*( xCoord[:-1] + xCoord[1:] ); yc = 0.5*( yCoord[:-1] + yCoord[1:] )
+    i = np.nonzero( (xc>=x0) & (xc<=x1) )[0]; j = np.nonzero( (yc>=y0) & (yc<=y1) )[0]
+  else:
+    xc = 0.25*( xCoord[:-1,:-1] + xCoord[1:,1:] + xCoord[:-1,1:] + xCoord[1:,:-1] )
+    yc = 0.25*( yCoord[:-1,:-1] + yCoord[1:,1:] + yCoord[:-1,1:] + yCoord[1:,:-1] )
+    j, i = np.nonzero( (xc>=x0) & (xc<=x1) & (yc>=y0) & (yc<=y1) )
+  if len(i)==0 or len(j)==0: return None
+  nj = yCoord.shape[0]-1; ni = xCoord.shape[-1]-1
+  return max(j.min()-1, 0), min(j.max()+2, nj), max(i.min()-1, 0), min(i.max()+2, ni)
+
+
+@profiling.timed('transform')
+def transformData(data, args, report=False, weights=None, record=None):
+  """
+  Applies the --ignore, --ignorelt, --ignoregt, --scale, --offset and --log10 options to data.
+  If report is True, the --list, --stats and --statsfile options are honored after scaling, with
+  statistics weighted by weights (if not None) and added to the dictionary record for --statsfile.
+  """
+  if not hasattr(args, 'transform'): args.transform = compileTransforms(args)
+  def inspect(data):
+    if args.list: print('createUI: Data =\n',data)
+    if args.stats or args.statsfile: reportStats(data, args, weights, record)
+  return args.transform(data, inspect=inspect if report else None)
+
+
+def compileTransforms(args):
+  """
+  Returns a function, transform(data, inspect=None), that applies the --ignore, --ignorelt, --ignoregt,
+  --scale, --offset and --log10 options to data in that order, calling inspect(data) (if not None) after
+  scaling. The values are transformed in place when data is a writable floating point array, and the
+  masks are combined into one boolean array, so that only the mask is allocated for a full field.
+  """
+  def option(value): # Options with nargs=1 are lists
+    if value is None or value is False: return None
+    return float(np.ravel(value)[0])
+  ignore, ignoreLT, ignoreGT = option(args.ignore), option(args.ignorelt), option(args.ignoregt)
+  scale, offset = option(args.scale), option(args.offset)
+  log10 = bool(args.log10)
+  masking = ignore is not None or ignoreLT is not None or ignoreGT is not None
+  arithmetic = scale is not None or offset is not None or log10
+  def transform(data, inspect=None):
+    if data is None or not (masking or arithmetic):
+      if inspect is not None and data is not None: inspect(data)
+      return data
+    isMasked = np.ma.isMaskedArray(data) or masking or log10
+    values = np.ma.getdata(data)
+    mask = np.ma.getmask(data)
+    if arithmetic and ( values.dtype.kind!='f' or not values.flags.writeable ):
+      values = values.astype(np.float64 if values.dtype.kind!='f' else values.dtype)
+    if masking or log10:
+      mask = np.array(mask, dtype=bool) if mask is np.ma.nomask or not mask.flags.writeable else mask
+      mask = np.broadcast_to(mask, values.shape).copy() if mask.shape!=values.shape else mask
+      work = np.empty(values.shape, dtype=bool) # Re-used for each condition
+    with np.errstate(invalid='ignore', over='ignore', divide='ignore'):
+      if ignore is not None: mask |= np.equal(values, ignore, out=work)
+      if ignoreLT is not None: mask |= np.less_equal(values, ignoreLT, out=work)
+      if ignoreGT is not None: mask |= np.greater_equal(values, ignoreGT, out=work)
+      if scale is not None: np.multiply(values, scale, out=values)
+      if inspect is not None:
+        inspect(np.ma.masked_array(values, mask=mask, copy=False) if isMasked else values)
+      if offset is not None: np.add(values, offset, out=values)
+      if log10:
+        mask |= np.logical_not(np.greater(values, 0, out=work), out=work) # Also masks NaN
+        np.copyto(values, 1., where=mask)
+        np.log10(values, out=values)
+    if isMasked: return np.ma.masked_array(values, mask=mask, copy=False)
+    return values
+  return transform
+
+
+def ignoreMasked(data, args):
+  """
+  Returns data as a masked array in which the values excluded by the --ignore, --ignorelt and --ignoregt
+  options are also masked. The data themselves are not modified.
+  """
+  def option(value): # Options with nargs=1 are lists
+    if value is None or value is False: return None
+    return float(np.ravel(value)[0])
+  ignore, ignoreLT, ignoreGT = option(args.ignore), option(args.ignorelt), option(args.ignoregt)
+  values = np.ma.getdata(data)
+  mask = np.ma.getmaskarray(data).copy()
+  with np.errstate(invalid='ignore'):
+    if ignore is not None: mask |= values==ignore
+    if ignoreLT is not None: mask |= values<=ignoreLT
+    if ignoreGT is not None: mask |= values>=ignoreGT
+  return np.ma.masked_array(values, mask=mask, copy=False)
+
+
+@profiling.timed('statistics')
+def reportStats(data, args, weights=None, record=None):
+  """
+  Prints the statistics of data for --stats and writes them, with the contents of record, for --statsfile
+  """
+  stats = statstools.StreamingStats()
+  if weights is not None and np.shape(weights)!=np.shape(data)[-2:]: weights = None
+  stats.add(data, weights=weights)
+  if args.stats: print(statstools.summary(stats))
+  if args.statsfile:
+    if record is None: record = {}
+    record.update(stats.result())
+    record['weighted'] = weights is not None
+    statstools.writeRecord(args.statsfile, record)
+
+
+def readVariableFromFile(fileName, variableName, sliceSpecs, ignoreCoords=False, alternativeNames=None, overview=None, tchunk=None):
   """
   Open netCDF file, find and read the variable meta-information and return both
-  the netcdf object and variable object
+  the netcdf object and variable object.
+
+  The overview file (see gpyramid.py) defaults to the sidecar FILE.pyramid.nc, if present
+  and newer than FILE, and is not used if overview is 'none'. Likewise the time-chunked copy (see nccf.rechunk())
+  defaults to FILE.tchunk.nc, if present and newer than FILE, and is not used if tchunk is 'none'.
   """
   # Open netcdf file
-  try: rg = MFDataset(fileName, 'r', aggdim='time')
-  except:
-    if debug: print('Unable to open %s with MFDataset'%(fileName))
-    try: rg = Dataset(fileName, 'r')
+  with profiling.timer('open'):
+    try: rg = MFDataset(fileName, 'r', aggdim='time')
     except:
-      if os.path.isfile(fileName): raise MyError('There was a problem opening "'+fileName+'".')
-      raise MyError('Could not find file "'+fileName+'".')
+      if debug: print('Unable to open %s with MFDataset'%(fileName))
+      try: rg = Dataset(fileName, 'r')
+      except:
+        if os.path.isfile(fileName): raise MyError('There was a problem opening "'+fileName+'".')
+        raise MyError('Could not find file "'+fileName+'".')
 
   # If no variable is specified, summarize the file contents and exit
   if not variableName:
@@ -359,7 +859,8 @@ def readVariableFromFile(fileName, variableName, sliceSpecs, ignoreCoords=False,
     exit(0)
 
   # Intercept the functions of variables
-  if isFunction(variableName): return rg, FnSlice(rg, variableName, sliceSpecs, ignoreCoords=ignoreCoords)
+  if isFunction(variableName):
+    with profiling.timer('dimensions'): return rg, FnSlice(rg, variableName, sliceSpecs, ignoreCoords=ignoreCoords)
 
   # Check that the variable is in the file (allowing for case mismatch)
   for v in rg.variables:
@@ -373,7 +874,72 @@ def readVariableFromFile(fileName, variableName, sliceSpecs, ignoreCoords=False,
         if v in rg.variables: variableName=v ; break
 
   # Obtain meta data along with 1D coordinates, labels and limits
-  return rg, NetcdfSlice(rg, variableName, sliceSpecs, ignoreCoords=ignoreCoords)
+  with profiling.timer('dimensions'): var = NetcdfSlice(rg, variableName, sliceSpecs, ignoreCoords=ignoreCoords)
+  mapped = nccf.memmapVariable(var.variableHandle, fileName) # None unless fileName is a single, uncompressed file
+  if mapped is not None: var.dataHandle = iotrace.wrap(mapped, fileName, 'NetcdfSlice.getData')
+  if overview is None:
+    overview = nccf.sidecarFileName(fileName, 'pyramid')
+    if not os.path.isfile(overview) or os.path.getmtime(overview)<os.path.getmtime(fileName): overview = None
+  if overview and overview!='none': var.addOverviews(overview)
+  if tchunk is None:
+    tchunk = nccf.sidecarFileName(fileName, 'tchunk')
+    if not os.path.isfile(tchunk) or os.path.getmtime(tchunk)<os.path.getmtime(fileName): tchunk = None
+  if tchunk and tchunk!='none' and mapped is None: var.addTimeChunked(tchunk)
+  return rg, var
+
+
+_coordinateCache = weakref.WeakKeyDictionary() # rootGroup: {dimensionName: (length, values)}
+
+
+def readCoordinate(rootGroup, dimensionName, dimensionVariableHandle):
+  """
+  Returns all the values of the 1D coordinate variable of dimensionName in rootGroup. The values are read once
+  per rootGroup and shared by all NetcdfDims, and read again only if the dimension has grown.
+  """
+  with netcdfLock:
+    cache = _coordinateCache.setdefault(rootGroup, {})
+    length = len(rootGroup.dimensions[dimensionName])
+    if not dimensionName in cache or cache[dimensionName][0]!=length:
+      if debug: print('readCoordinate: reading',dimensionName,'of length',length)
+      cache[dimensionName] = (length, dimensionVariableHandle[:])
+    return cache[dimensionName][1]
+
+
+class _NoLock:
+  """
+  Context that does nothing, in place of netcdfLock for reads that do not call the netCDF library
+  """
+  def __enter__(self): return self
+  def __exit__(self, *args): return False
+_noLock = _NoLock()
+
+
+def readLock(handle):
+  """
+  Returns the lock to hold while reading from handle: none if the variable is memory mapped (see
+  nccf.memmapVariable()), so that threads read it concurrently, and otherwise netcdfLock
+  """
+  if getattr(handle, 'isMemoryMapped', False): return _noLock
+  return netcdfLock
+
+
+def readConcurrently(slices):
+  """
+  Calls getData() of each of slices (NetcdfSlice, FnSlice, ...), each in its own thread if there are
+  several, threadedReads is set and all are read from memory maps without netcdfLock (see readLock()).
+  Exceptions are raised in the calling thread.
+  """
+  if not threadedReads or len(slices)<2 or not all( readLock(n.dataHandle) is _noLock for s in slices for n in netcdfSlices(s) ):
+    for s in slices: s.getData()
+    return
+  errors = []
+  def read(s):
+    try: s.getData()
+    except BaseException as e: errors.append(e)
+  threads = [ threading.Thread(target=read, args=(s,)) for s in slices ]
+  for t in threads: t.start()
+  for t in threads: t.join()
+  if errors: raise errors[0]
 
 
 class NetcdfDim:
@@ -418,6 +984,7 @@ class NetcdfDim:
         self.isZaxis = True
         if isAttrEqualTo(dimensionVariableHandle,'positive','down'): self.positiveDown = True
         else: self.positiveDown = False
+      dimensionVariableHandle = iotrace.wrap(dimensionVariableHandle, iotrace.groupFileName(rootGroup), 'NetcdfDim')
     else:
       dimensionVariableHandle = None
       dimensionValues = np.arange( len(dimensionHandle) ) + 1
@@ -444,7 +1011,7 @@ class NetcdfDim:
         if high=='': indexEnd = len(dimensionHandle) - 1
         else: indexEnd = int(high) - 1 # Convert from Fortran indexing
     else: # An equals was specified so the RHS low:high is in coordinate space
-      if dimensionVariableHandle: dimensionValues = dimensionVariableHandle[:] # Read global coordinate data
+      if dimensionVariableHandle: dimensionValues = readCoordinate(rootGroup, dimensionName, dimensionVariableHandle)
       cMin = 1.5*dimensionValues[0] - 0.5*dimensionValues[1]
       cMax = 1.5*dimensionValues[-1] - 0.5*dimensionValues[-2]
       isLongitude = int(0.5+cMax-cMin)==360
@@ -476,9 +1043,12 @@ class NetcdfDim:
     self.lenInFile = len(dimensionHandle)
     self.limits = (None, None)
     self.dimensionVariableHandle = dimensionVariableHandle
+    self.rootGroup = rootGroup
+    self.dimensionName = dimensionName
     self.values = None
     self.isUnlimited = dimensionHandle.isunlimited()
     self.initialLen = self.len
+  @profiling.timed('read coordinates')
   def getData(self, forceRead=False):
     """
     Read dimension variable data if it has not been read
@@ -488,11 +1058,12 @@ class NetcdfDim:
       if self.dimensionVariableHandle is None:
         self.values = np.array(list(range(self.slice1.start, self.slice1.stop))) + 1
       else:
+        values = readCoordinate(self.rootGroup, self.dimensionName, self.dimensionVariableHandle)
         if self.slice2:
-          cMin = 1.5*self.dimensionVariableHandle[0] - 0.5*self.dimensionVariableHandle[1]
-          cMax = 1.5*self.dimensionVariableHandle[-1] - 0.5*self.dimensionVariableHandle[-2]
-          self.values = np.append(self.dimensionVariableHandle[self.slice1], self.dimensionVariableHandle[self.slice2]+(cMax-cMin))
-        else: self.values = self.dimensionVariableHandle[self.slice1]
+          cMin = 1.5*values[0] - 0.5*values[1]
+          cMax = 1.5*values[-1] - 0.5*values[-2]
+          self.values = np.append(values[self.slice1], values[self.slice2]+(cMax-cMin))
+        else: self.values = values[self.slice1]
     if self.len>1:
       cMin = 1.5*self.values[0] - 0.5*self.values[1]
       cMax = 1.5*self.values[-1] - 0.5*self.values[-2]
@@ -567,6 +1138,7 @@ class NetcdfSlice:
 
     # Attributes of class
     self.variableHandle = variableHandle
+    self.dataHandle = iotrace.wrap(variableHandle, iotrace.groupFileName(rootGroup), 'NetcdfSlice.getData') # Or a nccf.MemmapVariable, from which data are read
     self.allDims = dims
     self.dims = activeDims
     self.singleDims = singleDims
@@ -575,42 +1147,146 @@ class NetcdfSlice:
     self.vname = variableName
     self.rank = len(self.dims)
     self.refreshable = True
+    self.overviews = {} # Coarsened levels of the variable, keyed by coarsening factor
+    self.targetShape = None # Number of cells needed in the last two dimensions, if known
+    self.factor = 1 # Coarsening factor of self.data
+  def addOverviews(self, fileName):
+    """
+    Registers the coarsened levels of this variable found in an overview file made by gpyramid.py
+    """
+    try: rg = Dataset(fileName, 'r')
+    except:
+      if os.path.isfile(fileName): raise MyError('There was a problem opening "'+fileName+'".')
+      raise MyError('Could not find file "'+fileName+'".')
+    for v in rg.variables.values():
+      if 'pyramid_source' in v.ncattrs() and v.getncattr('pyramid_source')==self.vname:
+        self.overviews[int(v.getncattr('pyramid_factor'))] = v
+    if debug: print('NetcdfSlice.addOverviews: factors',sorted(self.overviews),'from',fileName)
+  def addTimeChunked(self, fileName):
+    """
+    Reads data from the copy of this variable in fileName, made by nccf.rechunk() with chunks that are long
+    in time, if the slice is long in time and narrow in space (see isTimeSeries())
+    """
+    if not self.isTimeSeries(): return
+    try: rg = Dataset(fileName, 'r')
+    except:
+      if os.path.isfile(fileName): raise MyError('There was a problem opening "'+fileName+'".')
+      raise MyError('Could not find file "'+fileName+'".')
+    vh = rg.variables.get(self.vname)
+    if vh is None or vh.shape!=self.variableHandle.shape or vh.dimensions!=self.variableHandle.dimensions:
+      if debug: print('NetcdfSlice.addTimeChunked: no matching',self.vname,'in',fileName)
+      rg.close(); return
+    self.dataHandle = iotrace.wrap(vh, fileName, 'NetcdfSlice.getData')
+    if debug: print('NetcdfSlice.addTimeChunked: reading',self.vname,'from',fileName)
+  def isTimeSeries(self):
+    """
+    Returns True if more than one record, and no more than timeSeriesFraction of the other dimensions, are selected
+    """
+    if len(self.allDims)<2 or self.allDims[0].len<2: return False
+    selected = np.prod( [ float(d.len) for d in self.allDims[1:] ] )
+    total = np.prod( [ float(d.lenInFile) for d in self.allDims[1:] ] )
+    return selected <= timeSeriesFraction * total
+  def selectOverview(self):
+    """
+    Returns the coarsest overview factor that still provides targetShape cells within the selected
+    range of the last two dimensions, or 1 if the data must be read at full resolution
+    """
+    if not self.overviews or self.targetShape is None: return 1
+    jDim, iDim = self.allDims[-2:]
+    if jDim.slice2 or iDim.slice2 or jDim.len==1 or iDim.len==1: return 1
+    best = 1
+    for f in sorted(self.overviews):
+      if self.overviews[f].shape[:-2]!=self.variableHandle.shape[:-2]: continue
+      aligned = True
+      for d in (jDim, iDim):
+        if d.slice1.start%f or (d.slice1.stop%f and d.slice1.stop!=d.lenInFile): aligned = False
+      if aligned and -(-jDim.len//f)>=self.targetShape[0] and -(-iDim.len//f)>=self.targetShape[1]: best = f
+    return best
+  @profiling.timed('read data')
   def getData(self):
     """
-    Popolate NetcdfSlice.data with data from file
+    Popolate NetcdfSlice.data with data from file, in the precision of the file (e.g. float32)
     """
     slices1 = []; slices2 = []
     for d in self.allDims:
       d.getData()
       if d.slice2: slices1.append( d.slice1 ); slices2.append( d.slice2 )
       else: slices1.append( d.slice1 ); slices2.append( d.slice1 )
-    if slices1==slices2:
-      self.data = np.squeeze( self.variableHandle[slices1] )
+    self.factor = self.selectOverview()
+    if self.factor>1: # Read from the coarsened overview
+      f = self.factor
+      slices1 = slices1[:-2] + [ slice(s.start//f, -(-s.stop//f)) for s in slices1[-2:] ]
+      if debug: print('NetcdfSlice.getData: reading overview coarsened by',f,'slices=',slices1)
+      with netcdfLock: self.data = np.squeeze( self.overviews[f][slices1] )
+    elif slices1==slices2:
+      with readLock(self.dataHandle): data = self.dataHandle[slices1]
+      self.data = np.squeeze( data )
     else:
-      self.data = np.ma.concatenate(
-        ( np.squeeze( self.variableHandle[slices1] ),
-          np.squeeze( self.variableHandle[slices2] ) ), axis=1)
+      with readLock(self.dataHandle): data1 = self.dataHandle[slices1]; data2 = self.dataHandle[slices2]
+      self.data = np.ma.concatenate( ( np.squeeze( data1 ), np.squeeze( data2 ) ), axis=1)
+    profiling.count('bytes of data read', self.data.nbytes)
+  def readWindow(self, jSlice, iSlice):
+    """
+    Returns data from file for the index ranges jSlice and iSlice, counted from the start of the
+    last two active dimensions, without changing NetcdfSlice.data
+    """
+    slices = []
+    for d in self.allDims:
+      if d is self.dims[-2]: slices.append( slice(d.slice1.start+jSlice.start, d.slice1.start+jSlice.stop) )
+      elif d is self.dims[-1]: slices.append( slice(d.slice1.start+iSlice.start, d.slice1.start+iSlice.stop) )
+      else: slices.append( d.slice1 )
+    with readLock(self.dataHandle): data = self.dataHandle[slices]
+    return data.reshape(jSlice.stop-jSlice.start, iSlice.stop-iSlice.start)
 
 
 class FnSlice:
   """
   Class for reading a function of variables from a netcdf file.
+
+  Functions that remap a layer variable, q, to a surface remove the vertical dimension:
+    zremap(q,z) is q at elevation z, and zremap(q,z1,z2) is q averaged conservatively between
+    elevations z1 and z2, using the interfaces given by --elevation;
+    onrho(q,r,r0) is q interpolated to the surface where r=r0, where r can be a variable or one of
+    sigma0, sigma2 or sigma4 (potential density - 1000) calculated from salt and temp.
   """
   def __init__(self, rootGroup, fnString, sliceSpecs, ignoreCoords=False):
     """
     Interpret F(x,y,...), assaciate a NetcdfSlice for each of x,y,... and
     apply F() when getting data.
     """
-    m = re.match('(\w+)\(([\w,]+)\)',fnString)
+    m = re.match('(\w+)\(([\w,\.\+\-]+)\)',fnString)
     self.function = m.group(1)
+    def isNumber(s):
+      try: float(s); return True
+      except ValueError: return False
+    names = [ a for a in m.group(2).split(',') if not isNumber(a) ]
+    self.parameters = [ float(a) for a in m.group(2).split(',') if isNumber(a) ]
+    self.pressure = None # Reference pressure for a density calculated by onrho()
+    if self.function.lower() == 'onrho':
+      if len(names)!=2 or len(self.parameters)!=1: raise MyError('Usage is onrho(variable,density,value).')
+      pressures = {'sigma0':0., 'sigma2':2e7, 'sigma4':4e7}
+      if names[1].lower() in pressures and not names[1] in rootGroup.variables:
+        self.pressure = pressures[names[1].lower()]
+        densityName = names[1]
+        names = names[:1]
+        for alternatives in (['salt','so','SALT'], ['temp','thetao','TEMP']):
+          found = [ v for v in alternatives if v in rootGroup.variables ]
+          if not found: raise MyError('Could not find any of %s to calculate %s.'%(', '.join(alternatives), densityName))
+          names.append( found[0] )
+    elif self.function.lower() == 'zremap':
+      if len(names)!=1 or not len(self.parameters) in (1, 2): raise MyError('Usage is zremap(variable,z) or zremap(variable,z1,z2).')
     varNetcdfSlices = []
-    for v in m.group(2).split(','):
+    for v in names:
       varNetcdfSlices.append( NetcdfSlice(rootGroup, v, sliceSpecs, ignoreCoords=ignoreCoords) )
     self.vars = varNetcdfSlices
     self.rank = varNetcdfSlices[0].rank
+    self.allDims = varNetcdfSlices[0].allDims
     self.dims = varNetcdfSlices[0].dims
     self.singleDims = varNetcdfSlices[0].singleDims
+    self.unlimitedDim = varNetcdfSlices[0].unlimitedDim
     self.label = fnString
+    self.name = fnString
+    self.units = ''
     self.vname = fnString
     self.data = None
     if self.function.lower() in ['xave', 'xpsi']:
@@ -619,12 +1295,20 @@ class FnSlice:
     elif self.function.lower() in ['tave']:
       self.rank = self.rank - 1
       del self.dims[0]
+    elif self.function.lower() in ['zremap', 'onrho']:
+      zDims = [ d for d in self.dims if d.isZaxis ]
+      if not zDims and self.rank>=3: zDims = self.dims[-3:-2] # Assume (...,z,y,x)
+      if not zDims: raise MyError('%s() needs a variable with a vertical dimension that is not a single value.'%self.function)
+      self.zDim = zDims[0]
+      self.dims = [ d for d in self.dims if not d is zDims[0] ]
+      self.rank = self.rank - 1
+      self.units = varNetcdfSlices[0].units
+  @profiling.timed('function')
   def getData(self):
     """
-    Popolate FnfSlice.data with data from file
+    Popolate FnfSlice.data with data from file, reading the arguments concurrently (see readConcurrently())
     """
-    for v in self.vars:
-      v.getData()
+    readConcurrently(self.vars)
     if self.function.lower() == 'sigma0':
       self.data = m6toolbox.rho_Wright97(self.vars[0].data, self.vars[1].data, 0)
     elif self.function.lower() == 'sigma2':
@@ -640,7 +1324,7 @@ class FnSlice:
       self.data, zOut, _ = m6toolbox.axisAverage( self.vars[0].data, z=global_eVar.data )
       global_eVar.data = zOut
     elif self.function.lower() == 'xpsi':
-      xSum = np.sum(self.vars[0].data, axis=-1) # Zonal sum
+      xSum = np.sum(self.vars[0].data, axis=-1, dtype=np.float64) # Zonal sum
       #psi1 = np.cumsum( xSum[:,::-1], axis=-2)
       #psi2 = np.cumsum( xSum, axis=-2)
       #self.data = psi1[:,::-1] - psi2
@@ -655,10 +1339,115 @@ class FnSlice:
         global_eVar.data = np.min(global_eVar.data, axis=-1)
         self.data = self.data[1:,:]
     elif self.function.lower() == 'tave':
-      self.data = np.mean( self.vars[0].data, axis=0 )
+      data = self.vars[0].data # Averaged in double precision but returned in that of the data
+      self.data = np.mean( data, axis=0, dtype=np.float64 ).astype( nccf.nativeFloat(data.dtype) )
+    elif self.function.lower() in ['zremap', 'onrho']:
+      # Position of the vertical axis in the data, from which single-valued dimensions were squeezed
+      allDims = self.vars[0].allDims
+      zAxis = len( [ d for d in allDims[:allDims.index(self.zDim)] if d.len>1 ] )
+      q = np.moveaxis(self.vars[0].data, zAxis, 0)
+      if self.function.lower() == 'zremap':
+        if global_eVar is None: raise MyError('Elevation is necessary to remap to depth (use --elevation).')
+        global_eVar.getData()
+        self.data = m6toolbox.remapToDepth(q, np.moveaxis(global_eVar.data, zAxis, 0), *self.parameters)
+      else:
+        if self.pressure is None: r = self.vars[1].data
+        else: r = m6toolbox.rho_Wright97(self.vars[1].data, self.vars[2].data, self.pressure) - 1000.
+        self.data = m6toolbox.valueOnSurface(q, np.moveaxis(r, zAxis, 0), self.parameters[0])
     else: raise MyError('Unknown function: '+self.function)
 
 
+class PolylineSlice:
+  """
+  Class for sampling a NetcdfSlice, or FnSlice, at the cells crossed by a polyline through its last two
+  (horizontal) dimensions, which are replaced by a TrackDim with the given units (see TrackDim)
+  """
+  def __init__(self, var, xMesh, yMesh, xLine, yLine, units=None):
+    source = netcdfSlices(var)[0] # The dimensions of a FnSlice are those of its arguments
+    hDims = source.allDims[-2:]
+    for d in hDims:
+      if not d in var.dims: raise MyError('The horizontal dimension "%s" must not be a single value for a section'%d.name)
+    if xMesh.shape!=(hDims[0].len+1, hDims[1].len+1):
+      raise MyError('The horizontal grid (%ix%i nodes) does not match the variable (%ix%i cells)'%(xMesh.shape+(hDims[0].len, hDims[1].len)))
+    xLine = np.array(xLine, dtype=float); yLine = np.array(yLine, dtype=float)
+    self.j, self.i, xCross, yCross = diskCache('section', (xMesh, yMesh, xLine, yLine),
+                                               lambda: meshtools.sectionCells(xMesh, yMesh, xLine, yLine))
+    if len(self.j)==0: raise MyError('The section does not cross the horizontal grid')
+    if debug: print('PolylineSlice: section crosses',len(self.j),'cells')
+    track = TrackDim(xCross, yCross, units=units)
+    self.var = var
+    self.allDims = source.allDims[:-2] + [track]
+    self.dims = [d for d in var.dims if not d in hDims] + [track]
+    self.singleDims = var.singleDims
+    self.unlimitedDim = source.unlimitedDim
+    self.variableHandle = getattr(var, 'variableHandle', None)
+    self.data = None
+    self.label, self.name, self.units = var.label, getattr(var, 'name', var.label), getattr(var, 'units', source.units)
+    self.vname = var.vname
+    self.rank = len(self.dims)
+    self.refreshable = True
+  @profiling.timed('section sampling')
+  def getData(self):
+    """
+    Populate PolylineSlice.data by gathering the crossed cells from the data of the variable
+    """
+    self.var.getData()
+    j = np.maximum(self.j, 0); i = np.maximum(self.i, 0) # Gaps in the section have indices -1
+    data = self.var.data
+    self.data = np.ma.masked_array( np.ma.getdata(data)[...,j,i], mask=np.ma.getmaskarray(data)[...,j,i] | (self.j<0) )
+
+
+class TrackDim:
+  """
+  Class for describing the distance along a polyline section, in the manner of NetcdfDim
+  """
+  def __init__(self, xCross, yCross, units=None):
+    """
+    Initialize from the positions at which the polyline crosses into each cell. If units is None, the
+    positions are longitudes and latitudes and the distance is along great circles in km, otherwise the
+    distance is Euclidean in the units of the coordinates ('' for indices).
+    """
+    if units is None: steps = meshtools.greatCircleDistance(xCross[:-1], yCross[:-1], xCross[1:], yCross[1:]); units = 'km'
+    else: steps = np.hypot( np.diff(xCross), np.diff(yCross) )
+    self.edges = np.append( 0., np.cumsum(steps) )
+    self.values = 0.5*( self.edges[:-1] + self.edges[1:] )
+    self.name = 'distance'
+    self.units = units
+    self.label = 'Distance along section (%s)'%units if units else 'Distance along section'
+    self.len = len(self.values)
+    self.initialLen = self.len
+    self.lenInFile = self.len
+    self.slice1 = slice(0, self.len)
+    self.slice2 = None
+    self.limits = (self.edges[0], self.edges[-1])
+    self.isZaxis = False
+    self.positiveDown = None
+    self.isUnlimited = False
+  def getData(self, forceRead=False):
+    """
+    Nothing to read since the values are computed
+    """
+    pass
+
+
+def readHorizontalMesh(var, args):
+  """
+  Returns the vertex coordinates of the cells of the last two dimensions of var, from the super-grid
+  or ocean_static file if given, otherwise from the dimension variables.
+  """
+  hDims = netcdfSlices(var)[0].allDims[-2:]
+  if not args.supergrid is None:
+    xMesh, _ = readSGvar(args.supergrid, 'x', hDims)
+    yMesh, _ = readSGvar(args.supergrid, 'y', hDims)
+  elif not args.oceanstatic is None:
+    xMesh, _ = readOSvar(args.oceanstatic, 'geolon_c', hDims)
+    yMesh, _ = readOSvar(args.oceanstatic, 'geolat_c', hDims)
+  else:
+    for d in hDims: d.getData()
+    xMesh, yMesh = np.meshgrid( extrapCoord(hDims[1].values), extrapCoord(hDims[0].values) )
+  return np.ma.getdata(xMesh), np.ma.getdata(yMesh)
+
+
 def splitFileVarPos(string):
   """
   Split a string in form of "file,variable[...]" into three string parts
@@ -683,7 +1472,7 @@ def splitVarPos(string):
     #if len(cSplit)>1: pSpecs = cSplit[1:]
 
     #m = re.match('(\w+),?(.*)',string)
-    m = re.match('((\w+)(\([\w,]+\))?),?(.*)',string)
+    m = re.match('((\w+)(\([\w,\.\+\-]+\))?),?(.*)',string)
     if m:
       vName = m.group(1)
       if m.group(4): pSpecs = m.group(4).split(',')
@@ -695,7 +1484,7 @@ def isFunction(string):
   """
   Detects whether a string takes the form of a function, F(x,y,...)
   """
-  m = re.match('(\w+)\(([\w,]+)\)',string)
+  m = re.match('(\w+)\(([\w,\.\+\-]+)\)',string)
   if m: return True
   else: return False
 
@@ -731,14 +1520,21 @@ def isAttrEqualTo(ncObj, name, value):
 
 
 # Make an intelligent choice about which colormap to use
+def centerLimits(vmin, vmax, cutOffFrac=0.5):
+  """
+  Returns the color range vmin, vmax made symmetric about zero if it nearly is (the smaller of the
+  opposite-signed extremes is more than cutOffFrac of the larger)
+  """
+  if -vmin<vmax and -vmin/vmax>cutOffFrac: vmin=-vmax
+  elif -vmin>vmax and -vmax/vmin>cutOffFrac: vmax=-vmin
+  return vmin, vmax
+
+
 def makeGuessAboutCmap(clim=None, colormap=None):
   if clim:
     vmin, vmax = clim[0], clim[1]
   else:
-    vmin, vmax = plt.gci().get_clim()
-    cutOffFrac = 0.5
-    if -vmin<vmax and -vmin/vmax>cutOffFrac: vmin=-vmax
-    elif -vmin>vmax and -vmax/vmin>cutOffFrac: vmax=-vmin
+    vmin, vmax = centerLimits( *plt.gci().get_clim() )
   if vmin==vmax:
     if debug: print('vmin,vmax=',vmin,vmax)
     vmin = vmin - 1; vmax = vmax + 1
@@ -822,6 +1618,144 @@ def extrapElevation(elev):
   return newElev
 
 
+@profiling.timed('mesh')
+def drawMesh(axis, xCoord, yCoord, zData, lod='mean', raster=False, gridKey=None, **kwargs):
+  """
+  Draws zData with the given vertex coordinates on axis and returns the artist and the data drawn.
+  Uniformly spaced 1D coordinates are drawn as an image, as are 2D coordinates resampled to a raster
+  if raster is True, otherwise a pcolormesh is drawn at the level of detail of the axes. The artist
+  becomes the current image. gridKey identifies the coordinates for drawRaster(), if not None.
+  """
+  if raster and xCoord.ndim==2:
+    artist, zData = drawRaster(axis, xCoord, yCoord, zData, gridKey=gridKey, **kwargs)
+  elif isUniform(xCoord) and isUniform(yCoord):
+    if debug: print('drawMesh: using imshow for uniform %ix%i grid'%zData.shape)
+    artist = axis.imshow(zData, extent=(xCoord[0], xCoord[-1], yCoord[0], yCoord[-1]), origin='lower',
+                         aspect='auto', interpolation='nearest', **kwargs)
+  else:
+    xCoord, yCoord, zData = levelOfDetail(xCoord, yCoord, zData, method=lod, axis=axis)
+    artist = axis.pcolormesh(xCoord, yCoord, zData, **kwargs)
+  plt.sci(artist)
+  return artist, zData
+
+
+def drawRaster(axis, xCoord, yCoord, zData, gridKey=None, **kwargs):
+  """
+  Draws zData on the curvilinear mesh with 2D vertex coordinates as an image, sampled by nearest-cell
+  lookup at the centers of a regular raster with the pixel density of axis. Returns the artist and the
+  raster data. If gridKey (e.g. from gridCacheKey()) identifies the coordinates, the lookup table is
+  cached under it and the size of the raster, without hashing the coordinates, so that each frame of an
+  animation is a single gather.
+  """
+  bbox = axis.get_window_extent()
+  nx = max(2, int(bbox.width)); ny = max(2, int(bbox.height))
+  def lookup():
+    x0, x1 = np.amin(xCoord), np.amax(xCoord); y0, y1 = np.amin(yCoord), np.amax(yCoord)
+    xRaster = x0 + (np.arange(nx) + 0.5) * (x1 - x0) / nx # Pixel centers
+    yRaster = y0 + (np.arange(ny) + 0.5) * (y1 - y0) / ny
+    return meshtools.rasterLookup(xCoord, yCoord, xRaster, yRaster), np.array([x0, x1, y0, y1])
+  index, (x0, x1, y0, y1) = diskCache('raster', (xCoord, yCoord), lookup,
+                                      key=None if gridKey is None else (gridKey, nx, ny))
+  zRaster = np.ma.masked_array( np.ma.getdata(zData).ravel()[index],
+                                mask=(index<0) | np.ma.getmaskarray(zData).ravel()[index] )
+  if debug: print('drawRaster: resampled %ix%i to %ix%i'%(zData.shape+(ny, nx)))
+  artist = axis.imshow(zRaster, extent=(x0, x1, y0, y1), origin='lower',
+                       aspect='auto', interpolation='nearest', **kwargs)
+  return artist, zRaster
+
+
+_cache = collections.OrderedDict() # Results of diskCache() already loaded in this process, least recently used first
+_cacheEntries = 16 # Number of results kept in _cache
+
+
+def diskCache(kind, inputs, compute, key=None):
+  """
+  Returns the array, or tuple of arrays, computed by compute(), which depends only on the arrays in
+  the tuple inputs, reusing a result saved by a previous call with the same kind and inputs if there is one. Results
+  are kept in memory, for the last _cacheEntries calls, and in .npz files in cacheDirectory(). If key (a tuple of
+  strings and numbers, e.g. from gridCacheKey()) is given, it identifies the inputs in place of hashing them.
+  """
+  digest = hashlib.sha1(kind.encode())
+  if key is not None: digest.update(repr(key).encode())
+  else:
+    for a in inputs:
+      a = np.ascontiguousarray(a)
+      digest.update(str((a.dtype.str, a.shape)).encode()); digest.update(a.tobytes())
+  key = kind + '-' + digest.hexdigest()
+  if key in _cache:
+    _cache.move_to_end(key)
+    return _cache[key]
+  fileName = os.path.join(cacheDirectory(), key + '.npz')
+  try:
+    with np.load(fileName) as f:
+      if 'result' in f.files: result = f['result']
+      else: result = tuple( f['arr_%i'%n] for n in range(len(f.files)) )
+    if debug: print('diskCache: read',fileName)
+  except (IOError, OSError, KeyError, ValueError):
+    result = compute()
+    try: # Write then rename so that concurrent processes never see a partial file
+      if not os.path.isdir(cacheDirectory()): os.makedirs(cacheDirectory())
+      fd, tmpName = tempfile.mkstemp(suffix='.npz', dir=cacheDirectory())
+      with os.fdopen(fd, 'wb') as f:
+        if isinstance(result, tuple): np.savez(f, *result)
+        else: np.savez(f, result=result)
+      os.rename(tmpName, fileName)
+      if debug: print('diskCache: wrote',fileName)
+    except (IOError, OSError): pass # Caching is an optimization only
+  _cache[key] = result
+  while len(_cache)>_cacheEntries: _cache.popitem(last=False)
+  return result
+
+
+def cacheDirectory():
+  """
+  Returns the directory in which diskCache() saves results, given by the environment variable
+  PYGVTOOLS_CACHE or ~/.cache/pyGVtools by default.
+  """
+  return os.environ.get('PYGVTOOLS_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'pyGVtools'))
+
+
+def isUniform(coord, tolerance=0.01):
+  """
+  Returns True if coord is a 1D coordinate whose values are all within tolerance (a fraction of
+  the mean spacing) of uniformly spaced positions.
+  """
+  if coord.ndim!=1 or len(coord)<2 or coord[-1]==coord[0]: return False
+  uniform = np.linspace(coord[0], coord[-1], len(coord))
+  return np.max( np.abs(coord - uniform) ) <= tolerance * abs(coord[-1] - coord[0]) / (len(coord) - 1)
+
+
+def levelOfDetail(xCoord, yCoord, zData, method='mean', axis=None):
+  """
+  Returns vertex coordinates and data coarsened to about the pixel density of the axes (default is
+  the current axes), so that pcolormesh does not build more quads than can be seen.
+  """
+  if method=='none': return xCoord, yCoord, zData
+  if axis is None: axis = plt.gca()
+  nj, ni = zData.shape
+  bbox = axis.get_window_extent()
+  fj = max(1, int( nj/max(bbox.height, 1.) ))
+  fi = max(1, int( ni/max(bbox.width, 1.) ))
+  if fj==1 and fi==1: return xCoord, yCoord, zData
+  zData = m6toolbox.coarsen(zData, fj, fi, method=method)
+  if debug: print('levelOfDetail: reduced %ix%i to %ix%i by factors %i,%i (%s)'%(nj, ni, zData.shape[0], zData.shape[1], fj, fi, method))
+  xCoord, yCoord = coarsenMesh(xCoord, yCoord, fj, fi)
+  return xCoord, yCoord, zData
+
+
+def coarsenMesh(xCoord, yCoord, fj, fi):
+  """
+  Returns 1D or 2D vertex coordinates coarsened by factors fj and fi, consistent with m6toolbox.coarsen()
+  """
+  if xCoord.ndim==1:
+    xCoord = m6toolbox.coarsenVertices(xCoord, fi)
+    yCoord = m6toolbox.coarsenVertices(yCoord, fj)
+  else:
+    xCoord = m6toolbox.coarsenVertices( m6toolbox.coarsenVertices(xCoord, fi, axis=-1), fj, axis=-2)
+    yCoord = m6toolbox.coarsenVertices( m6toolbox.coarsenVertices(yCoord, fi, axis=-1), fj, axis=-2)
+  return xCoord, yCoord
+
+
 def setFigureSize(aspect, verticalResolution):
   """
   Set the figure size based on vertical resolution and aspect ratio
@@ -831,11 +1765,14 @@ def setFigureSize(aspect, verticalResolution):
   plt.figure(figsize=(width/100., verticalResolution/100.)) # 100 dpi always?
 
 
+@profiling.timed('read grid')
 def readSGvar(fileName, varName, varDims):
   """
   Read a variable from a super-grid file, which is usually at twice the resolution of
-  the model grid.
+  the model grid. Each variable and range is read once per process (see _gridCache).
   """
+  key = gridCacheKey(fileName, varName, varDims)
+  if key in _gridCache: return _gridCache[key]
   try: rg = Dataset(fileName,'r')
   except:
     if os.path.isfile(fileName): raise MyError('There was a problem opening "'+fileName+'".')
@@ -855,26 +1792,87 @@ def readSGvar(fileName, varName, varDims):
       else: yVarDim = d
   xSlice1 = slice(xVarDim.slice1.start*2, xVarDim.slice1.stop*2+1, 2)
   ySlice1 = slice(yVarDim.slice1.start*2, yVarDim.slice1.stop*2+1, 2)
+  vh = iotrace.wrap(rg.variables[varName], fileName, 'readSGvar')
   if xVarDim.slice2 is None:
-    cData = rg.variables[varName][ySlice1,xSlice1]
+    cData = vh[ySlice1,xSlice1]
   else:
     xSlice2 = slice(xVarDim.slice2.start*2+1, xVarDim.slice2.stop*2+1, 2)
     ySlice2 = slice(yVarDim.slice1.start*2, yVarDim.slice1.stop*2+1, 2)
-    cData1 = rg.variables[varName][ySlice1,xSlice1]
-    cData2 = rg.variables[varName][ySlice2,xSlice2]
+    cData1 = vh[ySlice1,xSlice1]
+    cData2 = vh[ySlice2,xSlice2]
     if varName=='x': cData2 = cData2 + 361.
     cData = np.append( cData1, cData2, axis=1)
   cMin = np.min( cData[:,0] ); cMin = min( cMin, np.min( cData[:,-1] ) )
   cMin = min( cMin, np.min( cData[0,:] ) ); cMin = min( cMin, np.min( cData[-1,:] ) )
   cMax = np.max( cData[:,0] ); cMax = max( cMax, np.max( cData[:,-1] ) )
   cMax = max( cMax, np.max( cData[0,:] ) ); cMax = max( cMax, np.max( cData[-1,:] ) )
-  return cData, (cMin, cMax)
+  return cacheGrid(key, [cData], (cData, (cMin, cMax)))
+
+
+_gridCache = {} # Coordinates and cell areas already read by readSGvar(), readOSvar() and readCellArea()
+
+
+def gridCacheKey(fileName, name, varDims):
+  """
+  Returns the key in _gridCache of variable name in the grid file fileName over the ranges of varDims, or None
+  if fileName does not exist. The key includes the size and time of the file so that a changed file is read again.
+  """
+  try: stat = os.stat(fileName)
+  except OSError: return None
+  def sliceKey(s): return None if s is None else (s.start, s.stop, s.step)
+  return (os.path.realpath(fileName), stat.st_size, stat.st_mtime, name,
+          tuple( (d.lenInFile, sliceKey(d.slice1), sliceKey(d.slice2)) for d in varDims ))
+
+
+def cacheGrid(key, arrays, result):
+  """
+  Stores result, which contains the read-only numpy arrays, in _gridCache under key and returns it
+  """
+  for a in arrays: a.flags.writeable = False # Shared by all callers, so must not be changed in place
+  if key is not None: _gridCache[key] = result
+  return result
 
 
+@profiling.timed('read cell area')
+def readCellArea(var, args):
+  """
+  Returns the area of the cells of the last two dimensions of var, from the super-grid or ocean_static
+  file if given, or None if neither is given, var is not a horizontal field or the file has no matching
+  areas. Areas, or their absence, are looked up once per process for each range of cells (see _gridCache).
+  """
+  if args.supergrid is None and args.oceanstatic is None: return None
+  if var.rank<2 or var.dims[-1].isZaxis or var.dims[-2].isZaxis: return None
+  if not hasattr(var, 'allDims') or not var.allDims[-1] in var.dims or not var.allDims[-2] in var.dims: return None
+  yDim, xDim = var.allDims[-2:]
+  key = gridCacheKey(args.supergrid or args.oceanstatic, 'area', [yDim, xDim])
+  if key in _gridCache: return _gridCache[key]
+  with Dataset(args.supergrid or args.oceanstatic, 'r') as rg:
+    if args.supergrid is not None:
+      if not 'area' in rg.variables or 2*yDim.lenInFile!=len(rg.dimensions['ny']) or 2*xDim.lenInFile!=len(rg.dimensions['nx']):
+        return cacheGrid(key, [], None)
+      vh = iotrace.wrap(rg.variables['area'], args.supergrid, 'readCellArea')
+      def read(ySlice, xSlice): # Sum of the 2x2 super-grid cells in each cell
+        (j0, j1, _), (i0, i1, _) = ySlice.indices(yDim.lenInFile), xSlice.indices(xDim.lenInFile)
+        a = vh[2*j0:2*j1, 2*i0:2*i1]
+        return a[0::2,0::2] + a[1::2,0::2] + a[0::2,1::2] + a[1::2,1::2]
+    else:
+      names = [ v for v in ('areacello', 'area_t') if v in rg.variables ]
+      if not names or rg.variables[names[0]].shape!=(yDim.lenInFile, xDim.lenInFile): return cacheGrid(key, [], None)
+      vh = iotrace.wrap(rg.variables[names[0]], args.oceanstatic, 'readCellArea')
+      def read(ySlice, xSlice): return vh[ySlice, xSlice]
+    area = read(yDim.slice1, xDim.slice1)
+    if xDim.slice2 is not None: area = np.ma.append(area, read(yDim.slice1, xDim.slice2), axis=1)
+  return cacheGrid(key, [area], area)
+
+
+@profiling.timed('read grid')
 def readOSvar(fileName, varName, varDims):
   """
   Read a variable from an ocean_static file, which migh require extrapolation of corner data.
+  Each variable and range is read once per process (see _gridCache).
   """
+  key = gridCacheKey(fileName, varName, varDims)
+  if key in _gridCache: return _gridCache[key]
   try: rg = Dataset(fileName,'r')
   except:
     if os.path.isfile(fileName): raise MyError('There was a problem opening "'+fileName+'".')
@@ -894,13 +1892,14 @@ def readOSvar(fileName, varName, varDims):
       else: yVarDim = d
   xSlice1 = slice(xVarDim.slice1.start, xVarDim.slice1.stop)
   ySlice1 = slice(yVarDim.slice1.start, yVarDim.slice1.stop)
+  vh = iotrace.wrap(rg.variables[varName], fileName, 'readOSvar')
   if xVarDim.slice2 is None:
-    cData = rg.variables[varName][ySlice1,xSlice1]
+    cData = vh[ySlice1,xSlice1]
   else:
     xSlice2 = slice(xVarDim.slice2.start, xVarDim.slice2.stop)
     ySlice2 = slice(yVarDim.slice1.start, yVarDim.slice1.stop)
-    cData1 = rg.variables[varName][ySlice1,xSlice1]
-    cData2 = rg.variables[varName][ySlice2,xSlice2]
+    cData1 = vh[ySlice1,xSlice1]
+    cData2 = vh[ySlice2,xSlice2]
     if varName=='geolon_c': cData2 = cData2 + 361.
     cData = np.append( cData1, cData2, axis=1)
   if varName=='geolon_c':
@@ -916,7 +1915,16 @@ def readOSvar(fileName, varName, varDims):
   cMin = min( cMin, np.min( cData[0,:] ) ); cMin = min( cMin, np.min( cData[-1,:] ) )
   cMax = np.max( cData[:,0] ); cMax = max( cMax, np.max( cData[:,-1] ) )
   cMax = max( cMax, np.max( cData[0,:] ) ); cMax = max( cMax, np.max( cData[-1,:] ) )
-  return cData, (cMin, cMax)
+  return cacheGrid(key, [cData], (cData, (cMin, cMax)))
+
+
+def enableThreadedReads(newValue=True):
+  """
+  Sets the global parameter "threadedReads" that controls whether the arguments of functions are read in
+  concurrent threads, for scripts that import gplot.py.
+  """
+  global threadedReads
+  threadedReads = newValue
 
 
 def enableDebugging(newValue=True):
@@ -929,6 +1937,85 @@ def enableDebugging(newValue=True):
 
 
 def unittests(args):
+  class Options: ignore = [0.]; ignorelt = None; ignoregt = [5.]; scale = [2.]; offset = [-1.]; log10 = True
+  data = np.ma.masked_array([0., 1., 2., 3., 6., -1.], mask=[0, 0, 1, 0, 0, 0])
+  seen = []
+  result = compileTransforms(Options())(data, inspect=lambda d: seen.append(d.copy()))
+  print('transform: inspected', seen[0], 'result', result)
+  print('transform: masks propagate?', list(np.ma.getmaskarray(result))==[True, False, True, False, True, True],
+        'values?', np.allclose(result.compressed(), np.log10([1., 5.])))
+  data = np.arange(4, dtype=np.int16)
+  Options.ignore = None; Options.ignoregt = None; Options.log10 = False
+  print('transform: integer data', compileTransforms(Options())(data), 'unchanged', data)
+  import gcompare # Imported here, since gcompare imports gplot
+  class Var: rank = 1
+  varA, varB = Var(), Var()
+  varA.data = np.ma.masked_array([0., 1., 2., 7., 3.], mask=[0, 0, 0, 0, 1])
+  varB.data = np.ma.masked_array([1., 0., 2., 2., 1.])
+  Options.ignore = [0.]; Options.ignoregt = [5.]
+  varDiff, _ = gcompare.difference(varA, varB, Options())
+  print('difference: A-B', varDiff.data, 'masks of A and B propagate?',
+        list(np.ma.getmaskarray(varDiff.data))==[True, True, False, True, True], 'A unchanged?', varA.data[0]==0.)
+  distance = TrackDim(np.array([0., 3., 3.]), np.array([0., 4., 5.]), units='')
+  print('TrackDim: Euclidean edges', distance.edges, distance.label, 'great circle edges',
+        TrackDim(np.array([0., 0.]), np.array([0., 1.])).edges, TrackDim(np.array([0., 0.]), np.array([0., 1.])).label)
+  directory = tempfile.mkdtemp() # Time series of a file whose time has a long_name that is not its name
+  with Dataset(os.path.join(directory, 'series.nc'), 'w') as rg:
+    rg.createDimension('time', None); rg.createDimension('y', 2); rg.createDimension('x', 3)
+    rg.createVariable('time', 'f8', ('time',)).setncatts({'long_name': 'Model Time', 'units': 'days since 0001-01-01'})
+    rg.variables['time'][:] = [1., 2.]
+    rg.createVariable('SSH', 'f4', ('time', 'y', 'x'))[:] = np.arange(12.).reshape(2, 2, 3)
+  class Series: jobs = 1; supergrid = None; oceanstatic = None
+  for output in ('series.csv', 'out.nc'):
+    Series.output = os.path.join(directory, output)
+    with Dataset(os.path.join(directory, 'series.nc'), 'r') as rg: timeSeries(rg.filepath(), NetcdfSlice(rg, 'SSH', None), Series)
+  with open(os.path.join(directory, 'series.csv')) as f: header = f.readline().strip()
+  with Dataset(os.path.join(directory, 'out.nc'), 'r') as rg:
+    print('timeSeries: csv header', header, 'dimensions', list(rg.dimensions), 'long_name', rg.variables['time'].long_name,
+          'means', rg.variables['SSH_mean'][:])
+  _timeSeriesFiles.pop(os.path.join(directory, 'series.nc')).close()
+  for f in os.listdir(directory): os.remove(os.path.join(directory, f))
+  os.rmdir(directory)
+  fileName, variableName, _ = splitFileVarPos(args.file_var_slice)
+  if variableName is not None and not isFunction(variableName):
+    native, _, _ = nccf.readVar(fileName, variableName, dtype='native')
+    double, _, _ = nccf.readVar(fileName, variableName)
+    print('readVar: native', native.dtype, 'float64', double.dtype, 'max difference',
+          np.ma.max(np.abs(native-double)), 'masks equal?', np.all(native.mask==double.mask))
+    vh = Dataset(fileName, 'r').variables[variableName]
+    mapped = nccf.memmapVariable(vh, fileName)
+    if mapped is None: print('memmapVariable: %s is not stored contiguously and uncompressed'%variableName)
+    else:
+      for key in [ slice(None), (0, slice(1, 3)), (Ellipsis, [0, 2]) ]:
+        print('memmapVariable: [%s] equals netCDF4?'%(key,), np.ma.allequal(mapped[key], vh[key]),
+              'masks equal?', np.all(np.ma.getmaskarray(mapped[key])==np.ma.getmaskarray(vh[key])))
+    rg = Dataset(fileName, 'r')
+    var1 = NetcdfSlice(rg, variableName, None); var2 = NetcdfSlice(rg, variableName, None)
+    for d1, d2 in zip(var1.allDims, var2.allDims):
+      d1.getData(); d2.getData()
+      if d1.dimensionVariableHandle is not None:
+        print('readCoordinate: %s shared?'%d1.dimensionName, np.shares_memory(d1.values, d2.values),
+              'equals netCDF4?', np.ma.allequal(d1.values, rg.variables[d1.dimensionName][d1.slice1]))
+    saved = os.path.join(tempfile.mkdtemp(), 'slice.nc')
+    saveSlice(var1, saved)
+    with Dataset(saved, 'r') as out:
+      print('saveSlice: %s equals netCDF4?'%variableName, np.ma.allequal(out.variables[variableName][:], rg.variables[variableName][:]),
+            'dimensions', out.variables[variableName].dimensions)
+      kept = all( out.variables[d].getncattr(a)==rg.variables[d].getncattr(a) for d in out.variables[variableName].dimensions
+                  if d in rg.variables and d in out.variables for a in rg.variables[d].ncattrs() if not a in _skippedAttributes )
+      print('saveSlice: coordinate attributes kept?', kept)
+    if 'e' in rg.variables and rg.variables[variableName].ndim==4 and rg.variables['e'].ndim==4:
+      global global_eVar
+      eVar = NetcdfSlice(rg, 'e', None); global_eVar = eVar
+      saveSlice(FnSlice(rg, 'xave(%s)'%variableName, None), saved, elevation=eVar) # Streamed one record at a time
+      global_eVar = None
+      with Dataset(saved, 'r') as out:
+        xave = out.variables['xave_%s'%variableName]
+        expected, _, _ = m6toolbox.axisAverage(rg.variables[variableName][-1], z=rg.variables['e'][-1])
+        print('saveSlice: xave(%s) with elevation'%variableName, xave.shape, 'last record equals axisAverage?',
+              np.ma.allclose(xave[-1], expected))
+    os.remove(saved); os.rmdir(os.path.dirname(saved))
+    rg.close()
   print(splitFileVarPos('file.nc'))
   print(splitFileVarPos('file.nc,variable'))
   print(splitFileVarPos('file.nc,variable,:'))
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+# Try to import required packages/modules
+import os
+try: import argparse
+except: raise Exception('This version of python is not new enough. python 2.7 or newer is required.')
+try: import numpy as np
+except: raise Exception('Unable to import numpy module. Check your PYTHONPATH.\n'
+          +'Perhaps try:\n   module load python_numpy')
+
+# Import stand alone (static) functions
+import nccf
+import m6toolbox
+
+debug = False # Global debugging
+
+
+def parseCommandLine():
+  """
+  Parse the command line positional and optional arguments.
+  This is the highest level procedure invoked from the very end of the script.
+  """
+
+  # Arguments
+  parser = argparse.ArgumentParser(description=
+      '''
+      gpyramid.py creates an overview file containing coarsened copies of 2-D (or higher rank)
+      variables, which gplot.py uses to draw large fields without reading them at full resolution.
+      Each level is a masked-aware block average of the full resolution data over the last two
+      dimensions.
+      ''',
+      epilog='Written by the pyGVtools developers.')
+  parser.add_argument('file', type=str,
+      help='The netCDF file containing the variables.')
+  parser.add_argument('variables', type=str, nargs='+',
+      help='The variables to coarsen.')
+  parser.add_argument('-o','--output', type=str, default=None,
+      help='''Name of overview file to create. The default is the sidecar file that gplot.py looks for,
+      e.g. FILE.pyramid.nc for FILE.nc.''')
+  parser.add_argument('-f','--factors', type=int, nargs='+', default=[2, 4, 8],
+      help='The coarsening factors of each level. Default is 2 4 8.')
+  parser.add_argument('-d','--debug', action='store_true',
+      help='Turn on debugging information.')
+  optCmdLineArgs = parser.parse_args()
+
+  if optCmdLineArgs.debug: enableDebugging()
+
+  outFile = optCmdLineArgs.output
+  if outFile is None: outFile = nccf.sidecarFileName(optCmdLineArgs.file, 'pyramid')
+  createPyramid(optCmdLineArgs.file, optCmdLineArgs.variables, outFile, optCmdLineArgs.factors)
+
+
+def createPyramid(fileName, variableNames, outFileName, factors=[2, 4, 8]):
+  """
+  Writes the levels of each variable in variableNames, coarsened by each of factors, to outFileName.
+
+  Level variables are named VARIABLE_Fx and their last two dimensions DIMENSION_Fx, where F is the
+  factor. Other dimensions are shared with the original file. Data are streamed one record (and
+  one 2-D slab) at a time so memory use is bounded by the size of a 2-D slab.
+  """
+
+  rg = nccf.openNetCDFfileForReading(fileName)
+  out = nccf.openNetCDFfileForWriting(outFileName)
+  nccf.write(out, attributes={'pyramid_source':os.path.basename(fileName),
+                              'pyramid_factors':np.array(factors, dtype='i4')})
+
+  for variableName in variableNames:
+    if not variableName in rg.variables:
+      raise Exception('Did not find "'+variableName+'" in file "'+fileName+'".')
+    vh = rg.variables[variableName]
+    if vh.ndim<2: raise Exception('Variable "'+variableName+'" has fewer than two dimensions.')
+    if debug: print('createPyramid: variable',variableName,vh.dimensions,vh.shape)
+
+    # Dimensions that are not coarsened are copied once
+    leadDims = vh.dimensions[:-2]
+    for d in leadDims: copyDimension(rg, out, d)
+    unlimited = len(leadDims)>0 and rg.dimensions[leadDims[0]].isunlimited()
+
+    # Coordinates of each level
+    for f in factors:
+      for d in vh.dimensions[-2:]: coarsenDimension(rg, out, d, f)
+
+    attributes = {}
+    for a in vh.ncattrs(): attributes[a] = vh.getncattr(a)
+    if vh.dtype.kind=='f': dataType = vh.dtype
+    else: dataType = 'f4'
+    fillValue = attributes.get('_FillValue', attributes.get('missing_value', None))
+    if fillValue is None: fillValue = 1.e20
+
+    # Stream over records
+    if unlimited: records = list(range(vh.shape[0]))
+    else: records = [None]
+    for n in records:
+      if n is None: shape = vh.shape[:-2]
+      else: shape = vh.shape[1:-2]
+      levels = {}
+      for f in factors:
+        levels[f] = np.ma.zeros(shape+(-(-vh.shape[-2]//f), -(-vh.shape[-1]//f)), dtype=dataType)
+      for k in np.ndindex(*shape):
+        if n is None: slab = vh[k]
+        else: slab = vh[(n,)+k]
+        for f in factors: levels[f][k] = m6toolbox.coarsen(slab, f, f)
+      for f in factors:
+        levelAttributes = dict(attributes)
+        levelAttributes['pyramid_source'] = variableName
+        levelAttributes['pyramid_factor'] = np.int32(f)
+        nccf.write(out, levelName(variableName, f), levels[f],
+            dimensions=list(leadDims)+[levelName(d, f) for d in vh.dimensions[-2:]],
+            attributes=levelAttributes, dataType=dataType, fillValue=fillValue, record=n, zlib=True, chunksizes='map')
+      if debug: print('createPyramid: wrote record',n,'of',variableName)
+
+  out.close()
+  rg.close()
+
+
+def levelName(name, factor):
+  """
+  Returns the name of a variable or dimension in the level coarsened by factor.
+  """
+  return '%s_%ix'%(name, factor)
+
+
+def copyDimension(rg, out, dimensionName):
+  """
+  Copies a dimension, and its coordinate variable if any, from rg to out.
+  """
+  if dimensionName in out.dimensions: return
+  dh = rg.dimensions[dimensionName]
+  if not dimensionName in rg.variables:
+    if dh.isunlimited(): out.createDimension(dimensionName, None)
+    else: out.createDimension(dimensionName, len(dh))
+    return
+  ch = rg.variables[dimensionName]
+  attributes = {}
+  for a in ch.ncattrs(): attributes[a] = ch.getncattr(a)
+  if dh.isunlimited():
+    nccf.write(out, dimensionName, dimensions={dimensionName:None}, attributes=attributes)
+    out.variables[dimensionName][:] = ch[:]
+  else:
+    nccf.write(out, dimensionName, np.asarray(ch[:]), dimensions=[dimensionName], attributes=attributes)
+
+
+def coarsenDimension(rg, out, dimensionName, factor):
+  """
+  Writes the coordinate of dimensionName coarsened by factor to out, using block averages of the
+  coordinate values, or of indices (counting from 1) if there is no coordinate variable.
+  """
+  name = levelName(dimensionName, factor)
+  if name in out.dimensions: return
+  n = len(rg.dimensions[dimensionName])
+  attributes = {}
+  if dimensionName in rg.variables:
+    ch = rg.variables[dimensionName]
+    values = np.asarray(ch[:], dtype=np.float64)
+    for a in ch.ncattrs(): attributes[a] = ch.getncattr(a)
+  else: values = np.arange(n) + 1.
+  start = np.arange(0, n, factor)
+  values = np.add.reduceat(values, start) / np.diff( np.append(start, n) )
+  attributes['pyramid_factor'] = np.int32(factor)
+  nccf.write(out, name, values, dimensions=[name], attributes=attributes)
+
+
+def enableDebugging(newValue=True):
+  """
+  Sets the global parameter "debug" to control debugging information.
+  """
+  global debug
+  debug = newValue
+
+
+# Invoke parseCommandLine(), the top-level prodedure
+if __name__ == '__main__': parseCommandLine()
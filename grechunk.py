@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+
+# Try to import required packages/modules
+try: import argparse
+except: raise Exception('This version of python is not new enough. python 2.7 or newer is required.')
+
+# Import stand alone (static) functions
+import nccf
+
+
+def parseCommandLine():
+  """
+  Parse the command line positional and optional arguments.
+  This is the highest level procedure invoked from the very end of the script.
+  """
+
+  # Arguments
+  parser = argparse.ArgumentParser(description=
+      '''
+      grechunk.py writes a copy of variables chunked along time: each chunk holds all the records of a
+      small tile of the horizontal dimensions, so that gplot.py reads the time series of a point, or a
+      (time, y) Hovmoller diagram, without decompressing every record of the original file.
+      ''',
+      epilog='Written by the pyGVtools developers.')
+  parser.add_argument('file', type=str,
+      help='The netCDF file containing the variables.')
+  parser.add_argument('variables', type=str, nargs='+',
+      help='The variables to copy.')
+  parser.add_argument('-o','--output', type=str, default=None,
+      help='''Name of the file to create. The default is the sidecar file that gplot.py looks for,
+      e.g. FILE.tchunk.nc for FILE.nc.''')
+  parser.add_argument('--chunkmb', type=float, default=4.,
+      help='Uncompressed size of each chunk in MB. Default is 4.')
+  parser.add_argument('--memorymb', type=float, default=256.,
+      help='Approximate memory used while copying, in MB. Default is 256.')
+  parser.add_argument('--complevel', type=int, default=4,
+      help='zlib compression level, 0 for none. Default is 4.')
+  parser.add_argument('-d','--debug', action='store_true',
+      help='Turn on debugging information.')
+  optCmdLineArgs = parser.parse_args()
+
+  if optCmdLineArgs.debug: nccf.enableDebugging()
+
+  outFile = nccf.rechunk(optCmdLineArgs.file, optCmdLineArgs.variables, outFileName=optCmdLineArgs.output,
+      chunkBytes=int(optCmdLineArgs.chunkmb*2**20), memoryBytes=int(optCmdLineArgs.memorymb*2**20),
+      complevel=optCmdLineArgs.complevel)
+  print('Wrote',outFile)
+
+
+# Invoke parseCommandLine(), the top-level prodedure
+if __name__ == '__main__': parseCommandLine()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+"""
+Optional tracing of every read from netCDF variables, and a summariser of the trace.
+
+Tracing is enabled by enable(fileName), or by setting the environment variable PYGVTOOLS_IOTRACE to the
+name of the trace file, to which each tool that is run then appends. wrap() then returns a TracedVariable that appends a line of JSON per read to
+the trace, giving the file, variable, caller, hyperslab, shape, bytes and wall time. When tracing is not
+enabled, wrap() returns the variable itself so there is no cost.
+
+Summarize a trace with:
+  iotrace.py TRACEFILE
+"""
+
+import os
+import json
+import argparse
+import timeit
+import numpy as np
+
+_traceFile = None # Open trace file, if enabled
+
+
+def enable(fileName, append=False):
+  """
+  Starts tracing reads to fileName, replacing any existing trace unless append is True
+  """
+  global _traceFile
+  if _traceFile is not None: _traceFile.close()
+  _traceFile = open(fileName, 'a' if append else 'w')
+
+
+def enabled():
+  """
+  Returns True if reads are being traced
+  """
+  return _traceFile is not None
+
+
+def groupFileName(rootGroup):
+  """
+  Returns the name of the file of rootGroup (a netCDF4.Dataset), or of the first of the files of a
+  netCDF4.MFDataset followed by "+"
+  """
+  files = getattr(rootGroup, '_files', None)
+  if files: return str(files[0]) + '+'
+  try: return rootGroup.filepath()
+  except Exception: return '?'
+
+
+def wrap(variable, fileName, caller):
+  """
+  Returns variable (a netCDF4.Variable or anything indexed like one) wrapped so that its reads are traced
+  and attributed to caller, or variable itself if tracing is not enabled
+  """
+  if _traceFile is None or variable is None or isinstance(variable, TracedVariable): return variable
+  return TracedVariable(variable, fileName, caller)
+
+
+class TracedVariable:
+  """
+  Class passing indexing and attributes through to a variable while recording each read in the trace
+  """
+  def __init__(self, variable, fileName, caller):
+    self.variable = variable
+    self.fileName = fileName
+    self.caller = caller
+  def __getattr__(self, name):
+    return getattr(self.variable, name)
+  def __len__(self):
+    return len(self.variable)
+  def __getitem__(self, key):
+    start = timeit.default_timer()
+    data = self.variable[key]
+    elapsed = timeit.default_timer() - start
+    shape = list(np.shape(data))
+    record = {'file': self.fileName, 'var': getattr(self.variable, 'name', '?'), 'caller': self.caller,
+              'slab': hyperslab(key, self.variable.shape), 'shape': shape,
+              'bytes': int(np.prod(shape)) * np.dtype(getattr(data, 'dtype', np.float64)).itemsize,
+              'seconds': round(elapsed, 7)}
+    _traceFile.write(json.dumps(record, separators=(',', ':')) + '\n')
+    _traceFile.flush()
+    return data
+
+
+def hyperslab(key, shape):
+  """
+  Returns a compact, comparable description of the index key into an array of the given shape: a list
+  with, for each dimension, [start, stop, step] for slices and integers, or the list of indices
+  """
+  if isinstance(key, list) and any( isinstance(k, slice) for k in key ): key = tuple(key)
+  if not isinstance(key, tuple): key = (key,)
+  if any( k is Ellipsis for k in key ):
+    n = key.index(Ellipsis)
+    key = key[:n] + (slice(None),)*(len(shape)-len(key)+1) + key[n+1:]
+  key = key + (slice(None),)*(len(shape)-len(key))
+  slab = []
+  for k, n in zip(key, shape):
+    if isinstance(k, slice): slab.append( list(k.indices(n)) )
+    elif np.ndim(k)==0: k = int(k) % n if n else int(k); slab.append( [k, k+1, 1] )
+    else: slab.append( [ int(i) for i in np.ravel(k) ] )
+  return slab
+
+
+def summarize(fileName, top=10):
+  """
+  Returns lines of text summarizing the trace in fileName: totals and throughput, by caller and by file,
+  the regions that were read more than once, and the slowest reads
+  """
+  records = []
+  with open(fileName) as f:
+    for line in f:
+      if line.strip(): records.append( json.loads(line) )
+  if not records: return ['No reads in %s'%fileName]
+  def rate(nBytes, seconds): return '%.1f MB/s'%(nBytes/seconds/1.e6) if seconds>0 else '-'
+  totalBytes = sum( r['bytes'] for r in records ); totalSeconds = sum( r['seconds'] for r in records )
+  lines = ['%i reads, %.3f MB in %.4f s (%s)'%(len(records), totalBytes/1.e6, totalSeconds, rate(totalBytes, totalSeconds))]
+
+  for title, key in [('caller', lambda r: r['caller']), ('file', lambda r: r['file'])]:
+    groups = {}
+    for r in records:
+      g = groups.setdefault(key(r), [0, 0, 0.])
+      g[0] += 1; g[1] += r['bytes']; g[2] += r['seconds']
+    lines.append('')
+    lines.append('%-40s %7s %12s %10s %12s'%('By '+title, 'Reads', 'Bytes', 'Seconds', 'Throughput'))
+    for name in sorted(groups, key=lambda n: -groups[n][2]):
+      n, b, s = groups[name]
+      lines.append('%-40s %7i %12i %10.4f %12s'%(name[-40:], n, b, s, rate(b, s)))
+
+  regions = {}
+  for r in records:
+    region = (r['file'], r['var'], json.dumps(r['slab']))
+    g = regions.setdefault(region, [0, 0, 0., set()])
+    g[0] += 1; g[1] += r['bytes']; g[2] += r['seconds']; g[3].add(r['caller'])
+  repeated = [ region for region in regions if regions[region][0]>1 ]
+  lines.append('')
+  if repeated:
+    wastedBytes = sum( regions[g][1] - regions[g][1]//regions[g][0] for g in repeated )
+    wastedSeconds = sum( regions[g][2] * (1. - 1./regions[g][0]) for g in repeated )
+    lines.append('%i regions were read more than once, re-reading %i bytes in %.4f s:'%(len(repeated), wastedBytes, wastedSeconds))
+    for region in sorted(repeated, key=lambda g: -regions[g][2])[:top]:
+      n, b, s, callers = regions[region]
+      lines.append('  %ix %s:%s%s %i bytes %.4f s by %s'%(n, os.path.basename(region[0]), region[1], region[2], b, s, ','.join(sorted(callers))))
+  else: lines.append('No region was read more than once')
+
+  lines.append('')
+  lines.append('Slowest reads:')
+  for r in sorted(records, key=lambda r: -r['seconds'])[:top]:
+    lines.append('  %.4f s %s:%s%s %s %i bytes (%s) by %s'%(r['seconds'], os.path.basename(r['file']), r['var'],
+                 json.dumps(r['slab']), r['shape'], r['bytes'], rate(r['bytes'], r['seconds']), r['caller']))
+  return lines
+
+
+if os.environ.get('PYGVTOOLS_IOTRACE') and __name__!='__main__': # The summarizer must not touch the trace
+  enable(os.environ['PYGVTOOLS_IOTRACE'], append=True)
+
+
+def parseCommandLine():
+  """
+  Parse the command line positional and optional arguments.
+  This is the highest level procedure invoked from the very end of the script.
+  """
+  parser = argparse.ArgumentParser(description=
+      '''
+      iotrace.py summarizes a trace of netCDF reads written by gplot.py or gcompare.py with --iotrace
+      (or with PYGVTOOLS_IOTRACE set): throughput by caller and file, regions read more than once,
+      and the slowest reads.
+      ''',
+      epilog='Written by the pyGVtools developers.')
+  parser.add_argument('trace', type=str, help='Trace file to summarize.')
+  parser.add_argument('-n', '--top', type=int, default=10, help='Number of regions and reads to list.')
+  args = parser.parse_args()
+  print('\n'.join( summarize(args.trace, top=args.top) ))
+
+
+# Invoke parseCommandLine(), the top-level prodedure
+if __name__ == '__main__': parseCommandLine()
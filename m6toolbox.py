@@ -8,7 +8,7 @@ import axisAverage as aaa
 axisAverage = aaa.axisAverage
 
 
-def section2quadmesh(x, z, q, representation='pcm'):
+def section2quadmesh(x, z, q, representation='pcm', out=None):
   """
   Creates the appropriate quadmesh coordinates to plot a scalar q(1:nk,1:ni) at
   horizontal positions x(1:ni+1) and between interfaces at z(nk+1,ni), using
@@ -16,10 +16,15 @@ def section2quadmesh(x, z, q, representation='pcm'):
 
   Returns X(2*ni+1), Z(nk+1,2*ni+1) and Q(nk,2*ni) to be passed to pcolormesh.
 
+  z and q may have leading dimensions (e.g. time), z(...,nk+1,ni) and q(...,nk,ni), in
+  which case Z and Q have the same leading dimensions. Masked values of z are drawn at
+  zero and masked values of q take the minimum of q (for each leading index). The
+  arguments are never modified.
+
   TBD: Optionally, x can be dimensioned as x(ni) in which case it will be extraplated as if it had 
   had dimensions x(ni+1).
   
-  Optional argument:
+  Optional arguments:
   
   representation='pcm' (default) yields a step-wise visualization, appropriate for
            z-coordinate models.
@@ -27,82 +32,183 @@ def section2quadmesh(x, z, q, representation='pcm'):
            of general-coordinate (and isopycnal) models.
   representation='linear' is the aesthetically most pleasing but does not
            represent the data conservatively.
+  out=(X,Z,Q) are arrays, of the shapes that would be returned, into which the results
+           are written, e.g. those returned by a previous call.
 
   """
 
   if x.ndim!=1: raise Exception('The x argument must be a vector')
-  if z.ndim!=2: raise Exception('The z argument should be a 2D array')
-  if q.ndim!=2: raise Exception('The z argument should be a 2D array')
-  qnk, qni = q.shape
-  znk, zni = z.shape
+  if z.ndim<2: raise Exception('The z argument should be a 2D array')
+  if q.ndim!=z.ndim: raise Exception('The q argument should have the same number of dimensions as z')
+  qnk, qni = q.shape[-2:]
+  znk, zni = z.shape[-2:]
   xni = x.size
+  if z.shape[:-2]!=q.shape[:-2]: raise Exception('The leading dimensions of z and q must be equal')
   if zni!=qni: raise Exception('The last dimension of z and q must be equal in length')
   if znk!=qnk+1: raise Exception('The first dimension of z must be 1 longer than that of q. q has %i levels'%qnk)
   if xni!=qni+1: raise Exception('The length of x must 1 longer than the last dimension of q')
 
-  if type( z ) == np.ma.core.MaskedArray: z[z.mask] = 0
-  if type( q ) == np.ma.core.MaskedArray: qmin = np.amin(q); q[q.mask] = qmin
-
   periodicDomain =  abs((x[-1]-x[0])-360. ) < 1e-6 # Detect if horizontal axis is a periodic domain
 
+  if representation in ('pcm', 'plm'): nX, nQ = 2*qni, 2*qni-1
+  elif representation=='linear': nX, nQ = 2*qni+1, 2*qni
+  else: raise Exception('Unknown representation!')
+  lead = z.shape[:-2]
+  if out is None:
+    X = np.empty((nX)); Z = np.empty(lead+(qnk+1,nX)); Q = np.empty(lead+(qnk,nQ))
+  else:
+    X, Z, Q = out
+    if X.shape!=(nX,) or Z.shape!=lead+(qnk+1,nX) or Q.shape!=lead+(qnk,nQ):
+      raise Exception('The out arrays have the wrong shapes')
+
+  # Copy z and q into the locations in Z and Q that take their values, filling masked values there
+  if representation=='linear': zz = Z[...,1::2]
+  else: zz = Z[...,::2]
+  zz[...] = np.ma.getdata(z)
+  if np.ma.is_masked(z): np.copyto(zz, 0, where=np.ma.getmaskarray(z))
+  qq = Q[...,::2]
+  qq[...] = np.ma.getdata(q)
+  if np.ma.is_masked(q):
+    qmin = np.ma.filled( np.ma.min(q, axis=(-2,-1)), 0 )
+    np.copyto(qq, np.reshape(qmin, lead+(1,1)), where=np.ma.getmaskarray(q))
+
   if representation=='pcm':
-    X = np.zeros((2*qni))
     X[::2] = x[:-1]
     X[1::2] = x[1:]
-    Z = np.zeros((qnk+1,2*qni))
-    Z[:,::2] = z
-    Z[:,1::2] = z
-    Q = np.zeros((qnk,2*qni-1))
-    Q[:,::2] = q
-    Q[:,1::2] = ( q[:,:-1] + q[:,1:] )/2.
+    Z[...,1::2] = zz
+    np.add( qq[...,:-1], qq[...,1:], out=Q[...,1::2] ); Q[...,1::2] *= 0.5
   elif representation=='linear':
-    X = np.zeros((2*qni+1))
     X[::2] = x
     X[1::2] = ( x[0:-1] + x[1:] )/2.
-    Z = np.zeros((qnk+1,2*qni+1))
-    Z[:,1::2] = z
-    Z[:,2:-1:2] = ( z[:,0:-1] + z[:,1:] )/2.
-    Z[:,0] = z[:,0]
-    Z[:,-1] = z[:,-1]
-    Q = np.zeros((qnk,2*qni))
-    Q[:,::2] = q
-    Q[:,1::2] = q
+    np.add( zz[...,:-1], zz[...,1:], out=Z[...,2:-1:2] ); Z[...,2:-1:2] *= 0.5
+    Z[...,0] = zz[...,0]
+    Z[...,-1] = zz[...,-1]
+    Q[...,1::2] = qq
   elif representation=='plm':
-    X = np.zeros((2*qni))
     X[::2] = x[:-1]
     X[1::2] = x[1:]
-    # PLM reconstruction for Z
-    dz = np.roll(z,-1,axis=1) - z # Right-sided difference
-    if not periodicDomain: dz[:,-1] = 0 # Non-periodic boundary
-    d2 = ( np.roll(z,-1,axis=1) - np.roll(z,1,axis=1) )/2. # Centered difference
-    d2 = ( dz + np.roll(dz,1,axis=1) )/2. # Centered difference
-    s = np.sign( d2 ) # Sign of centered slope
-    s[dz * np.roll(dz,1,axis=1) <= 0] = 0 # Flatten extrema
-    dz = np.abs(dz) # Only need magnitude from here on
-    S = s * np.minimum( np.abs(d2), np.minimum( dz, np.roll(dz,1,axis=1) ) ) # PLM slope
-    Z = np.zeros((qnk+1,2*qni))
-    Z[:,::2] = z - S/2.
-    Z[:,1::2] = z + S/2.
-    Q = np.zeros((qnk,2*qni-1))
-    Q[:,::2] = q
-    Q[:,1::2] = ( q[:,:-1] + q[:,1:] )/2.
-  else: raise Exception('Unknown representation!')
+    # PLM reconstruction for Z using the differences, dz, across the left and right edges of each column
+    dz = np.empty(lead+(qnk+1,qni+1))
+    np.subtract( zz[...,1:], zz[...,:-1], out=dz[...,1:-1] )
+    if periodicDomain: dz[...,0] = zz[...,0] - zz[...,-1]
+    else: dz[...,0] = 0 # Non-periodic boundary
+    dz[...,-1] = dz[...,0]
+    dzL = dz[...,:-1]; dzR = dz[...,1:]
+    d2 = ( dzL + dzR )/2. # Centered difference
+    S = np.sign( d2 ) # Sign of centered slope
+    S[dzL * dzR <= 0] = 0 # Flatten extrema
+    S *= np.minimum( np.abs(d2), np.minimum( np.abs(dzL), np.abs(dzR) ) ) # PLM slope
+    S *= 0.5
+    np.add( zz, S, out=Z[...,1::2] )
+    zz -= S
+    np.add( qq[...,:-1], qq[...,1:], out=Q[...,1::2] ); Q[...,1::2] *= 0.5
 
   return X, Z, Q
 
 
+def coarsen(q, fj, fi, method='mean'):
+  """
+  Returns q coarsened by the integer factors fj and fi in its last two dimensions.
+
+  Blocks at the upper end of each dimension are allowed to be partial, so the result
+  has dimensions (...,ceil(nj/fj),ceil(ni/fi)).
+
+  Optional argument:
+
+  method='mean' (default) averages the unmasked values within each block. Blocks with
+           no unmasked values are masked.
+  method='nearest' samples the value nearest the center of each block.
+  """
+
+  if q.ndim<2: raise Exception('The q argument must be at least 2D')
+  nj, ni = q.shape[-2:]
+  if method=='nearest':
+    j = np.minimum( np.arange(0, nj, fj) + fj//2, nj-1 )
+    i = np.minimum( np.arange(0, ni, fi) + fi//2, ni-1 )
+    return q[...,j,:][...,i]
+  elif method=='mean':
+    j = np.arange(0, nj, fj); i = np.arange(0, ni, fi)
+    mask = np.ma.getmaskarray(q)
+    qSum = np.add.reduceat( np.where(mask, 0., np.ma.getdata(q)), j, axis=-2, dtype=np.float64 )
+    qSum = np.add.reduceat( qSum, i, axis=-1 )
+    nSum = np.add.reduceat( np.add.reduceat( ~mask, j, axis=-2, dtype=np.float64 ), i, axis=-1 )
+    return np.ma.masked_array( qSum/np.maximum(nSum, 1.), mask=(nSum==0) )
+  else: raise Exception('Unknown method!')
+
+
+def coarsenVertices(x, f, axis=-1):
+  """
+  Returns the vertex coordinates, x, of cells coarsened by the integer factor f along an axis,
+  consistent with coarsen(). The last vertex is always retained so the coarse mesh spans the same
+  extent as the original mesh.
+  """
+
+  n = x.shape[axis]
+  return np.take( x, np.append( np.arange(0, n-1, f), n-1 ), axis=axis )
+
+
+def remapToDepth(q, e, zTop, zBottom=None):
+  """
+  Returns the layer quantity q(nk,...) between interfaces at elevations e(nk+1,...) (decreasing
+  with k) averaged over the depth range zBottom<=z<=zTop, with the result dimensioned (...).
+
+  Each layer contributes in proportion to its overlap with the range so that the average is
+  conservative. If zBottom is None, the value of q in the layer containing z=zTop is returned.
+  Points where the range does not overlap the water column (or only masked values of q) are masked.
+  """
+
+  if e.shape!=(q.shape[0]+1,)+q.shape[1:]: raise Exception('The first dimension of e must be 1 longer than that of q')
+  qMask = np.ma.getmaskarray(q); q = np.ma.getdata(q)
+  e = np.ma.filled(e, 0.)
+  if zBottom is None: # Find the layer containing zTop by counting the interfaces above it
+    k = np.minimum( np.sum( e[1:] > zTop, axis=0 ), q.shape[0]-1 )[np.newaxis]
+    mask = np.take_along_axis(qMask, k, axis=0)[0] | (e[0] < zTop) | (e[-1] > zTop)
+    return np.ma.masked_array( np.take_along_axis(q, k, axis=0)[0], mask=mask )
+  zTop, zBottom = max(zTop, zBottom), min(zTop, zBottom)
+  h = np.minimum(e[:-1], zTop) - np.maximum(e[1:], zBottom) # Overlap of each layer with the range
+  h = np.where( qMask, 0., np.maximum(h, 0.) )
+  hSum = np.sum(h, axis=0, dtype=np.float64)
+  qSum = np.sum(h * np.where(qMask, 0., q), axis=0, dtype=np.float64)
+  return np.ma.masked_array( qSum / np.where(hSum>0, hSum, 1.), mask=(hSum<=0) )
+
+
+def valueOnSurface(q, r, r0):
+  """
+  Returns the layer quantity q(nk,...) linearly interpolated, between the centers of layers, to the
+  surface where r(nk,...), e.g. potential density increasing with k, has the value r0. The result is
+  dimensioned (...) and is masked where the surface does not lie between the centers of two unmasked
+  layers (e.g. where it outcrops or is deeper than the water column).
+  """
+
+  if r.shape!=q.shape: raise Exception('The arguments q and r must have the same shape')
+  mask = np.ma.getmaskarray(q) | np.ma.getmaskarray(r)
+  q = np.ma.getdata(q); r = np.ma.getdata(r)
+  k = np.sum( (r < r0) & ~mask, axis=0 )[np.newaxis] # Number of layers above the surface
+  kAbove = np.maximum(k-1, 0); kBelow = np.minimum(k, q.shape[0]-1)
+  rAbove = np.take_along_axis(r, kAbove, axis=0)[0]; rBelow = np.take_along_axis(r, kBelow, axis=0)[0]
+  qAbove = np.take_along_axis(q, kAbove, axis=0)[0]; qBelow = np.take_along_axis(q, kBelow, axis=0)[0]
+  missing = (k[0]==0) | (k[0]==q.shape[0]) | np.take_along_axis(mask, kBelow, axis=0)[0]
+  dr = np.where(missing | (rBelow==rAbove), 1., rBelow - rAbove)
+  w = np.clip( (r0 - rAbove) / dr, 0., 1. )
+  return np.ma.masked_array( qAbove + w * (qBelow - qAbove), mask=missing )
+
+
 def rho_Wright97(S, T, P=0):
   """
   Returns the density of seawater for the given salinity, potential temperature
   and pressure.
 
   Units: salinity in PSU, potential temperature in degrees Celsius and pressure in Pascals.
+
+  The result is always evaluated in double precision, even for float32 S and T, because single
+  precision is only good to about 2e-4 kg/m3, which is comparable to density differences between
+  deep layers.
   """
-  a0 = 7.057924e-4; a1 = 3.480336e-7; a2 = -1.112733e-7
-  b0 = 5.790749e8;  b1 = 3.516535e6;  b2 = -4.002714e4
-  b3 = 2.084372e2;  b4 = 5.944068e5;  b5 = -9.643486e3
-  c0 = 1.704853e5;  c1 = 7.904722e2;  c2 = -7.984422
-  c3 = 5.140652e-2; c4 = -2.302158e2; c5 = -3.079464
+  a0, a1, a2 = np.float64(7.057924e-4), np.float64(3.480336e-7), np.float64(-1.112733e-7)
+  b0, b1, b2 = np.float64(5.790749e8), np.float64(3.516535e6), np.float64(-4.002714e4)
+  b3, b4, b5 = np.float64(2.084372e2), np.float64(5.944068e5), np.float64(-9.643486e3)
+  c0, c1, c2 = np.float64(1.704853e5), np.float64(7.904722e2), np.float64(-7.984422)
+  c3, c4, c5 = np.float64(5.140652e-2), np.float64(-2.302158e2), np.float64(-3.079464)
   al0 = a0 + a1*T + a2*S
   p0 = b0 + b4*S + T * (b1 + T*(b2 + b3*T) + b5*S)
   Lambda = c0 + c4*S + T * (c1 + T*(c2 + c3*T) + c5*S)
@@ -145,3 +251,32 @@ if __name__ == '__main__':
   plt.pcolormesh(X, Z, Q)
 
   plt.show()
+
+  q = np.ma.masked_array(np.arange(20.).reshape(4,5), mask=np.arange(20).reshape(4,5)%7==0)
+  print('q=',q)
+  print('coarsen(q,2,2)=',coarsen(q, 2, 2))
+  print('coarsen(q,2,2,nearest)=',coarsen(q, 2, 2, method='nearest'))
+  print('coarsenVertices(x,2)=',coarsenVertices(np.arange(6), 2))
+
+  e = np.array([0., -10., -30., -60.])[:,np.newaxis] * np.ones((1,3)); e[-1,2] = -20.; e[-2,2] = -20.
+  q = np.array([1., 2., 3.])[:,np.newaxis] * np.ones((1,3))
+  print('remapToDepth(q,e,-25)=',remapToDepth(q, e, -25.),'(expect 2 2 masked)')
+  print('remapToDepth(q,e,-5,-25)=',remapToDepth(q, e, -5., -25.),'(expect 1.75 1.75 1.667)')
+  r = np.array([35., 36., 37.])[:,np.newaxis] * np.ones((1,3)); r[:,2] += 2.
+  print('valueOnSurface(q,r,36.25)=',valueOnSurface(q, r, 36.25),'(expect 2.25 2.25 masked)')
+
+  q = np.random.rand(3,4)
+  z = np.ma.masked_array(z, mask=z<-2.2); q = np.ma.masked_array(q, mask=q>0.8)
+  zCopy = z.copy(); qCopy = q.copy()
+  X, Z, Q = section2quadmesh(x, np.ma.stack([z, z]), np.ma.stack([q, q]), representation='plm')
+  print('section2quadmesh left z and q unchanged:', (z==zCopy).all() and (q==qCopy).all() and (z.mask==zCopy.mask).all())
+  print('section2quadmesh over time equals each time:', np.all(Z[1]==section2quadmesh(x, z, q, representation='plm')[1]))
+
+  # float32 data (as stored by MOM6) give results within rounding of the float64 path
+  S = np.random.uniform(30., 38., (4,10)); T = np.random.uniform(-2., 30., (4,10))
+  rho = rho_Wright97(S.astype(np.float32), T.astype(np.float32), 2e7)
+  print('rho_Wright97 float32 input is evaluated in', rho.dtype, 'max difference from float64 =',
+        np.abs(rho - rho_Wright97(S, T, 2e7)).max(), '(expect < 1e-5 kg/m3)')
+  e = -np.cumsum(np.random.uniform(1., 100., (5,10)), axis=0); q = np.random.rand(4,10)
+  diff = remapToDepth(q.astype(np.float32), e.astype(np.float32), -50., -250.) - remapToDepth(q, e, -50., -250.)
+  print('remapToDepth float32 max difference from float64 =', np.abs(diff).max(), '(expect < 1e-5)')
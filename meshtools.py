@@ -43,7 +43,7 @@ def findIndicesOfCell(xMesh, yMesh, xPoint, yPoint):
           #print 'Hit: i,j=',iMesh,jMesh
       continue
     if pointIsInBoundingBox(xPoint, yPoint, xMesh, yMesh, iLeft, jBottom, iRight, jTop):
-      iMiddle = ( iLeft + iRight )/2; jMiddle = ( jBottom + jTop )/2 # Bisect into quadrants
+      iMiddle = ( iLeft + iRight )//2; jMiddle = ( jBottom + jTop )//2 # Bisect into quadrants
       #print 'left, middle, right=',iLeft,iMiddle,iRight,'bottom, middle, top=',jBottom,jMiddle,jTop,'In'
       if iMiddle>iLeft:
         if jMiddle>jBottom: stack.add( (iLeft, jBottom, iMiddle, jMiddle) )
@@ -54,6 +54,316 @@ def findIndicesOfCell(xMesh, yMesh, xPoint, yPoint):
   return iMesh, jMesh
 
 
+def rasterLookup(xMesh, yMesh, xRaster, yRaster, maxPixels=64):
+  """
+  Returns the flattened index, j*ni+i, of the mesh-cell that contains each point of a regular
+  raster with uniformly spaced coordinates xRaster(nx) and yRaster(ny), or -1 where a point is
+  not in any cell. The result has shape (ny,nx) so that q.ravel()[index] samples a field q(nj,ni)
+  onto the raster.
+
+  Cells are treated as convex quadrilaterals. Each cell is tested against the raster points
+  within its bounding box, vectorized over all cells covering at most maxPixels points and
+  one cell at a time for the few larger cells.
+  """
+
+  if xMesh.shape!=yMesh.shape: raise Exception('The x,y coordinates of the mesh must be the same shape')
+  if xMesh.ndim!=2: raise Exception('The x,y coordinates of the mesh must be 2-dimensional')
+  if len(xRaster)<2 or len(yRaster)<2: raise Exception('The raster must have at least two points in each direction')
+
+  nj, ni = xMesh.shape[0]-1, xMesh.shape[1]-1
+  nx, ny = len(xRaster), len(yRaster)
+  x0 = xRaster[0]; dx = ( xRaster[-1] - xRaster[0] ) / ( nx - 1 )
+  y0 = yRaster[0]; dy = ( yRaster[-1] - yRaster[0] ) / ( ny - 1 )
+
+  # Range of raster points within the bounding box of each cell
+  def rasterRange(q, r0, dr, n):
+    a, b, c, d = q[:-1,:-1].ravel(), q[:-1,1:].ravel(), q[1:,1:].ravel(), q[1:,:-1].ravel()
+    r1 = ( np.minimum( np.minimum(a, b), np.minimum(c, d) ) - r0 ) / dr
+    r2 = ( np.maximum( np.maximum(a, b), np.maximum(c, d) ) - r0 ) / dr
+    lo = np.maximum( np.ceil( np.minimum(r1, r2) ), 0 ).astype(int)
+    hi = np.minimum( np.floor( np.maximum(r1, r2) ), n-1 ).astype(int)
+    return lo, hi
+  i0, i1 = rasterRange(xMesh, x0, dx, nx)
+  j0, j1 = rasterRange(yMesh, y0, dy, ny)
+  cells = np.nonzero( (i1>=i0) & (j1>=j0) )[0]
+  width = i1[cells] - i0[cells] + 1; height = j1[cells] - j0[cells] + 1
+
+  index = -np.ones((ny, nx), dtype=int)
+  def testPoints(c, i, j):
+    # Assign raster points (i,j) to the cells c that contain them
+    inside = pointsAreInCells(x0 + i*dx, y0 + j*dy, xMesh, yMesh, c//ni, c%ni)
+    index[j[inside], i[inside]] = c[inside]
+
+  small = width*height <= maxPixels
+  c = cells[small]; w = width[small]; h = height[small]
+  for dj in range(h.max() if len(h) else 0):
+    for di in range(w.max() if len(w) else 0):
+      k = (h>dj) & (w>di)
+      testPoints(c[k], i0[c[k]]+di, j0[c[k]]+dj)
+  for c in cells[~small]:
+    j, i = np.mgrid[j0[c]:j1[c]+1, i0[c]:i1[c]+1]
+    testPoints(np.full(i.size, c), i.ravel(), j.ravel())
+
+  return index
+
+
+def cellsContainingPoints(xMesh, yMesh, xPoint, yPoint, maxDistance=4):
+  """
+  Returns the flattened index, j*ni+i, of the mesh-cell that contains each of the scattered points
+  (xPoint,yPoint), or -1 where a point is not in any cell. The result has the shape of xPoint.
+
+  The first guess for each point is the cell that rasterLookup() finds at the nearest point of a raster
+  with twice the resolution of the mesh. The guessed cell and those around it, up to maxDistance cells away,
+  are tested, vectorized over the points, and findIndicesOfCell() searches for the few points that are in
+  none of them.
+  """
+
+  if xMesh.shape!=yMesh.shape: raise Exception('The x,y coordinates of the mesh must be the same shape')
+  if xMesh.ndim!=2: raise Exception('The x,y coordinates of the mesh must be 2-dimensional')
+
+  nj, ni = xMesh.shape[0]-1, xMesh.shape[1]-1
+  shape = np.shape(xPoint)
+  xPoint = np.asarray(xPoint, dtype=float).ravel(); yPoint = np.asarray(yPoint, dtype=float).ravel()
+  x0, x1 = xMesh.min(), xMesh.max(); y0, y1 = yMesh.min(), yMesh.max()
+  nx, ny = 2*ni+1, 2*nj+1
+  raster = rasterLookup(xMesh, yMesh, np.linspace(x0, x1, nx), np.linspace(y0, y1, ny))
+
+  # Guess from the nearest raster point that is in a cell, among the 3x3 nearest
+  inBox = (xPoint>=x0) & (xPoint<=x1) & (yPoint>=y0) & (yPoint<=y1)
+  iRaster = np.rint( (xPoint - x0) / (x1 - x0) * (nx - 1) ).astype(int)
+  jRaster = np.rint( (yPoint - y0) / (y1 - y0) * (ny - 1) ).astype(int)
+  guess = -np.ones(xPoint.shape, dtype=int)
+  for dj, di in [(0,0), (0,-1), (0,1), (-1,0), (1,0), (-1,-1), (-1,1), (1,-1), (1,1)]:
+    k = inBox & (guess<0)
+    guess[k] = raster[ np.clip(jRaster[k]+dj, 0, ny-1), np.clip(iRaster[k]+di, 0, nx-1) ]
+
+  # Test the guessed cells and those around them, nearest first
+  index = -np.ones(xPoint.shape, dtype=int)
+  offsets = [ (dj, di) for dj in range(-maxDistance, maxDistance+1) for di in range(-maxDistance, maxDistance+1) ]
+  for dj, di in sorted(offsets, key=lambda o: o[0]**2 + o[1]**2):
+    k = np.nonzero( (guess>=0) & (index<0) )[0]
+    if len(k)==0: break
+    j = guess[k]//ni + dj; i = guess[k]%ni + di
+    valid = (j>=0) & (j<nj) & (i>=0) & (i<ni)
+    k, j, i = k[valid], j[valid], i[valid]
+    inside = pointsAreInCells(xPoint[k], yPoint[k], xMesh, yMesh, j, i)
+    index[k[inside]] = j[inside]*ni + i[inside]
+
+  # Search for the rest, which should be few
+  for k in np.nonzero( inBox & (index<0) )[0]:
+    i, j = findIndicesOfCell(xMesh, yMesh, xPoint[k], yPoint[k])
+    if i is not None: index[k] = j*ni + i
+
+  return index.reshape(shape)
+
+
+def sectionCells(xMesh, yMesh, xLine, yLine):
+  """
+  Returns the cells crossed by the polyline with vertices (xLine,yLine), in order along the polyline,
+  as (j, i, x, y) where j and i are the cell indices and x, y (one element longer than j and i) are the
+  positions at which the polyline enters each cell and, finally, leaves the last cell. Parts of the
+  polyline outside of the mesh appear as cells with indices -1.
+
+  Crossings of the polyline with all the edges of the mesh are found at once for each segment of the
+  polyline. The cell containing each piece of a segment, between consecutive crossings, is the one of
+  the cells adjacent to the crossed edges that contains the middle of the piece.
+  """
+
+  if xMesh.shape!=yMesh.shape: raise Exception('The x,y coordinates of the mesh must be the same shape')
+  if xMesh.ndim!=2: raise Exception('The x,y coordinates of the mesh must be 2-dimensional')
+  if len(xLine)!=len(yLine) or len(xLine)<2: raise Exception('The polyline must have at least two vertices')
+
+  nj, ni = xMesh.shape[0]-1, xMesh.shape[1]-1
+  # Edges along i, between nodes (j,i) and (j,i+1), and along j, between nodes (j,i) and (j+1,i), and the
+  # cells on either side of each edge
+  jE, iE = np.mgrid[0:nj+1, 0:ni]
+  jN, iN = np.mgrid[0:nj, 0:ni+1]
+  edgeA = ( np.append( xMesh[:,:-1].ravel(), xMesh[:-1,:].ravel() ), np.append( yMesh[:,:-1].ravel(), yMesh[:-1,:].ravel() ) )
+  edgeB = ( np.append( xMesh[:,1:].ravel(), xMesh[1:,:].ravel() ), np.append( yMesh[:,1:].ravel(), yMesh[1:,:].ravel() ) )
+  edgeJ = np.array( [ np.append( jE.ravel()-1, jN.ravel() ), np.append( jE.ravel(), jN.ravel() ) ] ).T
+  edgeI = np.array( [ np.append( iE.ravel(), iN.ravel()-1 ), np.append( iE.ravel(), iN.ravel() ) ] ).T
+  edgeCells = np.where( (edgeJ>=0) & (edgeJ<nj) & (edgeI>=0) & (edgeI<ni), edgeJ*ni + edgeI, -1 )
+
+  cells = []; xEnd = []; yEnd = []
+  for n in range(len(xLine)-1):
+    P = (xLine[n], yLine[n]); Q = (xLine[n+1], yLine[n+1])
+    d1 = crossProduct(P, Q, edgeA); d2 = crossProduct(P, Q, edgeB)
+    d3 = crossProduct(edgeA, edgeB, P); d4 = crossProduct(edgeA, edgeB, Q)
+    hit = np.nonzero( (d1*d2<=0) & (d3*d4<=0) & (d3!=d4) )[0]
+    t = d3[hit] / ( d3[hit] - d4[hit] ) # Fractional position of each crossing along the segment
+    order = np.argsort(t); t = t[order]; hit = hit[order]
+    # Group coincident crossings (e.g. at nodes) and gather the cells adjacent to each group
+    group = np.cumsum( np.append( 0, np.diff(t) > 1.e-12 ) )[:len(t)]
+    nGroups = group[-1]+1 if len(t) else 0
+    first = np.searchsorted(group, group)
+    candidates = -np.ones((nGroups+2, 2*np.bincount(group).max() if len(t) else 1), dtype=int)
+    candidates[group+1, 2*(np.arange(len(t))-first)] = edgeCells[hit,0]
+    candidates[group+1, 2*(np.arange(len(t))-first)+1] = edgeCells[hit,1]
+    tGroup = np.concatenate( ( [0.], t[np.append(0, np.nonzero(np.diff(group))[0]+1)] if len(t) else [], [1.] ) )
+    # Pieces between consecutive groups (the ends of the segment are groups without candidates)
+    keep = np.diff(tGroup) > 1.e-12
+    tMid = ( 0.5*( tGroup[:-1] + tGroup[1:] ) )[keep]
+    pieceCandidates = np.concatenate( (candidates[:-1], candidates[1:]), axis=1 )[keep]
+    xMid = P[0] + tMid*(Q[0]-P[0]); yMid = P[1] + tMid*(Q[1]-P[1])
+    c = np.maximum(pieceCandidates, 0)
+    inside = ( pieceCandidates>=0 ) & pointsAreInCells(xMid[:,np.newaxis], yMid[:,np.newaxis], xMesh, yMesh, c//ni, c%ni)
+    pieceCells = np.where( inside.any(axis=1), pieceCandidates[np.arange(len(tMid)), inside.argmax(axis=1)], -1 )
+    if not len(t): # The segment does not cross any edges so lies within one cell, or outside the mesh
+      i, j = findIndicesOfCell(xMesh, yMesh, xMid[0], yMid[0])
+      if i is not None: pieceCells[0] = j*ni + i
+    tEnd = tGroup[1:][keep]
+    cells.append( pieceCells )
+    xEnd.append( P[0] + tEnd*(Q[0]-P[0]) ); yEnd.append( P[1] + tEnd*(Q[1]-P[1]) )
+
+  # Merge consecutive pieces in the same cell and trim the parts before entering and after leaving the mesh
+  cells = np.concatenate(cells); xEnd = np.concatenate(xEnd); yEnd = np.concatenate(yEnd)
+  x = np.append( xLine[0], xEnd ); y = np.append( yLine[0], yEnd )
+  last = np.append( cells[:-1]!=cells[1:], True ) # Last piece in each run of pieces in the same cell
+  x = np.append( x[0], x[1:][last] ); y = np.append( y[0], y[1:][last] ); cells = cells[last]
+  inMesh = np.nonzero(cells>=0)[0]
+  if len(inMesh)==0: return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0), np.zeros(0)
+  n0, n1 = inMesh[0], inMesh[-1]+1
+  cells = cells[n0:n1]; x = x[n0:n1+1]; y = y[n0:n1+1]
+  return np.where(cells>=0, cells//ni, -1), np.where(cells>=0, cells%ni, -1), x, y
+
+
+def cellOverlaps(xSource, ySource, xTarget, yTarget, period=None, chunkSize=65536):
+  """
+  Returns the flattened indices, j*ni+i, of the cells of the source mesh and of the target mesh for each
+  pair of overlapping cells, and the fraction of the area of the source cell that is within the target
+  cell. The fractions for each source cell sum to one where the target mesh covers it. If period is given
+  (e.g. 360 for longitudes), x is periodic and each source cell is compared to the target cells shifted
+  by the multiple of period nearest to it.
+
+  The candidate target cells of each source cell are those containing its corners or center and their
+  neighbours, so the target mesh should not be finer than the source mesh. The overlaps are found by
+  clipping the source cells with the candidates (see clippedPolygonAreas()), vectorized over chunks of
+  chunkSize source cells.
+  """
+
+  if xSource.shape!=ySource.shape or xTarget.shape!=yTarget.shape: raise Exception('The x,y coordinates of each mesh must be the same shape')
+  if xSource.ndim!=2 or xTarget.ndim!=2: raise Exception('The x,y coordinates of the meshes must be 2-dimensional')
+
+  nj, ni = xSource.shape[0]-1, xSource.shape[1]-1
+  nJ, nI = xTarget.shape[0]-1, xTarget.shape[1]-1
+  def corners(q): return np.array( [ q[:-1,:-1].ravel(), q[:-1,1:].ravel(), q[1:,1:].ravel(), q[1:,:-1].ravel() ] ).T
+  xS, yS, xT, yT = corners(xSource), corners(ySource), corners(xTarget), corners(yTarget)
+  xSc, xTc = xS.mean(axis=1), xT.mean(axis=1)
+  sourceArea = np.abs( polygonAreas(xS, yS) )
+
+  # Target cells containing the nodes and centers of the source mesh
+  def lookup(x, y):
+    if period is not None: x = xTarget.min() + np.mod(x - xTarget.min(), period)
+    return cellsContainingPoints(xTarget, yTarget, x, y)
+  nodes = lookup(xSource, ySource)
+  hits = np.concatenate( ( corners(nodes), lookup(xSc, yS.mean(axis=1)).reshape(-1,1) ), axis=1 )
+
+  sources, targets, fractions = [], [], []
+  for n0 in range(0, nj*ni, chunkSize):
+    h = hits[n0:n0+chunkSize]
+    # Candidates are the cells hit and their neighbours, without duplicates
+    candidates = []
+    for dj in (-1, 0, 1):
+      for di in (-1, 0, 1):
+        j = h//nI + dj; i = h%nI + di
+        if period is not None: i = np.mod(i, nI)
+        candidates.append( np.where( (h>=0) & (j>=0) & (j<nJ) & (i>=0) & (i<nI), j*nI + i, -1 ) )
+    candidates = np.sort( np.concatenate(candidates, axis=1), axis=1 )
+    candidates[:,1:][ candidates[:,1:]==candidates[:,:-1] ] = -1
+    s, k = np.nonzero(candidates>=0)
+    s = s + n0; t = candidates[s-n0, k]
+    xs = xS[s]
+    if period is not None: xs = xs + period * np.rint( ( xTc[t] - xSc[s] ) / period )[:,np.newaxis]
+    # Discard the pairs whose bounding boxes do not overlap before clipping
+    overlap = ( xs.min(axis=1)<xT[t].max(axis=1) ) & ( xs.max(axis=1)>xT[t].min(axis=1) ) \
+            & ( yS[s].min(axis=1)<yT[t].max(axis=1) ) & ( yS[s].max(axis=1)>yT[t].min(axis=1) )
+    s, t, xs = s[overlap], t[overlap], xs[overlap]
+    area = clippedPolygonAreas(xs, yS[s], xT[t], yT[t])
+    keep = ( area>0 ) & ( sourceArea[s]>0 )
+    sources.append( s[keep] ); targets.append( t[keep] ); fractions.append( area[keep] / sourceArea[s[keep]] )
+
+  return np.concatenate(sources), np.concatenate(targets), np.concatenate(fractions)
+
+
+def clippedPolygonAreas(xSubject, ySubject, xClip, yClip):
+  """
+  Returns the areas of the intersections of the polygons with vertices (xSubject[n,:],ySubject[n,:]) with
+  the convex polygons with vertices (xClip[n,:],yClip[n,:]), clipping each subject polygon by each edge of
+  its clipping polygon in turn (the Sutherland-Hodgman algorithm), vectorized over n.
+  """
+
+  n, nSubject = xSubject.shape
+  nClip = xClip.shape[1]
+  x = np.zeros((n, nSubject+nClip)); y = np.zeros((n, nSubject+nClip)) # Each edge adds at most one vertex
+  x[:,:nSubject] = xSubject; y[:,:nSubject] = ySubject
+  count = np.full(n, nSubject)
+  orientation = np.sign( polygonAreas(xClip, yClip) ) # So that the inside of each clipping edge is positive
+
+  for e in range(nClip):
+    A = (xClip[:,e-1], yClip[:,e-1]); B = (xClip[:,e], yClip[:,e])
+    xOut = np.zeros_like(x); yOut = np.zeros_like(y); nOut = np.zeros(n, dtype=int)
+    def append(k, xv, yv):
+      xOut[k, nOut[k]] = xv; yOut[k, nOut[k]] = yv; nOut[k] += 1
+    for v in range(count.max() if n else 0):
+      k = np.nonzero(count>v)[0]
+      u = np.mod(v-1, count[k]) # Previous vertex
+      Ak, Bk = (A[0][k], A[1][k]), (B[0][k], B[1][k])
+      P = (x[k,v], y[k,v]); S = (x[k,u], y[k,u])
+      dP = orientation[k] * crossProduct(Ak, Bk, P); dS = orientation[k] * crossProduct(Ak, Bk, S)
+      pInside = dP>=0
+      crosses = pInside != ( dS>=0 )
+      t = dS[crosses] / ( dS[crosses] - dP[crosses] )
+      append(k[crosses], S[0][crosses] + t*( P[0][crosses] - S[0][crosses] ), S[1][crosses] + t*( P[1][crosses] - S[1][crosses] ))
+      append(k[pInside], P[0][pInside], P[1][pInside])
+    x, y, count = xOut, yOut, nOut
+
+  return np.abs( polygonAreas(x, y, count) )
+
+
+def polygonAreas(xPolygon, yPolygon, count=None):
+  """
+  Returns the signed areas, positive for counter-clockwise vertices, of the polygons with vertices
+  (xPolygon[n,:count[n]],yPolygon[n,:count[n]]). All the vertices are used if count is None.
+  """
+
+  nMax = xPolygon.shape[1]
+  if count is None: count = np.full(xPolygon.shape[0], nMax)
+  rows = np.arange(xPolygon.shape[0])
+  area = np.zeros(xPolygon.shape[0])
+  for v in range(nMax):
+    u = np.mod(v+1, np.maximum(count, 1)) # Next vertex
+    term = xPolygon[:,v] * yPolygon[rows,u] - xPolygon[rows,u] * yPolygon[:,v]
+    area += np.where(v<count, term, 0.)
+  return 0.5 * area
+
+
+def pointsAreInCells(xPoint, yPoint, xMesh, yMesh, j, i):
+  """
+  Returns True where the points (xPoint,yPoint) are within the cells with indices (j,i), treating the
+  cells as convex quadrilaterals. The arguments are arrays that are broadcast together.
+  """
+
+  A = (xMesh[j,i], yMesh[j,i]); B = (xMesh[j,i+1], yMesh[j,i+1])
+  C = (xMesh[j+1,i+1], yMesh[j+1,i+1]); D = (xMesh[j+1,i], yMesh[j+1,i])
+  P = (xPoint, yPoint)
+  s1 = crossProduct(P, A, B) >= 0
+  s2 = crossProduct(P, B, C) >= 0
+  s3 = crossProduct(P, C, D) >= 0
+  s4 = crossProduct(P, D, A) >= 0
+  return ( s1 & s2 & s3 & s4 ) | ~( s1 | s2 | s3 | s4 )
+
+
+def greatCircleDistance(lon1, lat1, lon2, lat2, radius=6371.):
+  """
+  Returns the distance between points given by longitude and latitude in degrees, on a sphere of the
+  given radius (default is that of the Earth in km).
+  """
+
+  lon1, lat1, lon2, lat2 = np.radians(lon1), np.radians(lat1), np.radians(lon2), np.radians(lat2)
+  a = np.sin( 0.5*(lat2-lat1) )**2 + np.cos(lat1) * np.cos(lat2) * np.sin( 0.5*(lon2-lon1) )**2
+  return 2. * radius * np.arcsin( np.sqrt( np.minimum(a, 1.) ) )
+
+
 def pointIsInBoundingBox(xPoint, yPoint, xMesh, yMesh, iLeft=0, jBottom=0, iRight=None, jTop=None):
   """
   Returns True if the point (x,y) is within the quadrant bounding box.
@@ -206,3 +516,56 @@ if __name__ == '__main__':
   intersectTest( (0,0), (1,1), (-1,0), (1,0), True )
   intersectTest( (0,0), (1,1), (0,0), (0,1), True )
   intersectTest( (0,0), (1,1), (0,1), (1,1), True )
+
+  def test_rasterLookup(xMesh, yMesh, nx, ny):
+    xRaster = np.linspace(xMesh.min()-.05, xMesh.max()+.05, nx)
+    yRaster = np.linspace(yMesh.min()-.05, yMesh.max()+.05, ny)
+    index = rasterLookup(xMesh, yMesh, xRaster, yRaster)
+    wrong = 0
+    for j in range(ny):
+      for i in range(nx):
+        iCell, jCell = findIndicesOfCell(xMesh, yMesh, xRaster[i], yRaster[j])
+        if iCell is None: wrong += index[j,i]>=0
+        elif index[j,i]<0 or not pointIsInCell(xRaster[i], yRaster[j], xMesh, yMesh,
+            index[j,i]%(xMesh.shape[1]-1), index[j,i]//(xMesh.shape[1]-1)): wrong += 1
+    if wrong: test = 'Wrong'
+    else: test = 'Correct'
+    print('rasterLookup on a %ix%i raster'%(nx,ny),test)
+  test_rasterLookup(X, Y, 17, 23)
+  test_rasterLookup(X + 0.1*Y**2, Y + 0.05*np.sin(3*X), 40, 30)
+
+  xMesh, yMesh = X + 0.1*Y**2, Y + 0.05*np.sin(3*X)
+  random = np.random.RandomState(1)
+  xPoints = random.uniform(-.1, 1.2, 200); yPoints = random.uniform(-.1, 1.1, 200)
+  index = cellsContainingPoints(xMesh, yMesh, xPoints, yPoints)
+  wrong = 0
+  for n in range(len(xPoints)):
+    iCell, jCell = findIndicesOfCell(xMesh, yMesh, xPoints[n], yPoints[n])
+    if iCell is None: wrong += index[n]>=0
+    elif index[n]<0 or not pointIsInCell(xPoints[n], yPoints[n], xMesh, yMesh, index[n]%4, index[n]//4): wrong += 1
+  if wrong: test = 'Wrong'
+  else: test = 'Correct'
+  print('cellsContainingPoints found %i of %i points'%((index>=0).sum(), len(index)),test)
+
+  j, i, x, y = sectionCells(X, Y, [-.1, 1.1], [.3, .3])
+  if list(j)==[1]*4 and list(i)==[0,1,2,3] and np.allclose(x, [0,.25,.5,.75,1]): test = 'Correct'
+  else: test = 'Wrong'
+  print('sectionCells along j=1:',list(zip(j.tolist(),i.tolist())),test)
+  xMesh, yMesh = X + 0.1*Y**2, Y + 0.05*np.sin(3*X)
+  j, i, x, y = sectionCells(xMesh, yMesh, [.05, .9, .3], [.02, .5, .95])
+  test = 'Correct'
+  for n in range(len(j)):
+    if not pointIsInCell(0.5*(x[n]+x[n+1]), 0.5*(y[n]+y[n+1]), xMesh, yMesh, i[n], j[n]): test = 'Wrong'
+  print('sectionCells crossed %i cells'%len(j),test)
+
+  xMesh, yMesh = X + 0.02*np.sin(np.pi*X)*Y, Y
+  xCoarse, yCoarse = np.meshgrid(np.linspace(0, 1, 3), np.linspace(0, 1, 4))
+  xCoarse, yCoarse = xCoarse + 0.05*np.sin(np.pi*xCoarse)*np.sin(3*yCoarse), yCoarse + 0.04*np.sin(np.pi*yCoarse)*np.cos(2*xCoarse)
+  source, target, fraction = cellOverlaps(xMesh, yMesh, xCoarse, yCoarse)
+  def cornersOf(q): return np.array( [ q[:-1,:-1].ravel(), q[:-1,1:].ravel(), q[1:,1:].ravel(), q[1:,:-1].ravel() ] ).T
+  sourceArea = np.abs( polygonAreas(cornersOf(xMesh), cornersOf(yMesh)) )
+  targetArea = np.abs( polygonAreas(cornersOf(xCoarse), cornersOf(yCoarse)) )
+  if np.allclose(np.bincount(source, weights=fraction), 1) and \
+     np.allclose(np.bincount(target, weights=fraction*sourceArea[source]), targetArea): test = 'Correct'
+  else: test = 'Wrong'
+  print('cellOverlaps found %i overlapping cells'%len(source),test)
@@ -1,12 +1,21 @@
 # Try to import required packages/modules
 import os
 import netCDF4 as nc4
+import struct
+import threading
+import weakref
 import warnings
 import numpy
+import iotrace
+import profiling
+try: import h5py # Optional, to find the offsets of contiguous netCDF4 variables
+except ImportError: h5py = None
 
 warnings.simplefilter('error', UserWarning)
 
 debug = False # Global debugging
+useMemmap = True # Memory map uncompressed, contiguous variables (see memmapVariable())
+libraryLock = threading.RLock() # Serializes calls into the netCDF library, which is not thread-safe
 
 def openNetCDFfileForReading(fileName):
   """
@@ -68,6 +77,7 @@ def dump(fileName):
   if closeWhenDone: rg.close()
 
 
+@profiling.timed('nccf read')
 def readVar(fileName, variableName, *args, **kwargs):
   """
   Reads a variable from a netCDF file.
@@ -80,6 +90,10 @@ def readVar(fileName, variableName, *args, **kwargs):
     dimensions will be a list of numpy 1D vectors
     attributes will be a dictionary
 
+  The keyword argument dtype (default 'float64') sets the type of the data and coordinates. With
+  dtype='native', floating point data keep the precision of the file (e.g. float32), other data are
+  converted to float64, and coordinates are always float64.
+
   Examples:
   >>> T,_,_ = nccf.readVar('test.nc','xyz')
   >>> T,dims,atts = nccf.readVar('test.nc','xyz',rang(1,4),3)
@@ -98,6 +112,8 @@ def readVar(fileName, variableName, *args, **kwargs):
     exit(0)
 
   dtype = kwargs.setdefault('dtype','float64')
+  if dtype=='native': coordType = 'float64'
+  else: coordType = dtype
 
   # Check that the variable is in the file (allowing for case mismatch)
   for v in rg.variables:
@@ -113,18 +129,232 @@ def readVar(fileName, variableName, *args, **kwargs):
       if d in rg.variables: dimensions.append( rg.variables[d][args[n]] )
       else: dimensions.append( args[n] )
     else:
-      if d in rg.variables: dimensions.append( numpy.asarray(rg.variables[d][:], dtype=dtype) )
+      if d in rg.variables: dimensions.append( numpy.asarray(rg.variables[d][:], dtype=coordType) )
       else: dimensions.append( list(range( len(rg.dimensions[d] ))) )
 
   attributes = {}
   for a in vh.ncattrs():
     attributes[a.encode('ascii','ignore')] = vh.getncattr(a)
 
-  data = numpy.ma.asarray(vh[args][:], dtype=dtype)
+  source = memmapVariable(vh, rg.filepath())
+  if source is None: source = vh
+  source = iotrace.wrap(source, rg.filepath(), 'nccf.readVar')
+  data = source[args][:]
+  if dtype=='native': dtype = nativeFloat(data.dtype)
+  data = numpy.ma.asarray(data, dtype=dtype)
   if closeWhenDone: rg.close()
   return data, dimensions, attributes
 
 
+def nativeFloat(dtype):
+  """
+  Returns the floating point type that holds values of type dtype without loss of precision: dtype
+  itself for float32 and float64, float32 for float16, and float64 otherwise.
+  """
+  dtype = numpy.dtype(dtype)
+  if dtype.kind=='f': return numpy.promote_types(dtype, numpy.float32)
+  return numpy.dtype(numpy.float64)
+
+
+def memmapVariable(variable, fileName):
+  """
+  Returns a MemmapVariable for the netCDF4.Variable, variable, in the file fileName if its values are
+  stored uncompressed and contiguously (netCDF3 classic, 64-bit offset or CDF5 files, or contiguous
+  netCDF4 variables if h5py is available to find their offset), or None otherwise.
+  """
+  if not useMemmap or not os.path.isfile(fileName): return None
+  if variable.dtype==str or numpy.dtype(variable.dtype).kind not in 'iuf': return None
+  try:
+    with open(fileName, 'rb') as f: magic = f.read(4)
+    if magic[:3]==b'CDF': layout = netcdf3Layout(fileName).get(variable.name)
+    elif magic==b'\x89HDF' and h5py is not None: layout = _hdf5Layout(fileName, variable.name)
+    else: layout = None
+  except Exception as e:
+    if debug: print('memmapVariable: unable to map',variable.name,'in',fileName,':',e)
+    return None
+  if layout is None: return None
+  dtype, shape, offset, strides = layout
+  if shape!=variable.shape: return None
+  status = os.stat(fileName)
+  key = (os.path.realpath(fileName), status.st_size, status.st_mtime) # A rewritten file is mapped afresh
+  fileBytes = _memmaps.get(key)
+  if fileBytes is None: fileBytes = _memmaps[key] = numpy.memmap(fileName, dtype=numpy.uint8, mode='r')
+  if len(shape) and shape[0]>0 and offset + (shape[0]-1)*strides[0] + dtype.itemsize*int(numpy.prod(shape[1:])) > len(fileBytes):
+    return None # The file is shorter than the header describes (e.g. still being written)
+  array = numpy.ndarray(shape, dtype=dtype, buffer=fileBytes, offset=offset, strides=strides)
+  if debug: print('memmapVariable: mapped',variable.name,'in',fileName,'at offset',offset)
+  return MemmapVariable(variable, array)
+
+
+_memmaps = weakref.WeakValueDictionary() # Memory maps of whole files, keyed by file name, size and modification time,
+                                          # each unmapped once no variable mapped from it remains
+
+
+class MemmapVariable:
+  """
+  Class giving read-only, netCDF4.Variable-like, indexing of a variable that is memory mapped from
+  its file. Only the pages holding the requested elements are read from disk, and the fill value,
+  missing value, valid range and packing (scale_factor, add_offset) are applied to the requested
+  elements alone.
+  """
+  isMemoryMapped = True # Reads do not call the netCDF library, so can be made from several threads
+  def __init__(self, variable, array):
+    self.variable = variable # netCDF4.Variable for the attributes, and reads if the file grows
+    self.array = array
+    self.name = variable.name
+    self.dimensions = variable.dimensions
+    self.shape = array.shape
+    self.ndim = array.ndim
+    self.dtype = array.dtype.newbyteorder('=')
+    attributes = variable.ncattrs()
+    def attribute(name):
+      if name in attributes: return numpy.asarray(getattr(variable, name)) # getncattr() fails for MFDataset
+      return None
+    self.fillValue = attribute('_FillValue')
+    if self.fillValue is None and self.dtype.itemsize>1:
+      self.fillValue = numpy.asarray(nc4.default_fillvals[self.dtype.str[1:]])
+    self.missingValue = attribute('missing_value')
+    validRange = attribute('valid_range')
+    self.validMin = attribute('valid_min') if validRange is None else validRange[0]
+    self.validMax = attribute('valid_max') if validRange is None else validRange[1]
+    self.scaleFactor = attribute('scale_factor')
+    self.addOffset = attribute('add_offset')
+  def __len__(self):
+    return self.shape[0]
+  def __getitem__(self, key):
+    with libraryLock:
+      if self.variable.shape!=self.shape: return self.variable[key] # The file has grown since mapping
+    basic, lists = self.indices(key)
+    data = self.array[tuple(basic)]
+    for axis, index in lists: data = numpy.take(data, index, axis=axis)
+    data = numpy.asarray(data, dtype=self.dtype) # Copies only if the bytes must be swapped
+    mask = numpy.zeros(data.shape, dtype=bool)
+    if self.fillValue is not None: mask |= data==self.fillValue
+    if self.missingValue is not None: mask |= numpy.isin(data, self.missingValue)
+    if self.validMin is not None: mask |= data<self.validMin
+    if self.validMax is not None: mask |= data>self.validMax
+    if self.scaleFactor is not None or self.addOffset is not None:
+      if self.scaleFactor is not None: data = data * self.scaleFactor
+      if self.addOffset is not None: data = data + self.addOffset
+    return numpy.ma.masked_array(data, mask=mask)
+  def indices(self, key):
+    """
+    Splits key, indices as for netCDF4.Variable, into a tuple of basic (integer or slice) indices and a
+    list of (axis, index) for the orthogonal indexing with lists or arrays to apply after the basic indices
+    """
+    if isinstance(key, list) and any( isinstance(k, slice) for k in key ): key = tuple(key)
+    if not isinstance(key, tuple): key = (key,)
+    if any( k is Ellipsis for k in key ):
+      n = key.index(Ellipsis)
+      key = key[:n] + (slice(None),)*(self.ndim-len(key)+1) + key[n+1:]
+    key = key + (slice(None),)*(self.ndim-len(key))
+    basic = []; lists = []; axis = 0
+    for n, k in enumerate(key):
+      if isinstance(k, slice): basic.append(k); axis += 1
+      elif numpy.ndim(k)==0: basic.append(int(k))
+      else:
+        k = numpy.asarray(k)
+        if k.dtype==bool: k = numpy.nonzero(k)[0]
+        basic.append(slice(None)); lists.append( (axis, k) ); axis += 1
+    return basic, lists
+
+
+def netcdf3Layout(fileName):
+  """
+  Returns a dictionary, keyed by variable name, of the (dtype, shape, offset, strides) of the numeric
+  variables in the netCDF3 (classic, 64-bit offset or CDF5) file fileName, read from its header
+  """
+  with open(fileName, 'rb') as f: header = NetCDF3Header(f)
+  return header.layout()
+
+
+class NetCDF3Header:
+  """
+  Class for parsing the header of a netCDF3 file, following the format specification at
+  https://docs.unidata.ucar.edu/netcdf-c/current/file_format_specifications.html
+  """
+  types = {1:'i1', 2:'S1', 3:'i2', 4:'i4', 5:'f4', 6:'f8', 7:'u1', 8:'u2', 9:'u4', 10:'i8', 11:'u8'}
+  def __init__(self, f):
+    self.f = f
+    magic = f.read(4)
+    if magic[:3]!=b'CDF' or not magic[3:] in (b'\x01', b'\x02', b'\x05'):
+      raise Exception('"%s" is not a netCDF3 file'%f.name)
+    self.version = ord(magic[3:])
+    self.numrecs = self.size()
+    self.dims = [ (self.name(), self.size()) for _ in self.list(0x0A) ]
+    self.skipAttributes()
+    self.vars = []
+    for _ in self.list(0x0B):
+      name = self.name()
+      dimIds = [ self.size() for _ in range(self.size()) ]
+      self.skipAttributes()
+      ncType = self.int()
+      vsize = self.size() # Padded size of a (record of a) variable
+      begin = self.int(8 if self.version>1 else 4)
+      self.vars.append( (name, dimIds, ncType, vsize, begin) )
+  def int(self, n=4):
+    return struct.unpack('>I' if n==4 else '>Q', self.f.read(n))[0]
+  def size(self): # NON_NEG, which is 64-bit in CDF5
+    return self.int(8 if self.version==5 else 4)
+  def name(self):
+    n = self.size()
+    name = self.f.read(n).decode('utf-8'); self.f.read(-n%4)
+    return name
+  def list(self, tag): # Returns the range of a list with the given tag, or empty if ABSENT
+    t = self.int(); n = self.size()
+    if t not in (0, tag): raise Exception('Unexpected tag %i in the header of "%s"'%(t, self.f.name))
+    return range(n)
+  def skipAttributes(self):
+    for _ in self.list(0x0C):
+      self.name(); ncType = self.int(); n = self.size()
+      nBytes = n * numpy.dtype(self.types[ncType]).itemsize
+      self.f.read(nBytes + (-nBytes%4))
+  def layout(self):
+    """
+    Returns a dictionary of the (dtype, shape, offset, strides) of each numeric variable
+    """
+    isRecord = lambda dimIds: len(dimIds)>0 and self.dims[dimIds[0]][1]==0
+    recordVars = [ v for v in self.vars if isRecord(v[1]) ]
+    if len(recordVars)==1: # A single record variable has no padding
+      v = recordVars[0]
+      recsize = numpy.dtype(self.types[v[2]]).itemsize * int(numpy.prod([ self.dims[d][1] for d in v[1][1:] ]))
+    else: recsize = sum( v[3] for v in recordVars )
+    result = {}
+    for name, dimIds, ncType, vsize, begin in self.vars:
+      if ncType==2: continue # Characters
+      dtype = numpy.dtype('>'+self.types[ncType])
+      shape = tuple( self.dims[d][1] for d in dimIds )
+      strides = contiguousStrides(shape, dtype.itemsize)
+      if isRecord(dimIds):
+        if self.numrecs==(2**64 if self.version==5 else 2**32)-1: continue # Streaming, so unknown
+        shape = (self.numrecs,) + shape[1:]; strides[0] = recsize
+      result[name] = (dtype, shape, begin, tuple(strides))
+    return result
+
+
+def _hdf5Layout(fileName, variableName):
+  """
+  Returns (dtype, shape, offset, strides) of the variable variableName in the root group of the netCDF4
+  file fileName if it is stored contiguously without filters, or None otherwise
+  """
+  with h5py.File(fileName, 'r') as f:
+    if not variableName in f: return None
+    ds = f[variableName]
+    if ds.chunks is not None or ds.compression is not None: return None
+    offset = ds.id.get_offset()
+    if offset is None: return None # Not yet written
+    return ds.dtype, ds.shape, offset, tuple( contiguousStrides(ds.shape, ds.dtype.itemsize) )
+
+
+def contiguousStrides(shape, itemSize):
+  """
+  Returns the list of strides, in bytes, of a C-ordered array of the given shape and item size
+  """
+  strides = []
+  for n in reversed(shape): strides.insert(0, itemSize); itemSize *= n
+  return strides
+
+
 def openNetCDFfileForWriting(fileName):
   """
   Return Dataset type for file to write.
@@ -139,7 +369,70 @@ def openNetCDFfileForWriting(fileName):
   return rg
 
 
-def write(fileName, variableName=None, variable=None, dimensions=None, attributes=None, dataType='f8', fillValue=None, clobber=False, record=None):
+def sidecarFileName(fileName, kind):
+  """
+  Returns the name of a sidecar file of the given kind (e.g. 'pyramid') that accompanies
+  fileName, e.g. "ocean.nc" has the sidecar "ocean.pyramid.nc".
+  """
+
+  root, ext = os.path.splitext(fileName)
+  return root+'.'+kind+(ext or '.nc')
+
+
+def chunkSizes(shape, itemSize, access='map', chunkBytes=2**22):
+  """
+  Returns chunk lengths, of up to chunkBytes each, for a variable of the given shape that is mostly read
+  by horizontal slabs (access='map'), i.e. one level of one record, or as time series (access='timeseries'),
+  i.e. all records of a small tile of the last two dimensions. Returns None (the netCDF library default)
+  for variables with fewer than two dimensions.
+
+  A first dimension of length 0 (an unlimited dimension yet to be written) is taken to hold as many
+  records as fit in a chunk of 16x16 points.
+  """
+  if len(shape)<2: return None
+  empty = shape[0]==0
+  shape = [ max(n, 1) for n in shape ]
+  itemSize = max(itemSize, 1)
+  if access=='map':
+    chunks = [1]*(len(shape)-2) + list(shape[-2:])
+    chunks[-1] = max(1, min(chunks[-1], chunkBytes//itemSize))
+    chunks[-2] = max(1, min(chunks[-2], chunkBytes//(itemSize*chunks[-1])))
+    return chunks
+  if access=='timeseries':
+    nt = max(1, chunkBytes//(itemSize*256)) if empty else shape[0]
+    tChunk = max(1, min(nt, chunkBytes//itemSize))
+    tile = max(1, int( numpy.sqrt( chunkBytes / ( tChunk * itemSize ) ) ))
+    if len(shape)==2: return [tChunk, min(shape[1], tile*tile)]
+    return [tChunk] + [1]*(len(shape)-3) + [min(n, tile) for n in shape[-2:]]
+  raise Exception('Unknown access pattern "%s" for chunking'%access)
+
+
+def createVariable(rg, variableName, dataType, dimensions, fillValue=None, zlib=False, complevel=4, shuffle=True,
+                   chunksizes=None, leastSignificantDigit=None):
+  """
+  Creates a variable in rg (a netCDF4.Dataset) with optional compression, chunking and quantization.
+
+  chunksizes is a list of chunk lengths, or 'map' or 'timeseries' for chunks suited to reading horizontal
+  slabs or time series (see chunkSizes()). zlib without chunksizes uses 'map'. Compression and chunking are
+  ignored for netCDF3 files. leastSignificantDigit is the number of decimal places kept, so that the
+  values compress better (the least_significant_digit of netCDF4.Dataset.createVariable()).
+  """
+  options = {}
+  if rg.data_model.startswith('NETCDF4'):
+    if zlib and chunksizes is None: chunksizes = 'map'
+    if isinstance(chunksizes, str):
+      shape = [ len(rg.dimensions[d]) for d in dimensions ]
+      chunksizes = chunkSizes(shape, numpy.dtype(dataType).itemsize, access=chunksizes)
+    if chunksizes is not None: options['chunksizes'] = chunksizes
+    if zlib: options.update(zlib=True, complevel=complevel, shuffle=shuffle)
+  if leastSignificantDigit is not None: options['least_significant_digit'] = leastSignificantDigit
+  if debug: print('createVariable:',variableName,dimensions,options)
+  return rg.createVariable(variableName, dataType, dimensions, fill_value=fillValue, **options)
+
+
+@profiling.timed('nccf write')
+def write(fileName, variableName=None, variable=None, dimensions=None, attributes=None, dataType='f8', fillValue=None, clobber=False, record=None,
+          zlib=False, complevel=4, shuffle=True, chunksizes=None, leastSignificantDigit=None):
   """
   Writes a variable to a netCDF file.
 
@@ -156,9 +449,17 @@ def write(fileName, variableName=None, variable=None, dimensions=None, attribute
   fillValue    the fill value (default None)
   clobber      if True will remove file before writing
   record       if present, specifies record number of unlimited dimension to write
+  zlib         if True, compress the variable (netCDF4 files only)
+  complevel    zlib compression level, 1 to 9 (default 4)
+  shuffle      if True (default), shuffle bytes before compressing
+  chunksizes   chunk lengths, or 'map' or 'timeseries' to choose them for the expected reads
+               (see createVariable()); 'map' if zlib is True
+  leastSignificantDigit  number of decimal places to keep (lossy quantization, default None)
+  The options after record apply only when the variable is created.
 
   Examples:
   >>> nccf.write('test.nc','Temp',T)
+  >>> nccf.write('test.nc','Temp',T,zlib=True,leastSignificantDigit=3)
   """
 
   if isinstance(fileName, nc4.Dataset):
@@ -183,14 +484,14 @@ def write(fileName, variableName=None, variable=None, dimensions=None, attribute
     return name
 
   def createDimDataIfMissing(rg, name, data, dataType):
-    if data==None: createDimIfMissing(rg, name, None)
+    if data is None: createDimIfMissing(rg, name, None)
     else: createDimIfMissing(rg, name, len(data))
     if name in rg.variables:
       if any(rg.variables[name][:]!=data):
         raise Exception('Dimension data "%s" does not match provided data'%name)
     else:
       rg.createVariable(name, dataType, name)
-      rg.variables[name][:] = data
+      if data is not None: rg.variables[name][:] = data
     return name
 
   def matchingDimsByData(rg, data):
@@ -209,8 +510,8 @@ def write(fileName, variableName=None, variable=None, dimensions=None, attribute
     return False
 
   variableDimensions = None
-  if dimensions==None:
-    if not variable==None and (isinstance(variable, numpy.ma.core.MaskedArray) or isinstance(variable, numpy.ndarray)):
+  if dimensions is None:
+    if variable is not None and (isinstance(variable, numpy.ma.core.MaskedArray) or isinstance(variable, numpy.ndarray)):
       # Create or match some simple dimensions with made up names
       variableDimensions = []
       for i in range(len(variable.shape)):
@@ -222,7 +523,7 @@ def write(fileName, variableName=None, variable=None, dimensions=None, attribute
         else:
           variableDimensions.append( createDimIfMissing(rg, 'dim%i'%i, variable.shape[i]) )
   elif isinstance(dimensions, list):
-    if not variable==None:
+    if variable is not None:
       # Create or match dimensions based on names or vectors 
       variableDimensions = []
       if isinstance(dimensions[0], str) and dimIsUnlimited(rg, dimensions[0]):
@@ -232,7 +533,7 @@ def write(fileName, variableName=None, variable=None, dimensions=None, attribute
           variableDimensions.append( createDimIfMissing(rg, dim, variable.shape[i]) )
         elif isinstance(dim, numpy.ndarray):
           dName = matchingDimsByData(rg, dim)
-          if dName==None: dName = 'dim%i'%i
+          if dName is None: dName = 'dim%i'%i
           variableDimensions.append( createDimDataIfMissing(rg, dName, dim, dataType) )
         elif len(numpy.atleast_1d(dim))==1: print('Ignoring singleton dimension with value',dim)
         else: print('******* Not sure what to do with dimension =',dim)
@@ -243,13 +544,15 @@ def write(fileName, variableName=None, variable=None, dimensions=None, attribute
       variableDimensions.append( createDimDataIfMissing(rg, n, dimensions[n], dataType) )
   else: raise Exception('Not sure what to do with the dimensions argument!')
 
-  if not variableName==None:
+  if variableName is not None:
     if variableName in rg.variables: vh = rg.variables[variableName]
-    elif not variableDimensions==None: vh = rg.createVariable(variableName, dataType, variableDimensions, fill_value=fillValue)
+    elif variableDimensions is not None:
+      vh = createVariable(rg, variableName, dataType, variableDimensions, fillValue=fillValue, zlib=zlib, complevel=complevel,
+                          shuffle=shuffle, chunksizes=chunksizes, leastSignificantDigit=leastSignificantDigit)
   else: vh = None
 
-  if not attributes==None:
-    if not vh==None:
+  if attributes is not None:
+    if vh is not None:
       for a in attributes:
         if not a in ['_FillValue']:
           vh.setncattr(a,attributes[a])
@@ -257,13 +560,232 @@ def write(fileName, variableName=None, variable=None, dimensions=None, attribute
       for a in attributes:
         rg.setncattr(a,attributes[a])
 
-  if not variable==None and not vh==None:
-    if not record==None:
+  if variable is not None and vh is not None:
+    if record is not None:
       if len(vh.shape)==1: vh[record] = variable
       else: vh[record,:] = variable
     else: vh[:] = variable
 
-  if closeWhenDone: rg.close
+  if closeWhenDone: rg.close()
+
+
+class RecordWriter:
+  """
+  Class appending records to the variables of a netCDF file that is opened once. Records are held in
+  memory and written bufferRecords at a time, each variable with one write of a hyperslab. Dimensions
+  and variables are defined, if missing, as by writeMany(). New records follow those already in the file.
+
+  Arguments:
+  fileName       name of the file, or a netCDF4.Dataset (which is not closed)
+  variables      a list of (variableName, dimensionNames) or (variableName, dimensionNames, attributes)
+  dimensions     a dictionary of dimension names and 1D dimension data, lengths, or None for unlimited
+
+  Optional arguments:
+  attributes     a dictionary of global attributes
+  bufferRecords  number of records held before writing (default 16)
+  clobber        if True will remove file before writing
+  options        dataType, fillValue, zlib, complevel, shuffle, chunksizes and leastSignificantDigit, as for
+                 writeMany()
+
+  Examples:
+  >>> with nccf.RecordWriter('out.nc', [('time',['time']), ('T',['time','y','x'])], {'time':None, 'y':y, 'x':x}) as w:
+  ...   for n in range(1000): w.append({'time':n*86400., 'T':T[n]})
+  """
+  def __init__(self, fileName, variables, dimensions=None, attributes=None, bufferRecords=16, clobber=False, **options):
+    if isinstance(fileName, nc4.Dataset): self.rg = fileName; self.closeWhenDone = False
+    else:
+      if clobber:
+        try: os.remove(fileName)
+        except: pass
+      self.rg = openNetCDFfileForWriting(fileName); self.closeWhenDone = True
+    writeMany(self.rg, [ (v[0], None) + tuple(v[1:]) for v in variables ], dimensions, attributes, **options)
+    unlimited = [ d for d in self.rg.dimensions if self.rg.dimensions[d].isunlimited() ]
+    if len(unlimited)!=1: raise Exception('RecordWriter needs exactly one unlimited dimension, found %i'%len(unlimited))
+    self.recordDimension = unlimited[0]
+    self.nRecords = len(self.rg.dimensions[self.recordDimension]) # Records in the file
+    self.bufferRecords = max(1, bufferRecords)
+    self.buffers = {} # variableName: (handle, masked array of bufferRecords records)
+    for v in variables:
+      vh = self.rg.variables[v[0]]
+      if not vh.dimensions or vh.dimensions[0]!=self.recordDimension:
+        raise Exception('Variable "%s" does not have the unlimited dimension "%s" first'%(v[0], self.recordDimension))
+      shape = (self.bufferRecords,) + vh.shape[1:]
+      self.buffers[v[0]] = (vh, numpy.ma.masked_all(shape, dtype=vh.dtype))
+    self.nBuffered = 0
+  def append(self, values):
+    """
+    Appends one record given by values, a dictionary of variable names and data (missing variables are masked)
+    """
+    for name in values:
+      if not name in self.buffers: raise Exception('"%s" is not a record variable of this RecordWriter'%name)
+      self.buffers[name][1][self.nBuffered] = values[name]
+    self.nBuffered += 1
+    if self.nBuffered==self.bufferRecords: self.flush()
+  def flush(self):
+    """
+    Writes the buffered records to the file
+    """
+    if not self.nBuffered: return
+    n0, n1 = self.nRecords, self.nRecords + self.nBuffered
+    for name in self.buffers:
+      vh, buffer = self.buffers[name]
+      vh[n0:n1] = buffer[:self.nBuffered]
+      buffer[:] = numpy.ma.masked
+    if debug: print('RecordWriter.flush: wrote records',n0,'to',n1-1)
+    self.nRecords = n1; self.nBuffered = 0
+    self.rg.sync()
+  def close(self):
+    """
+    Writes the buffered records and closes the file, if it was opened by the RecordWriter
+    """
+    if self.rg is None: return
+    try: self.flush()
+    finally:
+      if self.closeWhenDone: self.rg.close()
+      self.rg = None
+  def __enter__(self):
+    return self
+  def __exit__(self, *args):
+    self.close()
+    return False
+
+
+@profiling.timed('nccf write')
+def writeMany(fileName, variables, dimensions=None, attributes=None, dataType=None, fillValue=None, clobber=False, **options):
+  """
+  Writes several variables, and their dimensions, to a netCDF file opened once. All dimensions and
+  variables are defined before any data are written so that a netCDF3 file is put in define mode, and
+  its header written, only once.
+
+  Arguments:
+  fileName     name of the file, or a netCDF4.Dataset
+  variables    a list of (variableName, variable, dimensionNames) or
+               (variableName, variable, dimensionNames, attributes) where variable is a numpy
+               (masked) array, or None to only define the variable
+  dimensions   a dictionary of dimension names and 1D dimension data, lengths, or None for unlimited
+  attributes   a dictionary of global attributes
+
+  Optional arguments:
+  dataType     data type of the variables (default None, the type of each variable or 'f8'); dimension
+               data are written as 'f8'
+  fillValue    the fill value (default None)
+  clobber      if True will remove file before writing
+  options      zlib, complevel, shuffle, chunksizes and leastSignificantDigit, as for write()
+
+  Examples:
+  >>> nccf.writeMany('test.nc', [('T',T,['y','x']), ('S',S,['y','x'])], {'y':y, 'x':x}, zlib=True)
+  """
+
+  if isinstance(fileName, nc4.Dataset):
+    closeWhenDone = False
+    if clobber: raise Exception('clobber is incompatible with passing a root-group as an argument')
+    rg = fileName
+  else:
+    closeWhenDone = True
+    if clobber:
+      try: os.remove(fileName)
+      except: pass
+    rg = openNetCDFfileForWriting(fileName)
+
+  try:
+    # Define everything
+    if attributes is not None:
+      for a in attributes: rg.setncattr(a, attributes[a])
+    toWrite = []
+    if dimensions is not None:
+      for name in dimensions:
+        data = dimensions[name]
+        if data is None or numpy.ndim(data)==0: size = data
+        else: size = len(data)
+        if name in rg.dimensions:
+          if not rg.dimensions[name].isunlimited() and size is not None and len(rg.dimensions[name])!=size:
+            raise Exception('Dimension "%s" has size %i in file and differs from provided size %i'
+                   %(name, len(rg.dimensions[name]), size))
+        else: rg.createDimension(name, size)
+        if data is not None and numpy.ndim(data)>0 and not name in rg.variables:
+          toWrite.append( (rg.createVariable(name, 'f8', (name,)), data) )
+    for v in variables:
+      variableName, variable, variableDimensions = v[:3]
+      variableAttributes = v[3] if len(v)>3 else None
+      for d in variableDimensions:
+        if not d in rg.dimensions: raise Exception('Dimension "%s" of "%s" is not defined'%(d, variableName))
+      if variableName in rg.variables: vh = rg.variables[variableName]
+      else:
+        varType = dataType
+        if varType is None: varType = variable.dtype if variable is not None and variable.dtype.kind in 'iuf' else 'f8'
+        vh = createVariable(rg, variableName, varType, variableDimensions, fillValue=fillValue, **options)
+      if variableAttributes is not None:
+        for a in variableAttributes:
+          if not a in ['_FillValue']: vh.setncattr(a, variableAttributes[a])
+      if variable is not None: toWrite.append( (vh, variable) )
+
+    # Then write the data
+    for vh, data in toWrite: vh[:] = data
+  finally:
+    if closeWhenDone: rg.close()
+
+
+def rechunk(fileName, variableNames, outFileName=None, chunkBytes=2**22, memoryBytes=2**28, complevel=4):
+  """
+  Writes a copy of variables in fileName that is chunked so that reading a time series (along the first
+  dimension) of a point, or a (time, y) section, touches few chunks. By default the copy is written to the
+  sidecar FILE.tchunk.nc (see sidecarFileName()), where gplot.py looks for it.
+
+  Each chunk holds all records (up to chunkBytes) of one level of a square tile of the last two
+  dimensions, compressed with zlib at complevel. The values are copied as stored (packed and with fill
+  values) a band of the last-but-one dimension at a time so that no more than about memoryBytes are
+  held in memory. Coordinate variables of the dimensions are copied too.
+  """
+
+  if outFileName is None: outFileName = sidecarFileName(fileName, 'tchunk')
+  rg = openNetCDFfileForReading(fileName)
+  out = nc4.Dataset(outFileName, 'w', format='NETCDF4')
+  out.setncattr('tchunk_source', os.path.basename(fileName))
+
+  def copyVariable(vh, chunksizes):
+    for d in vh.dimensions:
+      if not d in out.dimensions:
+        out.createDimension(d, None if rg.dimensions[d].isunlimited() else len(rg.dimensions[d]))
+    attributes = vh.ncattrs()
+    fillValue = vh.getncattr('_FillValue') if '_FillValue' in attributes else None
+    oh = createVariable(out, vh.name, vh.dtype, vh.dimensions, fillValue=fillValue, zlib=complevel>0,
+                        complevel=complevel, chunksizes=chunksizes)
+    for a in attributes:
+      if not a=='_FillValue': oh.setncattr(a, vh.getncattr(a))
+    vh.set_auto_maskandscale(False); oh.set_auto_maskandscale(False) # Copy the values as stored
+    return oh
+
+  for variableName in variableNames:
+    if not variableName in rg.variables:
+      raise Exception('Did not find "'+variableName+'" in file "'+fileName+'".')
+    vh = rg.variables[variableName]
+    if vh.ndim<2: raise Exception('Variable "'+variableName+'" has fewer than two dimensions.')
+    for d in vh.dimensions:
+      if d in rg.variables and not d in out.variables and rg.variables[d].ndim==1:
+        ch = copyVariable(rg.variables[d], None)
+        ch[:] = rg.variables[d][:]
+
+    # Chunks of all records of a tile of the last (one or) two dimensions
+    shape = vh.shape; itemSize = numpy.dtype(vh.dtype).itemsize
+    nt = max(shape[0], 1)
+    chunksizes = chunkSizes(shape, itemSize, access='timeseries', chunkBytes=chunkBytes)
+    if debug: print('rechunk:',variableName,shape,'in chunks of',chunksizes)
+    oh = copyVariable(vh, chunksizes)
+    if not shape[0]: continue
+
+    # Stream bands of whole chunks, over all records, of the last-but-one dimension
+    bandDim = 1 if vh.ndim==2 else vh.ndim-2
+    rowBytes = nt * itemSize * ( shape[-1] if vh.ndim>2 else 1 )
+    rows = max(1, memoryBytes//rowBytes//chunksizes[bandDim]) * chunksizes[bandDim]
+    for k in numpy.ndindex(*shape[1:bandDim]):
+      for j in range(0, shape[bandDim], rows):
+        key = (slice(None),) + k + (slice(j, min(j+rows, shape[bandDim])),)
+        oh[key] = vh[key]
+    if debug: print('rechunk: wrote',variableName)
+
+  out.close()
+  rg.close()
+  return outFileName
 
 
 def testNCCF():
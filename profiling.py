@@ -0,0 +1,161 @@
+"""
+Named timers and counters for finding out which phase of reading, computing or drawing is slow.
+
+Nothing is recorded unless enable() has been called: timer() then returns a shared context that does
+nothing, and count() returns immediately, so the instrumentation can stay in place.
+"""
+
+import json
+import atexit
+import timeit
+import threading
+
+enabled = False
+_timers = {} # name: [calls, inclusive seconds, seconds in nested timers]
+_counters = {} # name: total
+_local = threading.local() # Stack of running timers, per thread
+_profiler = None
+_outputFile = None
+_startTime = None
+
+
+class _NullTimer:
+  """
+  Context that does nothing, returned by timer() when timing is not enabled
+  """
+  def __enter__(self): return self
+  def __exit__(self, *args): return False
+_nullTimer = _NullTimer()
+
+
+class _Timer:
+  """
+  Context that adds its elapsed time to the named timer, and to the nested time of the enclosing timer
+  """
+  def __init__(self, name):
+    self.name = name
+  def __enter__(self):
+    stack = getattr(_local, 'stack', None)
+    if stack is None: stack = _local.stack = []
+    stack.append(self)
+    self.start = timeit.default_timer()
+    return self
+  def __exit__(self, *args):
+    elapsed = timeit.default_timer() - self.start
+    stack = _local.stack
+    stack.pop()
+    t = _timers.setdefault(self.name, [0, 0., 0.])
+    t[0] += 1; t[1] += elapsed
+    if stack: # Time that the enclosing timer did not spend itself
+      parent = _timers.setdefault(stack[-1].name, [0, 0., 0.])
+      parent[2] += elapsed
+    return False
+
+
+def timer(name):
+  """
+  Returns a context manager that times the enclosed block under name, e.g.
+    with profiling.timer('savefig'): plt.savefig(fileName)
+  """
+  if not enabled: return _nullTimer
+  return _Timer(name)
+
+
+def timed(name):
+  """
+  Returns a decorator that times each call of a function under name
+  """
+  def decorator(function):
+    def wrapper(*args, **kwargs):
+      if not enabled: return function(*args, **kwargs)
+      with _Timer(name): return function(*args, **kwargs)
+    wrapper.__name__ = function.__name__; wrapper.__doc__ = function.__doc__
+    return wrapper
+  return decorator
+
+
+def count(name, n=1):
+  """
+  Adds n to the named counter (e.g. bytes read)
+  """
+  if not enabled: return
+  _counters[name] = _counters.get(name, 0) + n
+
+
+def enable(outputFile=None):
+  """
+  Starts recording timers and counters. The breakdown is printed when the process exits and, if
+  outputFile is given, also written to it as JSON (if the name ends in .json) or, otherwise, as the
+  cProfile statistics of the whole run (for use with the pstats module or snakeviz).
+  """
+  global enabled, _profiler, _outputFile, _startTime
+  if enabled: return
+  enabled = True
+  _outputFile = outputFile
+  _startTime = timeit.default_timer()
+  if outputFile and not outputFile.lower().endswith('.json'):
+    import cProfile
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+  atexit.register(finish)
+
+
+def results():
+  """
+  Returns a dictionary of the wall time since enable(), the timers and the counters
+  """
+  timers = {}
+  for name, (calls, total, nested) in _timers.items():
+    timers[name] = {'calls': calls, 'seconds': total, 'selfSeconds': total - nested}
+  return {'wallSeconds': timeit.default_timer() - _startTime, 'timers': timers, 'counters': dict(_counters)}
+
+
+def report():
+  """
+  Returns a table of the timers, in order of decreasing time, and the counters
+  """
+  r = results()
+  wall = r['wallSeconds']
+  lines = ['%-24s %7s %10s %10s %7s'%('Phase', 'Calls', 'Total (s)', 'Self (s)', '% wall')]
+  for name in sorted(r['timers'], key=lambda n: -r['timers'][n]['seconds']):
+    t = r['timers'][name]
+    lines.append('%-24s %7i %10.4f %10.4f %6.1f%%'%(name, t['calls'], t['seconds'], t['selfSeconds'],
+                                                   100. * t['selfSeconds'] / wall if wall>0 else 0.))
+  lines.append('%-24s %7s %10.4f'%('Wall time', '', wall))
+  for name in sorted(r['counters']):
+    lines.append('%-24s %18s'%(name, r['counters'][name]))
+  return '\n'.join(lines)
+
+
+def finish():
+  """
+  Stops recording, prints the breakdown and writes the output file, if any
+  """
+  global enabled, _profiler
+  if not enabled: return
+  if _profiler is not None: _profiler.disable()
+  print(report())
+  if _outputFile:
+    if _profiler is not None: _profiler.dump_stats(_outputFile)
+    else:
+      with open(_outputFile, 'w') as f: json.dump(results(), f, indent=1, sort_keys=True)
+    print('Wrote profile to',_outputFile)
+  enabled = False; _profiler = None
+
+
+# Tests
+if __name__ == '__main__':
+
+  import time
+  with timer('off'): pass
+  print('Nothing recorded when disabled?', _timers=={})
+  enable()
+  for n in range(3):
+    with timer('outer'):
+      time.sleep(0.01)
+      with timer('inner'): time.sleep(0.02)
+  count('bytes', 100); count('bytes', 20)
+  r = results()['timers']
+  print('outer self time excludes inner?', abs(r['outer']['selfSeconds'] - 0.03) < 0.01, 'calls=', r['inner']['calls'])
+  print(report())
+  enabled = False
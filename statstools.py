@@ -0,0 +1,193 @@
+"""
+Functions and classes for accumulating statistics of (masked and optionally area-weighted) data
+in a single pass, one block of data at a time.
+"""
+
+import os
+import csv
+import json
+import numpy as np
+
+
+class StreamingStats:
+  """
+  Class for accumulating the count, weighted mean and RMS, extremes and approximate percentiles of
+  data added one block at a time. Masked and non-finite values are ignored.
+
+  Percentiles are estimated from a weighted histogram whose range is doubled, merging pairs of bins,
+  whenever new data fall outside of it, so that the resolution is always about 1/nBins of the range
+  of the data.
+  """
+  def __init__(self, nBins=1024, percentiles=(1, 5, 50, 95, 99)):
+    if nBins%2: raise Exception('The number of bins must be even')
+    self.nBins = nBins
+    self.percentiles = percentiles
+    self.count = 0 # Number of valid values
+    self.weight = 0. # Sum of weights of valid values
+    self.sum = 0. # Weighted sum
+    self.sumSquares = 0. # Weighted sum of squares
+    self.min = None; self.max = None
+    self.minNonZero = None; self.maxNonZero = None
+    self.histogram = None # Weights in bins of width self.binWidth starting at self.origin
+    self.origin = None; self.binWidth = None
+  def add(self, data, weights=None):
+    """
+    Accumulates the valid values of data, weighted by weights (e.g. cell area) which must be
+    broadcastable to the shape of data.
+    """
+    data = np.ma.masked_invalid(data)
+    valid = ~np.ma.getmaskarray(data)
+    values = np.ma.getdata(data)[valid].astype(np.float64)
+    if len(values)==0: return
+    if weights is None: w = np.ones(values.shape)
+    else: w = np.broadcast_to(np.ma.filled(weights, 0.), data.shape)[valid].astype(np.float64)
+    self.count += len(values)
+    self.weight += np.sum(w)
+    self.sum += np.dot(w, values)
+    self.sumSquares += np.dot(w, values*values)
+    vMin, vMax = values.min(), values.max()
+    self.min = vMin if self.min is None else min(self.min, vMin)
+    self.max = vMax if self.max is None else max(self.max, vMax)
+    nonZero = values[values!=0]
+    if len(nonZero):
+      vMin, vMax = nonZero.min(), nonZero.max()
+      self.minNonZero = vMin if self.minNonZero is None else min(self.minNonZero, vMin)
+      self.maxNonZero = vMax if self.maxNonZero is None else max(self.maxNonZero, vMax)
+    self.addToHistogram(values, w)
+  def addToHistogram(self, values, w):
+    """
+    Adds values with weights w to the histogram, first widening its range if necessary
+    """
+    if self.histogram is None:
+      self.origin = self.min
+      self.binWidth = ( self.max - self.min ) / self.nBins
+      if self.binWidth<=0: self.binWidth = max(abs(self.min), 1.) * 1.e-6
+      self.histogram = np.zeros(self.nBins)
+    while self.min < self.origin or self.max >= self.origin + self.nBins * self.binWidth:
+      merged = self.histogram[0::2] + self.histogram[1::2]
+      self.histogram[:] = 0.
+      if self.min < self.origin: # Widen downward
+        self.origin = self.origin - self.nBins * self.binWidth
+        self.histogram[self.nBins//2:] = merged
+      else: # Widen upward
+        self.histogram[:self.nBins//2] = merged
+      self.binWidth = 2. * self.binWidth
+    k = np.minimum( ( (values - self.origin) / self.binWidth ).astype(int), self.nBins-1 )
+    self.histogram += np.bincount(k, weights=w, minlength=self.nBins)
+  def percentile(self, p):
+    """
+    Returns the approximate (weighted) p-th percentile of the data added so far
+    """
+    if self.histogram is None or self.weight<=0: return None
+    cumulative = np.cumsum(self.histogram)
+    target = 0.01 * p * cumulative[-1]
+    k = min( np.searchsorted(cumulative, target), self.nBins-1 )
+    below = cumulative[k-1] if k>0 else 0.
+    fraction = ( target - below ) / self.histogram[k] if self.histogram[k]>0 else 0.
+    value = self.origin + ( k + fraction ) * self.binWidth
+    return min( max(value, self.min), self.max )
+  def result(self):
+    """
+    Returns a dictionary of the statistics
+    """
+    r = {'count': self.count, 'min': self.min, 'max': self.max,
+         'minNonZero': self.minNonZero, 'maxNonZero': self.maxNonZero}
+    if self.weight>0:
+      r['mean'] = self.sum / self.weight
+      r['rms'] = np.sqrt( self.sumSquares / self.weight )
+    else: r['mean'] = None; r['rms'] = None
+    for p in self.percentiles: r['p%g'%p] = self.percentile(p)
+    for key in r: # Plain python types for csv and json
+      if isinstance(r[key], np.generic): r[key] = r[key].item()
+    return r
+
+
+def recordStats(data, weights=None):
+  """
+  Returns a dictionary of the count, weighted mean and RMS, minimum and maximum of the valid values of
+  each record, data[n,...], of a block of records. Each statistic is an array over records, masked for
+  records without valid data. weights (e.g. cell area) must be broadcastable to the shape of a record.
+  """
+  data = np.ma.masked_invalid(data)
+  valid = ~np.ma.getmaskarray(data)
+  values = np.where(valid, np.ma.getdata(data), 0.).astype(np.float64)
+  if weights is None: w = valid.astype(np.float64)
+  else: w = np.where(valid, np.broadcast_to(np.ma.filled(weights, 0.), data.shape[1:]), 0.)
+  axes = tuple(range(1, data.ndim))
+  count = np.sum(valid, axis=axes)
+  sumW = np.sum(w, axis=axes)
+  none = sumW<=0
+  sumW = np.where(none, 1., sumW)
+  r = {'count': count,
+       'mean': np.ma.masked_array( np.sum(w*values, axis=axes) / sumW, mask=none ),
+       'rms': np.ma.masked_array( np.sqrt( np.sum(w*values*values, axis=axes) / sumW ), mask=none ),
+       'min': np.ma.min(data, axis=axes), 'max': np.ma.max(data, axis=axes)}
+  return r
+
+
+def summary(stats):
+  """
+  Returns lines of text summarizing a StreamingStats object, the first line noting the extremes
+  ignoring zeros if the data are otherwise bounded by zero
+  """
+  dMin = stats.min; dMax = stats.max
+  if dMin is None: return 'No valid data'
+  if dMin==0 and dMax>0:
+    text = 'Mininum= %s (ignoring zeros) Maximum= %s'%(stats.minNonZero, dMax)
+  elif dMax==0 and dMin<0:
+    text = 'Mininum= %s Maximum= %s (ignoring zeros)'%(dMin, stats.maxNonZero)
+  else: text = 'Mininum= %s Maximum= %s'%(dMin, dMax)
+  r = stats.result()
+  def number(x): return 'n/a' if x is None else '%g'%x # None if the total weight is zero
+  text = text + '\nMean= %s RMS= %s Count= %i'%(number(r['mean']), number(r['rms']), r['count'])
+  text = text + ' Percentiles: ' + ' '.join( '%g%%= %s'%(p, number(r['p%g'%p])) for p in stats.percentiles )
+  return text
+
+
+_startedFiles = set() # Files written to by this process, which are otherwise overwritten
+
+
+def writeRecord(fileName, record):
+  """
+  Writes the dictionary record as a line of CSV (if fileName ends in .csv) or JSON to fileName.
+  The first record written by a process replaces any existing file and, for CSV, sets the columns.
+  """
+  isNew = not fileName in _startedFiles
+  _startedFiles.add(fileName)
+  with open(fileName, 'w' if isNew else 'a') as f:
+    if os.path.splitext(fileName)[1].lower()=='.csv':
+      writer = csv.DictWriter(f, fieldnames=list(record.keys()), extrasaction='ignore')
+      if isNew: writer.writeheader()
+      writer.writerow(record)
+    else: f.write(json.dumps(record) + '\n')
+
+
+# Tests
+if __name__ == '__main__':
+
+  q = np.ma.masked_array(np.arange(12.).reshape(3,4), mask=np.arange(12).reshape(3,4)%5==0)
+  print('q=',q)
+  s = StreamingStats()
+  s.add(q)
+  print(summary(s))
+  print('Equals numpy?', np.isclose(s.result()['mean'], q.mean()), np.isclose(s.result()['p50'], np.ma.median(q), atol=0.02))
+
+  # Adding in blocks, with ranges that force the histogram to widen, matches adding all at once
+  data = np.random.randn(100000)
+  s1 = StreamingStats(); s1.add(data)
+  s2 = StreamingStats()
+  for block in np.split(np.sort(data)[::-1], 10): s2.add(block)
+  s3 = StreamingStats()
+  for block in np.split(np.sort(data), 10): s3.add(block)
+  for p in (5, 50, 95):
+    print('p%g'%p, np.percentile(data, p), s1.percentile(p), s2.percentile(p), s3.percentile(p))
+
+  r = recordStats(np.ma.stack([q, 2*q]))
+  print('recordStats mean=', r['mean'], 'expected', [q.mean(), 2*q.mean()], 'count=', r['count'])
+
+  area = np.array([1., 2., 3., 2.])
+  s = StreamingStats(); s.add(q, weights=area)
+  print('Area weighted mean=', s.result()['mean'], 'expected', np.ma.sum(q*area)/np.ma.sum(0*q+area))
+
+  s = StreamingStats(); s.add(np.ones((3,3)), weights=np.zeros((3,3)))
+  print('Zero total weight:', summary(s).split('\n')[1])